@@ -0,0 +1,265 @@
+# async_ingest.py
+# asyncio variant of the v6 ingest: SFTP -> control_master -> transform -> Blob, for many small files at once.
+# 🎯 Key features:
+# - Blob uploads and the inventory listing use azure.storage.blob.aio, so hundreds of uploads share one event loop
+# - Blocking work runs in bounded executors: SFTP reads, pyodbc calls and the CSV transform each have their own pool
+# - Semaphores cap files in flight per client and concurrent requests per container
+# - control_master registration is batched across files like the threaded pipeline: a batch goes out when it is full,
+#   when no other file in flight is still on its way to registration, or after the linger, whichever comes first
+# - Files above ASYNC_STREAM_THRESHOLD_BYTES go through the bounded-memory streaming path instead of being held whole;
+#   like STREAM_TRANSFER in v6, that path has no run journal, no hash-index dedup before upload and no fused gold load
+#
+# Usage: python async_ingest.py   (same .env as v6)
+
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+from azure.core.exceptions import ResourceExistsError
+import v6_insertcontrolno_into_controlmaster_sqltable as v6
+from blob_inventory import BlobInventory
+from hash_index import HashIndex
+from sftp_manifest import get_manifest
+from sftp_sessions import get_session, close_all_sessions
+from sql_pool import get_pool, SQL_POOL_SIZE
+from cpu_pool import close_cpu_pool, CPU_POOL_WORKERS
+from blob_compression import encode_upload
+from pipeline_metrics import span, bind_client, start_run, get_metrics
+
+# Async engine config
+ASYNC_FILES_PER_CLIENT = int(os.getenv("ASYNC_FILES_PER_CLIENT", 32))                # files in flight per client
+ASYNC_REQUESTS_PER_CONTAINER = int(os.getenv("ASYNC_REQUESTS_PER_CONTAINER", 64))    # concurrent blob requests per container
+ASYNC_SFTP_THREADS = int(os.getenv("ASYNC_SFTP_THREADS", 16))
+ASYNC_STREAM_THRESHOLD_BYTES = int(os.getenv("ASYNC_STREAM_THRESHOLD_BYTES", 64 * 1024 * 1024))
+
+
+# Collects jobs for one control_master round trip; each caller awaits its own job's result.
+# Files announce themselves with expect() when they start and leave with register() or withdraw(), so a batch
+# that nothing else is coming for is sent at once instead of lingering
+class _RegisterBatcher:
+    def __init__(self, engine, batch_size=v6.REGISTER_BATCH_SIZE, linger=v6.REGISTER_BATCH_LINGER_SECONDS):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.linger = linger
+        self._pending = []
+        self._expected = 0
+        self._timer = None
+        self._flushes = set()
+
+    def expect(self):
+        self._expected += 1
+
+    # A file that will not register after all (skipped as a duplicate, or failed before registration)
+    def withdraw(self):
+        self._expected -= 1
+        if self._pending and not self._expected:
+            self._flush()
+
+    async def register(self, job):
+        self._expected -= 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((job, future))
+        if len(self._pending) >= self.batch_size or not self._expected:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _send(self, batch):
+        try:
+            results = await self.engine.run_sql(v6.register_jobs, [job for job, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # A job that got no ControlNo comes back as its error; only that file fails
+        for (job, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(job)
+
+
+class AsyncIngest:
+    def __init__(self, service_client, hash_index=None):
+        self.hash_index = hash_index
+        self.containers = {
+            "raw": service_client.get_container_client(v6.RAW_CONTAINER),
+            "transformed": service_client.get_container_client(v6.TRANSFORMED_CONTAINER),
+        }
+        self.container_slots = {name: asyncio.Semaphore(ASYNC_REQUESTS_PER_CONTAINER) for name in self.containers}
+        self.sftp_executor = ThreadPoolExecutor(max_workers=ASYNC_SFTP_THREADS, thread_name_prefix="async-sftp")
+        self.sql_executor = ThreadPoolExecutor(max_workers=SQL_POOL_SIZE, thread_name_prefix="async-sql")
+        # With CPU_POOL_WORKERS set these threads only hand files to the process pool, so match its size
+        self.cpu_executor = ThreadPoolExecutor(max_workers=max(v6.TRANSFORM_WORKERS, CPU_POOL_WORKERS), thread_name_prefix="async-cpu")
+        self.registrar = _RegisterBatcher(self)
+
+    # Runs a blocking call in one of the executors, with the client bound for that thread's metrics
+    async def _in_executor(self, executor, client_name, fn, *args):
+        call = v6._for_client(client_name, fn) if client_name else fn
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(call, *args))
+
+    def run_sftp(self, client_name, fn, *args):
+        return self._in_executor(self.sftp_executor, client_name, fn, *args)
+
+    def run_sql(self, fn, *args):
+        return self._in_executor(self.sql_executor, None, fn, *args)
+
+    def run_cpu(self, client_name, fn, *args):
+        return self._in_executor(self.cpu_executor, client_name, fn, *args)
+
+    async def load_inventory(self, client_name):
+        container = self.containers["raw"]
+        inventory = BlobInventory(container, prefix=f"{client_name.lower()}_")
+        if inventory.has_fresh_snapshot():
+            return inventory
+        with span("list", client=client_name.lower(), source="blob") as s:
+            listing = [blob async for blob in container.list_blobs(name_starts_with=inventory.prefix)]
+            s.rows = len(listing)
+        return inventory.apply_listing(listing)
+
+    # Conditional (and, with BLOB_COMPRESSION, compressed) write of a spool, like v6.upload_to_blob;
+    # returns False for a blob that already exists
+    async def upload(self, container_name, blob_name, spool, client_name, inventory=None):
+        payload, settings = encode_upload(spool.reader(), blob_name)
+        async with self.container_slots[container_name]:
+            with span("upload", client=client_name.lower(), container=container_name) as s:
+                try:
+                    await self.containers[container_name].get_blob_client(blob_name).upload_blob(
+                        payload, length=spool.nbytes if settings is None else None, overwrite=False, content_settings=settings)
+                except ResourceExistsError:
+                    print(f"⚠️ Skipped duplicate blob: {blob_name}")
+                    return False
+                s.bytes = spool.nbytes
+                if settings is not None:
+                    s.fields["stored_bytes"] = payload.bytes_read
+        if inventory is not None:
+            inventory.add(blob_name)
+        print(f"✅ Uploaded {container_name}: {blob_name}")
+        return True
+
+    async def process_file(self, session, client_name, attr, inventory):
+        if attr.st_size > ASYNC_STREAM_THRESHOLD_BYTES:
+            await self.run_sftp(client_name, v6.process_file_streaming, session, client_name, attr.filename,
+                                inventory, self.hash_index)
+            return
+
+        # Once downloaded, the job holds spools (mmapped temp files once large); every exit releases them
+        self.registrar.expect()
+        registering = False
+        job = None
+        try:
+            job = await self.run_sftp(client_name, v6.download_file, session, client_name, attr.filename, attr)
+            if await self.run_cpu(client_name, v6.hash_file, job, self.hash_index) is None:
+                return
+            registering = True
+            await self.registrar.register(job)   # assigns the ControlNo the transform injects
+            await self.run_cpu(client_name, v6.transform_file, job)
+
+            # Raw goes last: its presence is what marks the file as processed
+            transformed_name, raw_name = v6.blob_names(job)
+            await self.upload("transformed", transformed_name, job["output_buffer"], client_name)
+            await self.upload("raw", raw_name, job["file_data"], client_name, inventory)
+        finally:
+            if not registering:
+                self.registrar.withdraw()
+            if job is not None:
+                v6.release_job(job)
+
+    async def handle_client(self, client_name):
+        print(f"\n🔄 Connecting to {client_name}...")
+        session = get_session(os.getenv("SFTP_HOST"), int(os.getenv("SFTP_PORT")), v6.CLIENTS[client_name]['user'], v6.CLIENTS[client_name]['pass'])
+        manifest = get_manifest(client_name)
+
+        with span("list", client=client_name.lower(), source="sftp") as s:
+            attrs = await self.run_sftp(client_name, session.listdir_attr, "/upload")
+            s.rows = len(attrs)
+        ready, deferred = manifest.diff(attrs)
+        for attr in deferred:
+            print(f"⏳ Deferred {attr.filename}: still being written ({attr.st_size} bytes so far)")
+        if not ready:
+            print(f"💤 No new or modified files for {client_name}")
+            manifest.save()
+            return
+
+        inventory = await self.load_inventory(client_name)
+        try:
+            with bind_client(client_name):
+                pending = v6.select_pending(client_name, ready, inventory, manifest, self.hash_index)
+
+            slots = asyncio.Semaphore(ASYNC_FILES_PER_CLIENT)
+
+            async def bounded(attr):
+                async with slots:
+                    await self.process_file(session, client_name, attr, inventory)
+
+            results = await asyncio.gather(*(bounded(attr) for attr in pending), return_exceptions=True)
+            failed = 0
+            for attr, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    failed += 1
+                    print(f"❌ {client_name} failed for {attr.filename}: {result}")
+                else:
+                    manifest.mark_done(attr)
+                    v6.forget_file(client_name, attr.filename)
+            if failed:
+                raise RuntimeError(f"{failed} of {len(pending)} files failed")
+        finally:
+            inventory.save()
+            manifest.save()
+
+    def close(self):
+        for executor in (self.sftp_executor, self.sql_executor, self.cpu_executor):
+            executor.shutdown(wait=True)
+
+
+async def run(client_names):
+    start_run("async")
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, v6.wake_up_sql)
+    hash_index = await loop.run_in_executor(None, lambda: HashIndex().load().preload_from_sql(get_pool()))
+
+    account_url = f"https://{v6.AZURE_STORAGE_ACCOUNT}.blob.core.windows.net"
+    async with AsyncBlobServiceClient(account_url=account_url, credential=v6.AZURE_STORAGE_KEY) as service_client:
+        engine = AsyncIngest(service_client, hash_index)
+        try:
+            results = await asyncio.gather(*(engine.handle_client(c) for c in client_names), return_exceptions=True)
+        finally:
+            engine.close()
+
+    failed = [c for c, result in zip(client_names, results) if isinstance(result, Exception)]
+    for client_name, result in zip(client_names, results):
+        if isinstance(result, Exception):
+            print(f"❌ {client_name} failed: {result}")
+    hash_index.save()
+    return failed
+
+
+def main():
+    failed = asyncio.run(run(list(v6.CLIENTS)))
+    if failed:
+        print(f"\n⚠️ Finished with failed clients: {', '.join(failed)}")
+    else:
+        print("\n✅ All client files processed.")
+    close_cpu_pool()
+    get_pool().close_all()
+    close_all_sessions()
+    get_metrics().finish()
+
+
+if __name__ == "__main__":
+    main()
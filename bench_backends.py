@@ -0,0 +1,493 @@
+# bench_backends.py
+# Local stand-ins for DigitalOcean SFTP, Azure Blob Storage and Azure SQL, used by bench_pipeline.py.
+# 🎯 Key features:
+# - LocalSFTP serves a directory through the subset of paramiko's SFTPClient the pipeline uses (getfo, open/readv, listdir)
+# - LocalContainerClient keeps blobs as files and mimics upload_blob / stage_block / commit_block_list / list_blobs,
+#   including the conditional-write ResourceExistsError
+# - sqlite_connect returns a pyodbc-shaped connection that rewrites the T-SQL the pipeline sends into SQLite
+# - Synthetic USPS/UPS invoice generators matching the raw eBill layouts in carrier_schemas
+
+import os
+import re
+import io
+import json
+import random
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from carrier_schemas import usps_cols, ups_cols, column_kind
+
+
+# ---------- SFTP ----------
+
+class LocalSFTPFile:
+    def __init__(self, path, mode):
+        self._file = open(path, mode)
+        self._path = path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def readv(self, chunks):
+        for offset, length in chunks:
+            self._file.seek(offset)
+            yield self._file.read(length)
+
+    def prefetch(self, file_size=None):
+        pass
+
+    def stat(self):
+        return os.stat(self._path)
+
+    def close(self):
+        self._file.close()
+
+
+# Remote paths like "/upload/x.csv" resolve under root
+class LocalSFTP:
+    def __init__(self, root):
+        self.root = root
+
+    def _local(self, remote_path):
+        return os.path.join(self.root, remote_path.lstrip("/"))
+
+    def listdir(self, path="."):
+        return sorted(os.listdir(self._local(path)))
+
+    def listdir_attr(self, path="."):
+        attrs = []
+        for name in self.listdir(path):
+            st = os.stat(os.path.join(self._local(path), name))
+            attrs.append(SimpleNamespace(filename=name, st_size=st.st_size, st_mtime=int(st.st_mtime), st_mode=st.st_mode))
+        return attrs
+
+    def stat(self, remote_path):
+        return os.stat(self._local(remote_path))
+
+    def open(self, remote_path, mode="r", bufsize=-1):
+        return LocalSFTPFile(self._local(remote_path), mode if "b" in mode else mode + "b")
+
+    def getfo(self, remote_path, fl, callback=None):
+        with open(self._local(remote_path), "rb") as f:
+            size = 0
+            while True:
+                data = f.read(32768)
+                if not data:
+                    return size
+                fl.write(data)
+                size += len(data)
+
+    def close(self):
+        pass
+
+
+# ---------- Blob ----------
+
+class LocalDownloader:
+    def __init__(self, data, properties):
+        self._data = data
+        self.size = len(data)
+        self.properties = properties
+
+    def readall(self):
+        return self._data
+
+    def readinto(self, stream):
+        stream.write(self._data)
+        return self.size
+
+    def chunks(self):
+        for start in range(0, self.size, 4 * 1024 * 1024):
+            yield self._data[start:start + 4 * 1024 * 1024]
+
+
+class LocalBlobClient:
+    def __init__(self, container, blob_name):
+        self.container = container
+        self.blob_name = blob_name
+        self.container_name = container.container_name
+        self.url = f"file://{container.path(blob_name)}"
+
+    def exists(self):
+        return os.path.exists(self.container.path(self.blob_name))
+
+    def upload_blob(self, data, overwrite=False, metadata=None, content_settings=None, **kwargs):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            payload = bytes(data)
+        elif isinstance(data, str):
+            payload = data.encode("utf-8")
+        elif hasattr(data, "read"):
+            payload = data.read()
+        else:
+            payload = b"".join(data)
+        exclusive = not overwrite or kwargs.get("match_condition") is not None
+        self.container.write(self.blob_name, payload, exclusive, metadata, content_settings)
+        return {"etag": self.blob_name}
+
+    def stage_block(self, block_id, data, length=None, **kwargs):
+        self.container.stage(self.blob_name, block_id, bytes(data))
+
+    def commit_block_list(self, block_list, metadata=None, content_settings=None, **kwargs):
+        blocks = self.container.take_staged(self.blob_name)
+        ids = [block.id if hasattr(block, "id") else block for block in block_list]
+        payload = b"".join(blocks[block_id] for block_id in ids)
+        exclusive = kwargs.get("match_condition") is not None or kwargs.get("etag") == "*"
+        self.container.write(self.blob_name, payload, exclusive, metadata, content_settings)
+        return {"etag": self.blob_name}
+
+    def download_blob(self, offset=None, length=None, **kwargs):
+        path = self.container.path(self.blob_name)
+        if not os.path.exists(path):
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.blob_name}")
+        with open(path, "rb") as f:
+            f.seek(offset or 0)
+            data = f.read(-1 if length is None else length)
+        return LocalDownloader(data, self.get_blob_properties())
+
+    def get_blob_properties(self, **kwargs):
+        path = self.container.path(self.blob_name)
+        if not os.path.exists(path):
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.blob_name}")
+        return self.container.properties(self.blob_name)
+
+    def set_blob_metadata(self, metadata=None, **kwargs):
+        self.container.set_metadata(self.blob_name, metadata or {})
+
+    def delete_blob(self, **kwargs):
+        self.container.delete(self.blob_name)
+
+
+class LocalItemPaged:
+    def __init__(self, items, page_size=5000):
+        self._items = items
+        self._page_size = page_size
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def by_page(self):
+        for start in range(0, len(self._items), self._page_size):
+            yield iter(self._items[start:start + self._page_size])
+
+
+# Blobs are files under root/<container>; metadata and content settings sit in a JSON sidecar
+class LocalContainerClient:
+    def __init__(self, root, container_name):
+        self.container_name = container_name
+        self.root = os.path.join(root, container_name)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._staged = {}
+
+    def path(self, blob_name):
+        return os.path.join(self.root, blob_name)
+
+    def _sidecar(self, blob_name):
+        return os.path.join(self.root, ".props", blob_name + ".json")
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(self, getattr(blob, "name", blob))
+
+    def write(self, blob_name, payload, exclusive, metadata=None, content_settings=None):
+        path = self.path(blob_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            if exclusive and os.path.exists(path):
+                raise ResourceExistsError(f"The specified blob already exists: {blob_name}")
+            with open(path, "wb") as f:
+                f.write(payload)
+            sidecar = self._sidecar(blob_name)
+            os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+            with open(sidecar, "w") as f:
+                json.dump({
+                    "metadata": metadata or {},
+                    "content_encoding": getattr(content_settings, "content_encoding", None),
+                    "content_type": getattr(content_settings, "content_type", None),
+                }, f)
+
+    def stage(self, blob_name, block_id, data):
+        with self._lock:
+            self._staged.setdefault(blob_name, {})[block_id] = data
+
+    def take_staged(self, blob_name):
+        with self._lock:
+            return self._staged.pop(blob_name, {})
+
+    def properties(self, blob_name):
+        st = os.stat(self.path(blob_name))
+        sidecar = {"metadata": {}, "content_encoding": None, "content_type": None}
+        if os.path.exists(self._sidecar(blob_name)):
+            with open(self._sidecar(blob_name)) as f:
+                sidecar = json.load(f)
+        return SimpleNamespace(
+            name=blob_name,
+            size=st.st_size,
+            last_modified=datetime.fromtimestamp(st.st_mtime, timezone.utc),
+            metadata=sidecar["metadata"],
+            content_settings=SimpleNamespace(content_encoding=sidecar["content_encoding"], content_type=sidecar["content_type"]),
+        )
+
+    def set_metadata(self, blob_name, metadata):
+        props = self.properties(blob_name)
+        with self._lock:
+            with open(self._sidecar(blob_name), "w") as f:
+                json.dump({
+                    "metadata": metadata,
+                    "content_encoding": props.content_settings.content_encoding,
+                    "content_type": props.content_settings.content_type,
+                }, f)
+
+    def delete(self, blob_name):
+        with self._lock:
+            for path in (self.path(blob_name), self._sidecar(blob_name)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def list_blobs(self, name_starts_with=None, include=None, **kwargs):
+        names = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d != ".props"]
+            for filename in filenames:
+                names.append(os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/"))
+        names = sorted(name for name in names if not name_starts_with or name.startswith(name_starts_with))
+        return LocalItemPaged([self.properties(name) for name in names])
+
+    def delete_blobs(self, *blobs, **kwargs):
+        responses = []
+        for blob in blobs:
+            name = getattr(blob, "name", blob)
+            status = 202 if os.path.exists(self.path(name)) else 404
+            self.delete(name)
+            responses.append(SimpleNamespace(status_code=status))
+        return responses
+
+
+# ---------- SQL ----------
+
+_TSQL_REWRITES = [
+    (re.compile(r"\bTestDB\.dbo\."), ""),
+    (re.compile(r"\bISNULL\("), "IFNULL("),
+    (re.compile(r"\bGETDATE\(\)"), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bSCOPE_IDENTITY\(\)"), "last_insert_rowid()"),
+    (re.compile(r"\bWITH\s*\(UPDLOCK,\s*HOLDLOCK\)"), ""),
+]
+_VALUES_ALIAS = re.compile(r"\(VALUES\s+(?P<rows>.*?)\)\s+AS\s+(?P<alias>\w+)\s*\((?P<cols>[^)]*)\)", re.S)
+_OUTPUT = re.compile(r"\bOUTPUT\s+(?P<cols>inserted\.\w+(?:\s*,\s*inserted\.\w+)*)")
+
+
+# Rewrites the T-SQL dialect bits the pipeline uses into their SQLite equivalents
+def translate_tsql(sql):
+    for pattern, replacement in _TSQL_REWRITES:
+        sql = pattern.sub(replacement, sql)
+
+    def values_alias(m):
+        cols = [c.strip() for c in m.group("cols").split(",")]
+        select = ", ".join(f"column{i + 1} AS {col}" for i, col in enumerate(cols))
+        return f"(SELECT {select} FROM (VALUES {m.group('rows')})) AS {m.group('alias')}"
+    sql = _VALUES_ALIAS.sub(values_alias, sql)
+
+    output = _OUTPUT.search(sql)
+    if output:
+        cols = output.group("cols").replace("inserted.", "")
+        sql = sql[:output.start()] + sql[output.end():]
+        sql = sql.rstrip().rstrip(";") + f" RETURNING {cols}"
+    return sql
+
+
+class SQLiteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.fast_executemany = False
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._cursor.execute(translate_tsql(sql), tuple(params))
+        return self
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(translate_tsql(sql), rows)
+
+    def setinputsizes(self, sizes):
+        pass
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+
+    def cursor(self):
+        return SQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def _sql_type(carrier, name):
+    return {"int": "INTEGER", "float": "REAL", "date": "TEXT", "str": "TEXT"}[column_kind(carrier, name)]
+
+
+# Creates control_master and the two gold tables; ControlNos start at 1000 like the Azure SQL identity
+def create_sqlite_schema(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS control_master (
+            ControlNo INTEGER PRIMARY KEY AUTOINCREMENT,
+            ClientID INTEGER, FileName TEXT, RecordCount INTEGER, LoadTimestamp TEXT,
+            SourceSystem TEXT, FileHash TEXT, carrier TEXT,
+            UNIQUE (ClientID, FileName)
+        );
+        INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'control_master', 999 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'control_master');
+    """)
+    usps = ", ".join(f"{col} {_sql_type('USPS', col)}" for col in usps_cols)
+    ups = ", ".join(f"[{col}] {_sql_type('UPS', col)}" for col in ups_cols)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS usps_ebill_prod ({usps})")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS ups_ebill_prod ({ups})")
+    conn.commit()
+    conn.close()
+
+
+# sqlite3 only adapts builtin types; pandas/numpy scalars from the DataFrame paths are mapped here
+def register_sqlite_adapters():
+    import numpy as np
+    import pandas as pd
+    sqlite3.register_adapter(pd.Timestamp, lambda ts: ts.isoformat(sep=" "))
+    sqlite3.register_adapter(np.int64, int)
+    sqlite3.register_adapter(np.int32, int)
+    sqlite3.register_adapter(np.float64, float)
+    sqlite3.register_adapter(np.bool_, bool)
+
+
+# Returns a connect(conn_str) function for sql_pool.set_connect_factory; the connection string is ignored
+def sqlite_connect(path):
+    register_sqlite_adapters()
+    return lambda conn_str: SQLiteConnection(path)
+
+
+# ---------- Synthetic invoices ----------
+
+# Raw SFTP layouts: the gold columns minus what v6 adds (controlno/clientid) and v7 renames
+USPS_RAW_COLS = [col for col in usps_cols if col not in ("controlno", "childid")]
+UPS_RAW_COLS = [col for col in ups_cols if col not in ("ControlNo", "ChildID")]
+
+_STATES = ["NY", "NJ", "CA", "TX", "FL", "IL", "WA", "GA", "OH", "PA"]
+# A few non-ASCII values, so the ISO-8859-1 -> UTF-8 path of the transform is exercised
+_CITIES = ["Springfield", "Riverside", "Franklin", "Greenville", "Madison", "Clinton", "Salem", "Fairview", "San José", "Española"]
+_RECEIVER_NAMES = ["Customer", "José Peña", "Zoë Brontë", "François Müller"]
+
+
+def _usps_value(rng, col, day):
+    kind = column_kind("USPS", col)
+    if kind == "date":
+        return day.strftime("%Y-%m-%d")
+    if kind == "float":
+        return f"{rng.uniform(0.5, 80):.2f}"
+    return {
+        "trackingnumber": f"9400{rng.randrange(10 ** 14):014d}",   # 18 digits: fits the int64 pandas parses it into
+        "invoicenumber": f"INV{rng.randrange(10 ** 7):07d}",
+        "dimuom": "IN",
+        "servicelevel": rng.choice(["Priority", "Ground Advantage", "Priority Express"]),
+        "shippernumber": f"{rng.randrange(10 ** 9):09d}",
+        "originzip": f"{rng.randrange(10 ** 5):05d}",
+        "destinationzip": f"{rng.randrange(10 ** 5):05d}",
+        "zone": f"{rng.randint(1, 8):02d}",
+        "weightunit": "LB",
+        "accessorialcode": rng.choice(["", "RES", "DAS"]),
+        "accessorialdescription": rng.choice(["", "Residential", "Delivery Area, Extended"]),
+        "packagestatus": rng.choice(["Delivered", "In Transit"]),
+        "receivername": f"{rng.choice(_RECEIVER_NAMES)} {rng.randrange(10 ** 5)}",
+        "receivercity": rng.choice(_CITIES),
+        "receiverstate": rng.choice(_STATES),
+        "receivercountry": "US",
+    }.get(col, "")
+
+
+def _ups_value(rng, col, day):
+    kind = column_kind("UPS", col)
+    if kind == "date":
+        return day.strftime("%Y-%m-%d")
+    if kind == "float":
+        return f"{rng.uniform(-5, 60):.2f}"
+    if kind == "int":
+        return str(rng.randint(1, 3))
+    return {
+        "Lead Shipment Number": f"1Z{rng.randrange(16 ** 16):016X}",
+        "BillToAccountNo": f"{rng.randrange(36 ** 6):06d}",
+        "Bill Option Code": rng.choice(["P/P", "F/C", "T/P"]),
+        "Container Type": rng.choice(["PKG", "LTR"]),
+        "Sender Country": "US",
+        "Receiver Country": "US",
+        "Charge Category Code": rng.choice(["SHP", "ADJ"]),
+        "Charge Classification Code": rng.choice(["FRT", "ACC", "FSC"]),
+        "Charge Category Detail Code": rng.choice(["", "RES", "DAS"]),
+        "Charge Description": rng.choice(["Ground", "Fuel Surcharge", "Residential Surcharge, Ground"]),
+        "Zone": f"{rng.randint(2, 8):03d}",
+        "Billed Weight Unit of Measure": "L",
+        "Billed Weight Type": rng.choice(["B", "A", "D"]),
+        "Tracking Number": f"1Z{rng.randrange(16 ** 16):016X}",
+        "Sender State": rng.choice(_STATES),
+        "Receiver State": rng.choice(_STATES),
+        "Invoice Currency Code": "USD",
+    }.get(col, "")
+
+
+def _csv_line(values):
+    return ",".join(f'"{v}"' if "," in v else v for v in values) + "\n"
+
+
+# Raw eBill CSV bytes as a client would drop them on SFTP; deterministic for a given seed
+def synthetic_invoice_csv(carrier, rows, seed=0):
+    rng = random.Random(seed)
+    cols, value = (USPS_RAW_COLS, _usps_value) if carrier == "USPS" else (UPS_RAW_COLS, _ups_value)
+    start = datetime(2025, 1, 1)
+    out = io.StringIO()
+    out.write(_csv_line(cols))
+    for _ in range(rows):
+        day = start + timedelta(days=rng.randrange(365))
+        out.write(_csv_line([value(rng, col, day) for col in cols]))
+    return out.getvalue().encode("ISO-8859-1")
+
+
+# Writes `files` synthetic invoices into an SFTP-style /upload directory; returns the file names
+def write_sftp_drop(root, carrier, files, rows, seed=0):
+    upload_dir = os.path.join(root, "upload")
+    os.makedirs(upload_dir, exist_ok=True)
+    names = []
+    for i in range(files):
+        name = f"{carrier.lower()}_invoice_{seed:03d}_{i:04d}.csv"
+        with open(os.path.join(upload_dir, name), "wb") as f:
+            f.write(synthetic_invoice_csv(carrier, rows, seed=seed * 100000 + i))
+        names.append(name)
+    return names
@@ -0,0 +1,262 @@
+# bench_pipeline.py
+# Offline throughput benchmarks for the v6 ingest and v7 gold-load stages, run against the stand-ins in bench_backends.
+# 🎯 Key features:
+# - No DigitalOcean, Azure Storage or Azure SQL needed: SFTP is a local directory, blobs are files, SQL is SQLite
+# - Synthetic USPS/UPS invoices matching usps_cols / ups_cols, deterministic per seed
+# - Each stage runs in its own process so its peak RSS is its own
+# - Reports files/sec, MB/sec, rows/sec and peak RSS per stage; --json writes the same numbers for comparing runs
+#
+# Usage: python bench_pipeline.py --files 20 --rows 5000 [--stages process_file,upload_to_blob] [--json out.json]
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+try:
+    import resource
+except ImportError:   # Windows: peak RSS is reported as n/a
+    resource = None
+
+STAGES = [
+    "process_file",
+    "process_file_streaming",
+    "upload_to_blob",
+    "insert_into_control_master",
+    "process_usps_blob",
+    "process_ups_blob",
+]
+
+# Which synthetic drop each v6 client reads (clientA is USPS, clientC is UPS)
+BENCH_CLIENTS = {"clientA": "USPS", "clientC": "UPS"}
+BENCH_CLIENT_IDS = {"clientA": 12659, "clientC": 12661}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024   # bytes on macOS, KiB on Linux
+
+
+# Points the pipeline modules at the stand-ins; must run before v6/v7 are imported
+def _install_backends(workdir, stage):
+    import sql_pool
+    from bench_backends import create_sqlite_schema, sqlite_connect
+
+    db_path = os.path.join(workdir, f"{stage}.sqlite")
+    create_sqlite_schema(db_path)
+    sql_pool.set_connect_factory(sqlite_connect(db_path))
+    # No Azure settings needed: v6/v7 only build their Azure clients on first use, and each stage assigns local
+    # containers (_containers) before that happens
+    os.environ["STREAM_TRANSFER"] = "true" if stage == "process_file_streaming" else "false"
+    os.environ.pop("BULK_CHECKPOINT_PATH", None)
+
+
+def _containers(workdir, stage):
+    from bench_backends import LocalContainerClient
+    blob_root = os.path.join(workdir, "blob", stage)
+    return LocalContainerClient(blob_root, "raw"), LocalContainerClient(blob_root, "transformed")
+
+
+def _client_files(workdir, client_name):
+    upload_dir = os.path.join(workdir, "sftp", client_name, "upload")
+    return sorted(os.listdir(upload_dir))
+
+
+def _bench_process_file(workdir, stage):
+    import v6_insertcontrolno_into_controlmaster_sqltable as v6
+    from bench_backends import LocalSFTP
+
+    v6.raw_container_client, v6.transformed_container_client = _containers(workdir, stage)
+    work = [(client_name, LocalSFTP(os.path.join(workdir, "sftp", client_name)), file_name)
+            for client_name in BENCH_CLIENTS for file_name in _client_files(workdir, client_name)]
+    nbytes = sum(sftp.stat(f"/upload/{file_name}").st_size for _, sftp, file_name in work)
+
+    started = time.perf_counter()
+    for client_name, sftp, file_name in work:
+        v6.process_file(sftp, client_name, file_name)
+    elapsed = time.perf_counter() - started
+    return len(work), nbytes, elapsed
+
+
+def _bench_upload_to_blob(workdir, stage):
+    import v6_insertcontrolno_into_controlmaster_sqltable as v6
+
+    v6.raw_container_client, v6.transformed_container_client = _containers(workdir, stage)
+    payloads = []
+    for client_name in BENCH_CLIENTS:
+        for file_name in _client_files(workdir, client_name):
+            with open(os.path.join(workdir, "sftp", client_name, "upload", file_name), "rb") as f:
+                payloads.append((f"{client_name.lower()}_{file_name}", f.read()))
+
+    started = time.perf_counter()
+    for blob_name, data in payloads:
+        v6.upload_to_blob(io.BytesIO(data), blob_name)
+    elapsed = time.perf_counter() - started
+    return len(payloads), sum(len(data) for _, data in payloads), elapsed
+
+
+def _bench_insert_into_control_master(workdir, stage):
+    import v6_insertcontrolno_into_controlmaster_sqltable as v6
+
+    calls = []
+    for client_name in BENCH_CLIENTS:
+        clientid = v6.CLIENTS[client_name]["id"]
+        for file_name in _client_files(workdir, client_name):
+            with open(os.path.join(workdir, "sftp", client_name, "upload", file_name), "rb") as f:
+                data = f.read()
+            calls.append((clientid, file_name, data.count(b"\n") - 1, data, v6.CARRIER_BY_CLIENTID[clientid]))
+
+    started = time.perf_counter()
+    for clientid, file_name, recordcount, data, carrier in calls:
+        v6.insert_into_control_master(clientid, file_name, recordcount, data, carrier)
+    elapsed = time.perf_counter() - started
+    return len(calls), sum(len(call[3]) for call in calls), elapsed
+
+
+# Builds the DataFrames v7 would hand to process_*_blob, from the v6-transformed synthetic files
+def _gold_frames(workdir, carrier):
+    import pandas as pd
+    import v7_bronze_to_gold_insert as v7
+    from csv_transform import inject_columns
+    from v6_insertcontrolno_into_controlmaster_sqltable import SOURCE_CSV_ENCODING
+
+    client_name = next(name for name, c in BENCH_CLIENTS.items() if c == carrier)
+    frames = []
+    for i, file_name in enumerate(_client_files(workdir, client_name)):
+        with open(os.path.join(workdir, "sftp", client_name, "upload", file_name), "rb") as f:
+            raw = f.read()
+        transformed, _ = inject_columns(raw, [("controlno", 1000 + i), ("clientid", BENCH_CLIENT_IDS[client_name])], [("carrier", carrier)],
+                                        SOURCE_CSV_ENCODING)
+        df = v7.gold_frame(pd.read_csv(io.BytesIO(transformed), dtype=str))   # read the silver CSV the way v7 does
+        frames.append((f"{client_name.lower()}_transformed_{file_name}", df, len(raw)))
+    return frames
+
+
+def _bench_gold(workdir, stage):
+    import v7_bronze_to_gold_insert as v7
+
+    carrier = "USPS" if stage == "process_usps_blob" else "UPS"
+    process = v7.process_usps_blob if carrier == "USPS" else v7.process_ups_blob
+    frames = _gold_frames(workdir, carrier)
+
+    started = time.perf_counter()
+    for blob_name, df, _ in frames:
+        process(df, blob_name)
+    elapsed = time.perf_counter() - started
+    return len(frames), sum(size for _, _, size in frames), elapsed
+
+
+BENCHES = {
+    "process_file": _bench_process_file,
+    "process_file_streaming": _bench_process_file,
+    "upload_to_blob": _bench_upload_to_blob,
+    "insert_into_control_master": _bench_insert_into_control_master,
+    "process_usps_blob": _bench_gold,
+    "process_ups_blob": _bench_gold,
+}
+
+
+def _count_rows(workdir, stage):
+    if stage == "upload_to_blob":
+        return 0
+    carriers = {"process_usps_blob": ["USPS"], "process_ups_blob": ["UPS"]}.get(stage, list(BENCH_CLIENTS.values()))
+    rows = 0
+    for client_name, carrier in BENCH_CLIENTS.items():
+        if carrier in carriers:
+            for file_name in _client_files(workdir, client_name):
+                with open(os.path.join(workdir, "sftp", client_name, "upload", file_name), "rb") as f:
+                    rows += sum(1 for _ in f) - 1
+    return rows
+
+
+# Child process entry point: one stage, fresh interpreter, result dict on the queue
+def _run_stage(stage, workdir, verbose, results):
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        _install_backends(workdir, stage)
+        out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with out:
+            files, nbytes, elapsed = BENCHES[stage](workdir, stage)
+        elapsed = max(elapsed, 1e-9)
+        rows = _count_rows(workdir, stage)
+        results.put({
+            "stage": stage,
+            "files": files,
+            "bytes": nbytes,
+            "rows": rows,
+            "seconds": elapsed,
+            "files_per_sec": files / elapsed,
+            "mb_per_sec": nbytes / elapsed / (1024 * 1024),
+            "rows_per_sec": rows / elapsed,
+            "peak_rss_mb": _peak_rss_mb(),
+        })
+    except Exception as e:
+        results.put({"stage": stage, "error": f"{type(e).__name__}: {e}"})
+
+
+def prepare_workdir(workdir, files, rows, seed):
+    from bench_backends import write_sftp_drop
+    for i, (client_name, carrier) in enumerate(BENCH_CLIENTS.items()):
+        write_sftp_drop(os.path.join(workdir, "sftp", client_name), carrier, files, rows, seed=seed + i)
+
+
+def run_benchmarks(stages, files, rows, workdir, seed=0, verbose=False):
+    prepare_workdir(workdir, files, rows, seed)
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for stage in stages:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_stage, args=(stage, workdir, verbose, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        results.append(result)
+        if "error" in result:
+            print(f"❌ {stage}: {result['error']}")
+        else:
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+            print(f"✅ {stage:<28} {result['files_per_sec']:>9.1f} files/s {result['mb_per_sec']:>9.1f} MB/s "
+                  f"{result['rows_per_sec']:>12,.0f} rows/s   peak RSS {rss}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmarks for the SFTP -> Blob -> SQL stages")
+    parser.add_argument("--files", type=int, default=20, help="synthetic files per carrier")
+    parser.add_argument("--rows", type=int, default=5000, help="rows per synthetic file")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="keep the SFTP/blob/SQLite stand-ins here instead of a temp dir")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline's own per-file output")
+    args = parser.parse_args()
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in BENCHES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="sftptoblob_bench_")
+    print(f"📊 Benchmarking {len(stages)} stages: {args.files} files x {args.rows} rows per carrier in {workdir}")
+    try:
+        results = run_benchmarks(stages, args.files, args.rows, workdir, args.seed, args.verbose)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"files": args.files, "rows": args.rows, "results": results}, f, indent=2)
+        print(f"📝 Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
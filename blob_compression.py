@@ -0,0 +1,136 @@
+# blob_compression.py
+# Optional compression of the raw and silver CSV blobs, and transparent decompression when they are read back.
+# 🎯 Key features:
+# - BLOB_COMPRESSION=gzip|zstd compresses uploads window by window as they stream out; no compressed copy of the
+#   whole file is ever built
+# - The codec is recorded as the blob's Content-Encoding (with a text/csv Content-Type), so v7 and any other Azure
+#   tool can tell how the stored bytes are encoded
+# - Readers decode from Content-Encoding, falling back to the gzip/zstd magic bytes for blobs listed without it
+# - FileHash and the hash index are always computed over the original bytes, before anything is compressed
+# - Parquet is left alone: its pages are already zstd-compressed
+# - zstandard is only imported when zstd is actually used
+
+import io
+import os
+import zlib
+from azure.storage.blob import ContentSettings
+from blob_streaming import ChunkStream
+
+# Compression config
+BLOB_COMPRESSION = os.getenv("BLOB_COMPRESSION", "none").lower()       # none | gzip | zstd
+BLOB_COMPRESSION_LEVEL = os.getenv("BLOB_COMPRESSION_LEVEL")            # unset = codec default (gzip 6, zstd 3)
+COMPRESSION_WINDOW_BYTES = int(os.getenv("COMPRESSION_WINDOW_BYTES", 4 * 1024 * 1024))
+
+CODECS = ("gzip", "zstd")
+_MAGIC = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+_DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("zstd blob compression needs zstandard (pip install zstandard)") from e
+    return zstandard
+
+
+def _level(codec):
+    return int(BLOB_COMPRESSION_LEVEL) if BLOB_COMPRESSION_LEVEL else _DEFAULT_LEVELS[codec]
+
+
+# Both codecs expose compress(data) / flush()
+def compressor(codec):
+    if codec == "gzip":
+        return zlib.compressobj(_level(codec), zlib.DEFLATED, 31)   # wbits 31: gzip header and trailer
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=_level(codec)).compressobj()
+    raise ValueError(f"Unknown blob compression '{codec}' (expected one of: {', '.join(CODECS)})")
+
+
+# Both codecs expose decompress(data)
+def decompressor(codec):
+    if codec == "gzip":
+        return zlib.decompressobj(31)
+    if codec == "zstd":
+        return _zstd().ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unknown blob content encoding '{codec}'")
+
+
+def compressed_chunks(chunks, codec):
+    engine = compressor(codec)
+    for chunk in chunks:
+        out = engine.compress(chunk)
+        if out:
+            yield out
+    yield engine.flush()
+
+
+def decompressed_chunks(chunks, codec):
+    engine = decompressor(codec)
+    for chunk in chunks:
+        out = engine.decompress(chunk)
+        if out:
+            yield out
+
+
+def _read_windows(stream, size=COMPRESSION_WINDOW_BYTES):
+    return iter(lambda: stream.read(size), b"")
+
+
+# Codec to store a blob with, or None: compression is off, or the payload is Parquet
+def upload_codec(blob_name, codec=None):
+    codec = codec or BLOB_COMPRESSION
+    if codec in ("", "none") or blob_name.endswith(".parquet"):
+        return None
+    if codec not in CODECS:
+        raise ValueError(f"Unknown BLOB_COMPRESSION '{codec}' (expected none or one of: {', '.join(CODECS)})")
+    return codec
+
+
+def content_settings(codec):
+    return ContentSettings(content_type="text/csv", content_encoding=codec) if codec else None
+
+
+# (payload, content_settings) for upload_blob: the stream itself when compression is off, otherwise a stream that
+# compresses it on the fly (its bytes_read is the stored size once the upload is done)
+def encode_upload(stream, blob_name, codec=None):
+    codec = upload_codec(blob_name, codec)
+    if codec is None:
+        return stream, None
+    return ChunkStream(compressed_chunks(_read_windows(stream), codec)), content_settings(codec)
+
+
+# BlockUploader keyword arguments (encoder, content_settings) for a blob written through staged blocks
+def block_upload_options(blob_name, codec=None):
+    codec = upload_codec(blob_name, codec)
+    return {"encoder": compressor(codec) if codec else None, "content_settings": content_settings(codec)}
+
+
+# The Content-Encoding of a listed or fetched blob, if it is one we can decode
+def blob_codec(blob):
+    encoding = getattr(getattr(blob, "content_settings", None), "content_encoding", None)
+    return encoding if encoding in CODECS else None
+
+
+def sniff_codec(head):
+    for codec, magic in _MAGIC.items():
+        if bytes(head[:len(magic)]) == magic:
+            return codec
+    return None
+
+
+# Buffered stream of the decoded bytes of a stored blob stream; codec None = look at the magic bytes
+def decoding_stream(raw, codec=None, buffer_size=COMPRESSION_WINDOW_BYTES):
+    stream = raw if isinstance(raw, io.BufferedReader) else io.BufferedReader(raw, buffer_size)
+    codec = codec or sniff_codec(stream.peek(4))
+    if codec is None:
+        return stream
+    return io.BufferedReader(ChunkStream(decompressed_chunks(_read_windows(stream), codec)), buffer_size)
+
+
+# Whole-payload variant for readers that need bytes (e.g. Parquet)
+def decoded_bytes(data, codec=None):
+    codec = codec or sniff_codec(data)
+    if codec is None:
+        return data
+    return b"".join(decompressed_chunks([data], codec))
@@ -0,0 +1,171 @@
+# blob_download.py
+# Bounded-memory reads of large blobs for the v7 gold load.
+# 🎯 Key features:
+# - RangedBlobReader downloads a blob window by window on a background thread; each window is a ranged
+#   download_blob with max_concurrency, written with readinto straight into a preallocated, recycled buffer
+# - The reader is a file object, so pd.read_csv(chunksize=...) parses while later windows are still downloading
+# - prefetch() runs any iterator (e.g. the parsed chunks) one step ahead on its own thread, so parse and insert overlap
+# - Peak memory is LARGE_BLOB_WINDOW_BYTES x (LARGE_BLOB_PREFETCH_WINDOWS + 1) plus the parsed chunks in flight,
+#   whatever the size of the blob
+
+import io
+import os
+import queue
+import threading
+from pipeline_metrics import span, current_client, bind_client
+
+# Large-blob config
+LARGE_BLOB_THRESHOLD_BYTES = int(os.getenv("LARGE_BLOB_THRESHOLD_BYTES", 64 * 1024 * 1024))   # bigger blobs use the chunked path
+LARGE_BLOB_WINDOW_BYTES = int(os.getenv("LARGE_BLOB_WINDOW_BYTES", 16 * 1024 * 1024))         # one ranged download
+LARGE_BLOB_MAX_CONCURRENCY = int(os.getenv("LARGE_BLOB_MAX_CONCURRENCY", 4))                  # parallel range requests per window
+LARGE_BLOB_PREFETCH_WINDOWS = int(os.getenv("LARGE_BLOB_PREFETCH_WINDOWS", 2))                # windows downloaded ahead of the parser
+
+_POLL_SECONDS = 0.5
+_DONE = object()
+
+
+# Seekable writer over a preallocated buffer; the SDK seeks to each range's offset when max_concurrency > 1
+class _BufferWriter(io.RawIOBase):
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = base + offset
+        return self._pos
+
+    def write(self, data):
+        n = len(data)
+        self._view[self._pos:self._pos + n] = data
+        self._pos += n
+        return n
+
+
+# Read-only stream over a blob, downloaded LARGE_BLOB_PREFETCH_WINDOWS windows ahead of the reader
+class RangedBlobReader(io.RawIOBase):
+    def __init__(self, blob_client, size, window=LARGE_BLOB_WINDOW_BYTES, max_concurrency=LARGE_BLOB_MAX_CONCURRENCY,
+                 prefetch_windows=LARGE_BLOB_PREFETCH_WINDOWS):
+        self.blob_client = blob_client
+        self.size = size
+        self.window = window
+        self.max_concurrency = max_concurrency
+        self.bytes_read = 0
+        self._client = current_client()
+        self._free = queue.Queue()
+        for _ in range(prefetch_windows + 1):
+            self._free.put(bytearray(min(window, max(size, 1))))
+        self._ready = queue.Queue()
+        self._stop = threading.Event()
+        self._buffer = None
+        self._pending = memoryview(b"")
+        self._thread = threading.Thread(target=self._download, name="ranged-download", daemon=True)
+        self._thread.start()
+
+    def readable(self):
+        return True
+
+    def _take_free(self):
+        while not self._stop.is_set():
+            try:
+                return self._free.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return None
+
+    def _download(self):
+        try:
+            for offset in range(0, self.size, self.window):
+                buffer = self._take_free()
+                if buffer is None:
+                    return
+                length = min(self.window, self.size - offset)
+                with span("download", client=self._client, ranged=True) as s:
+                    # decompress=False: windows are byte ranges of the stored (possibly compressed) blob
+                    downloader = self.blob_client.download_blob(offset=offset, length=length, max_concurrency=self.max_concurrency, decompress=False)
+                    received = downloader.readinto(_BufferWriter(memoryview(buffer)[:length]))
+                    s.bytes = received
+                if received != length:
+                    raise IOError(f"Short read from {self.blob_client.blob_name} at {offset}: {received} of {length} bytes")
+                self._ready.put((buffer, length))
+            self._ready.put(_DONE)
+        except BaseException as e:
+            self._ready.put(e)
+
+    def readinto(self, buffer):
+        if not self._pending:
+            if self._buffer is not None:
+                self._free.put(self._buffer)   # the reader is past this window, so it can be refilled
+                self._buffer = None
+            item = self._ready.get()
+            if item is _DONE:
+                self._ready.put(_DONE)
+                return 0
+            if isinstance(item, BaseException):
+                self._ready.put(item)
+                raise item
+            self._buffer, length = item
+            self._pending = memoryview(self._buffer)[:length]
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        self.bytes_read += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._pending = memoryview(b"")
+            self._ready.put(ValueError("read from a closed RangedBlobReader"))   # wakes a reader still waiting on a window
+        super().close()
+
+
+# Runs an iterator on a background thread, at most depth items ahead of the consumer; errors re-raise on the consumer side
+def prefetch(iterable, depth=1):
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    client = current_client()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        with bind_client(client):
+            try:
+                for item in iterable:
+                    if not put((True, item)):
+                        return
+                put((False, _DONE))
+            except BaseException as e:
+                put((False, e))
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            ok, item = items.get()
+            if ok:
+                yield item
+            elif item is _DONE:
+                return
+            else:
+                raise item
+    finally:
+        stop.set()
+        thread.join()
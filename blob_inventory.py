@@ -0,0 +1,103 @@
+# blob_inventory.py
+# In-memory inventory of a blob container so dedup checks stop costing one HEAD request per file.
+# 🎯 Key features:
+# - Built once per run from a single prefix-filtered list_blobs call
+# - Optional JSON snapshot on disk; a snapshot (or an inventory kept in memory) younger than INVENTORY_MAX_AGE
+#   skips the listing entirely
+# - Refreshes merge by last-modified and report how many blobs appeared since the previous watermark
+# - Membership checks are plain set lookups; writers still use conditional uploads to close the race window
+
+import os
+import json
+import time
+import threading
+
+# Inventory config
+INVENTORY_SNAPSHOT_DIR = os.getenv("INVENTORY_SNAPSHOT_DIR")                  # unset = keep the inventory in memory only
+INVENTORY_MAX_AGE = int(os.getenv("INVENTORY_MAX_AGE_SECONDS", 0))            # 0 = always re-list at the start of a run
+
+
+class BlobInventory:
+    def __init__(self, container_client, prefix="", snapshot_dir=INVENTORY_SNAPSHOT_DIR, max_age=INVENTORY_MAX_AGE):
+        self.container_client = container_client
+        self.prefix = prefix
+        self.max_age = max_age
+        self.snapshot_path = None
+        if snapshot_dir:
+            safe_prefix = prefix.replace("/", "_") or "all"
+            self.snapshot_path = os.path.join(snapshot_dir, f"{container_client.container_name}__{safe_prefix}.json")
+        self.blobs = {}              # blob name -> last_modified (ISO string)
+        self.watermark = None        # newest last_modified seen so far
+        self.refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def __contains__(self, blob_name):
+        with self._lock:
+            return blob_name in self.blobs
+
+    def __len__(self):
+        return len(self.blobs)
+
+    def load(self):
+        if self.refreshed_at and time.time() - self.refreshed_at < self.max_age:
+            return self   # kept in memory by a long-running process and still fresh
+        if self.has_fresh_snapshot():
+            print(f"📇 Using inventory snapshot for {self.container_client.container_name}/{self.prefix}* ({len(self.blobs)} blobs)")
+            return self
+        return self.refresh()
+
+    # Reads the snapshot, if any; True when it is young enough to skip the listing
+    def has_fresh_snapshot(self):
+        return self._read_snapshot() and time.time() - self.refreshed_at < self.max_age
+
+    def refresh(self):
+        return self.apply_listing(self.container_client.list_blobs(name_starts_with=self.prefix or None))
+
+    # Replaces the inventory with a listing fetched elsewhere (e.g. by the async engine's aio client)
+    def apply_listing(self, listing):
+        previous_watermark = self.watermark
+        blobs = {}
+        for blob in listing:
+            blobs[blob.name] = blob.last_modified.isoformat() if blob.last_modified else ""
+        new_blobs = [name for name, modified in blobs.items() if previous_watermark is None or modified > previous_watermark]
+
+        with self._lock:
+            self.blobs = blobs
+            self.watermark = max(blobs.values(), default=previous_watermark)
+            self.refreshed_at = time.time()
+        print(f"📇 Indexed {len(blobs)} blobs in {self.container_client.container_name}/{self.prefix}* ({len(new_blobs)} new since last refresh)")
+        self.save()
+        return self
+
+    # Record a blob this run wrote so later lookups (and the snapshot) see it without re-listing
+    def add(self, blob_name, last_modified=None):
+        modified = last_modified.isoformat() if last_modified else ""
+        with self._lock:
+            self.blobs[blob_name] = modified
+            if modified and (self.watermark is None or modified > self.watermark):
+                self.watermark = modified
+
+    def save(self):
+        if not self.snapshot_path:
+            return
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        with self._lock:
+            snapshot = {"refreshed_at": self.refreshed_at, "watermark": self.watermark, "blobs": self.blobs}
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _read_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable inventory snapshot {self.snapshot_path}: {e}")
+            return False
+        self.blobs = snapshot.get("blobs", {})
+        self.watermark = snapshot.get("watermark")
+        self.refreshed_at = snapshot.get("refreshed_at", 0.0)
+        return True
@@ -0,0 +1,149 @@
+# blob_streaming.py
+# Streams SFTP files into Azure Blob Storage as staged blocks instead of buffering whole files in BytesIO.
+# 🎯 Key features:
+# - Reads the paramiko SFTPFile in fixed-size windows, each window prefetched with pipelined readv requests
+# - Pushes chunks to Azure with stage_block and finishes with a single commit_block_list
+# - Peak memory is bounded by STREAM_CHUNK_SIZE x STREAM_MAX_INFLIGHT
+# - Computes the SHA-256 used for control_master.FileHash on the fly
+# - An optional encoder (anything with compress/flush, e.g. blob_compression.compressor) compresses what is staged;
+#   the hash and bytes_written always refer to the original bytes
+
+import os
+import io
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from azure.core import MatchConditions
+from azure.storage.blob import BlobBlock
+
+# Streaming config
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 4 * 1024 * 1024))   # 4 MiB per staged block
+STREAM_MAX_INFLIGHT = int(os.getenv("STREAM_MAX_INFLIGHT", 4))              # blocks being staged at once
+
+
+# Reads a remote file window by window; readv pipelines the SFTP requests for each window
+def iter_sftp_chunks(remote_file, file_size, chunk_size=STREAM_CHUNK_SIZE, start=0):
+    offset = start
+    while offset < file_size:
+        length = min(chunk_size, file_size - offset)
+        for data in remote_file.readv([(offset, length)]):
+            yield data
+        offset += length
+
+
+# Stages blocks on a background pool; write() blocks once max_inflight blocks are queued (backpressure)
+class BlockUploader:
+    def __init__(self, blob_client, chunk_size=STREAM_CHUNK_SIZE, max_inflight=STREAM_MAX_INFLIGHT, encoder=None, content_settings=None):
+        self.blob_client = blob_client
+        self.chunk_size = chunk_size
+        self.encoder = encoder
+        self.content_settings = content_settings
+        self.block_ids = []
+        self.bytes_written = 0   # bytes handed to write()
+        self.bytes_staged = 0    # bytes sent to Azure (after the encoder, if any)
+        self._buffer = bytearray()
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight)
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        self._buffer += self.encoder.compress(data) if self.encoder else data
+        while len(self._buffer) >= self.chunk_size:
+            self._stage(bytes(self._buffer[:self.chunk_size]))
+            del self._buffer[:self.chunk_size]
+
+    def _stage(self, block):
+        # Block ids must all be the same length within one blob
+        block_id = base64.b64encode(f"{len(self.block_ids):08d}".encode()).decode()
+        self.block_ids.append(block_id)
+        self.bytes_staged += len(block)
+        self._slots.acquire()
+        self._futures.append(self._executor.submit(self._stage_block, block_id, block))
+        self._raise_failed()
+
+    def _stage_block(self, block_id, block):
+        try:
+            self.blob_client.stage_block(block_id=block_id, data=block, length=len(block))
+        finally:
+            self._slots.release()
+
+    def _raise_failed(self):
+        pending = []
+        for future in self._futures:
+            if future.done():
+                future.result()
+            else:
+                pending.append(future)
+        self._futures = pending
+
+    # overwrite=False commits with If-None-Match: * and raises ResourceExistsError if another writer got there first
+    def commit(self, overwrite=False):
+        if self.encoder:
+            self._buffer += self.encoder.flush()
+            self.encoder = None
+        if self._buffer:
+            self._stage(bytes(self._buffer))
+            self._buffer.clear()
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        conditions = {} if overwrite else {"match_condition": MatchConditions.IfMissing}
+        self.blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id in self.block_ids],
+                                           content_settings=self.content_settings, **conditions)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+# Read-only stream over an iterator of byte chunks; every chunk is handed to the sinks as it passes through
+class ChunkStream(io.RawIOBase):
+    def __init__(self, chunks, sinks=()):
+        self._chunks = iter(chunks)
+        self._sinks = list(sinks)
+        self._pending = memoryview(b"")
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        for chunk in self._chunks:
+            if chunk:
+                for sink in self._sinks:
+                    sink(chunk)
+                self.bytes_read += len(chunk)
+                return chunk
+        return b""
+
+    def readinto(self, buffer):
+        if not self._pending:
+            self._pending = memoryview(self._next_chunk())
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def drain(self):
+        # Pull whatever the consumer did not read so every sink sees the full file
+        while self._next_chunk():
+            pass
+
+
+# Streams one SFTP file straight into a block blob; returns (sha256 hexdigest, bytes transferred)
+def stream_sftp_to_blob(sftp, remote_path, blob_client, chunk_size=STREAM_CHUNK_SIZE, max_inflight=STREAM_MAX_INFLIGHT):
+    hasher = hashlib.sha256()
+    with BlockUploader(blob_client, chunk_size, max_inflight) as uploader:
+        with sftp.open(remote_path, "rb") as remote_file:
+            for chunk in iter_sftp_chunks(remote_file, remote_file.stat().st_size, chunk_size):
+                hasher.update(chunk)
+                uploader.write(chunk)
+        uploader.commit()
+    return hasher.hexdigest(), uploader.bytes_written
@@ -0,0 +1,62 @@
+# blob_watermark.py
+# Durable (last_modified, blob name) watermark so the gold loader only handles blobs it has not seen before.
+# 🎯 Key features:
+# - Blobs are ordered by (last_modified, name); everything at or below the watermark is skipped without any I/O
+# - The watermark only advances over an unbroken run of successes, so a failed blob is retried next run
+# - Successes past a failure are remembered individually, so they are not loaded twice
+# - State is written atomically (tmp file + os.replace) after every advance
+
+import os
+import json
+
+
+def blob_key(blob):
+    return (blob.last_modified.isoformat() if blob.last_modified else "", blob.name)
+
+
+class BlobWatermark:
+    def __init__(self, path):
+        self.path = path
+        self.last_modified = ""
+        self.name = ""
+        self.done_after = {}         # blob name -> last_modified for successes beyond the watermark
+        self._blocked = False        # set once a blob fails in this run
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.last_modified = state.get("last_modified", "")
+            self.name = state.get("name", "")
+            self.done_after = state.get("done_after", {})
+
+    # A watermark kept across passes (daemon mode) starts every pass unblocked, so a blob that failed last pass is
+    # retried first and the watermark can advance again once it succeeds
+    def begin_pass(self):
+        self._blocked = False
+
+    def is_new(self, blob):
+        return blob_key(blob) > (self.last_modified, self.name) and blob.name not in self.done_after
+
+    def new_blobs(self, blobs):
+        return sorted((blob for blob in blobs if self.is_new(blob)), key=blob_key)
+
+    def mark_done(self, blob):
+        if self._blocked:
+            self.done_after[blob.name] = blob_key(blob)[0]
+        else:
+            self.last_modified, self.name = blob_key(blob)
+            # Anything remembered individually that is now under the watermark can be forgotten
+            self.done_after = {
+                name: modified for name, modified in self.done_after.items()
+                if (modified, name) > (self.last_modified, self.name)
+            }
+        self.save()
+
+    def mark_failed(self, blob):
+        self._blocked = True
+
+    def save(self):
+        state = {"last_modified": self.last_modified, "name": self.name, "done_after": self.done_after}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,160 @@
+# bulk_loader.py
+# Batched, resumable bulk insert path for the *_ebill_prod gold tables.
+# 🎯 Key features:
+# - Converts each needed DataFrame column once into a typed column buffer (NaN -> NULL done vectorized)
+# - Streams BULK_BATCH_ROWS rows at a time into fast_executemany, so no whole-file list of lists is ever built
+# - With a checkpoint, commits per batch and records the committed row offset per source file, so a failed load resumes
+#   where it stopped; without one, each file is a single transaction, so a failed load leaves no rows behind to duplicate
+# - With the run journal on, each batch's intent is recorded before it is sent; a batch left in doubt by a crash is
+#   settled by counting the file's rows in the table (count_loaded), so it is neither lost nor inserted twice
+# - load_chunks() takes a file as a stream of DataFrames, so very large files are inserted without ever being whole in memory
+# - Reports rows/sec per file
+
+import os
+import json
+import time
+import itertools
+import threading
+import pandas as pd
+from pipeline_metrics import span
+from run_journal import get_journal
+
+# Bulk load config
+BULK_BATCH_ROWS = int(os.getenv("BULK_BATCH_ROWS", 50000))
+BULK_CHECKPOINT_PATH = os.getenv("BULK_CHECKPOINT_PATH")   # unset = no resume across runs
+
+
+# Committed-row offsets per source file, persisted as JSON
+class FileCheckpoint:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.offsets = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.offsets = json.load(f)
+
+    def get(self, source_name):
+        with self._lock:
+            return self.offsets.get(source_name, 0)
+
+    # Only committed offsets are kept here; intents need the run journal (run_journal.GoldCheckpoint)
+    def begin(self, source_name, rows):
+        pass
+
+    def in_doubt(self, source_name):
+        return None
+
+    def set(self, source_name, rows):
+        with self._lock:
+            self.offsets[source_name] = rows
+            self._save()
+
+    def clear(self, source_name):
+        with self._lock:
+            if self.offsets.pop(source_name, None) is not None:
+                self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.offsets, f)
+        os.replace(tmp_path, self.path)
+
+
+# The run journal when RUN_JOURNAL_PATH is set, else the JSON offsets file when BULK_CHECKPOINT_PATH is set
+def default_checkpoint():
+    journal = get_journal()
+    if journal:
+        return journal.gold_checkpoint()
+    return FileCheckpoint(BULK_CHECKPOINT_PATH) if BULK_CHECKPOINT_PATH else None
+
+
+# One object-dtype buffer per column with missing values already turned into None for pyodbc
+def columnar_buffers(df, columns):
+    buffers = []
+    for col in columns:
+        values = df[col].to_numpy(dtype=object)
+        missing = pd.isna(df[col]).to_numpy()
+        if missing.any():
+            values = values.copy()   # object columns come back as views of the DataFrame
+            values[missing] = None
+        buffers.append(values)
+    return buffers
+
+
+class BulkLoader:
+    def __init__(self, conn, batch_rows=BULK_BATCH_ROWS, checkpoint=None):
+        self.conn = conn
+        self.batch_rows = batch_rows
+        self.checkpoint = checkpoint
+
+    def load(self, df, insert_sql, columns, source_name, input_sizes=None, count_loaded=None):
+        return self.load_chunks([df], insert_sql, columns, source_name, input_sizes, count_loaded)
+
+    # Where a load of source_name starts: the committed offset, after settling a batch the last run left in doubt.
+    # count_loaded(conn, first_df) returns how many of this file's rows the table already holds
+    def _start_row(self, source_name, first_df, count_loaded):
+        if not self.checkpoint:
+            return 0
+        start_row = self.checkpoint.get(source_name)
+        intended = self.checkpoint.in_doubt(source_name)
+        if intended is not None and intended > start_row:
+            if count_loaded is None or first_df is None:
+                print(f"⚠️ {source_name}: last batch was in doubt and cannot be checked; sending it again")
+            else:
+                settled = min(max(count_loaded(self.conn, first_df), start_row), intended)
+                print(f"🩹 {source_name}: settled in-doubt batch, {settled - start_row} of {intended - start_row} rows were committed")
+                self.checkpoint.set(source_name, settled)
+                start_row = settled
+        if start_row:
+            print(f"⏩ Resuming {source_name} at row {start_row}")
+        return start_row
+
+    # Same as load() for a file that arrives as consecutive DataFrames (e.g. read_csv chunks);
+    # the checkpoint counts rows across all chunks, so a resume skips whole chunks it already committed
+    # input_sizes (e.g. gold_validation.gold_input_sizes) binds every parameter once with its declared SQL type
+    def load_chunks(self, frames, insert_sql, columns, source_name, input_sizes=None, count_loaded=None):
+        frames = iter(frames)
+        first = next(frames, None)
+        start_row = self._start_row(source_name, first, count_loaded)
+        if first is not None:
+            frames = itertools.chain([first], frames)
+
+        cursor = self.conn.cursor()
+        cursor.fast_executemany = True
+        if input_sizes:
+            cursor.setinputsizes(input_sizes)
+        started = time.monotonic()
+        seen = 0
+        committed = 0
+        try:
+            for df in frames:
+                skip = min(max(start_row - seen, 0), len(df))
+                seen += len(df)
+                buffers = columnar_buffers(df.iloc[skip:], columns)
+                for offset in range(0, len(df) - skip, self.batch_rows):
+                    with span("bulk_insert", source=source_name) as s:
+                        rows = list(zip(*(buffer[offset:offset + self.batch_rows] for buffer in buffers)))
+                        if self.checkpoint:
+                            self.checkpoint.begin(source_name, start_row + committed + len(rows))
+                        cursor.executemany(insert_sql, rows)
+                        if self.checkpoint:
+                            self.conn.commit()
+                        s.rows = len(rows)
+                    committed += len(rows)
+                    if self.checkpoint:
+                        self.checkpoint.set(source_name, start_row + committed)
+            if not self.checkpoint:
+                self.conn.commit()   # nothing records partial progress, so the file commits all or nothing
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        if self.checkpoint:
+            self.checkpoint.clear(source_name)
+        elapsed = max(time.monotonic() - started, 1e-9)
+        print(f"⚡ Loaded {committed} rows from {source_name} in {elapsed:.1f}s ({committed / elapsed:,.0f} rows/sec)")
+        return committed
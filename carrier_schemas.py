@@ -0,0 +1,105 @@
+# carrier_schemas.py
+# Shared column layouts for the usps_ebill_prod / ups_ebill_prod gold tables.
+# Used by v7 for column checks and validation and by the v6 Parquet writer to type the silver layer.
+
+from collections import namedtuple
+
+# USPS expected columns (lowercase)
+usps_cols = [
+    "controlno", "childid", "trackingnumber", "invoicenumber", "invoicedate", "shipdate",
+    "length", "height", "width", "dimuom", "servicelevel", "shippernumber",
+    "originzip", "destinationzip", "zone", "billedweight_lb", "weightunit",
+    "packagecharge", "fuelsurcharge", "residentialsurcharge", "dascharge", "totalcharge",
+    "accessorialcode", "accessorialdescription", "packagestatus", "receivername",
+    "receivercity", "receiverstate", "receivercountry"
+]
+
+# UPS expected columns (match ups_ebill_prod)
+ups_cols = [
+    "Lead Shipment Number", "ControlNo", "ChildID", "BillToAccountNo", "InvoiceDt", "Bill Option Code",
+    "Container Type", "Transaction Date", "Package Quantity", "Sender Country", "Receiver Country",
+    "Charge Category Code", "Charge Classification Code", "Charge Category Detail Code",
+    "Charge Description", "Zone", "Billed Weight", "Billed Weight Unit of Measure",
+    "Billed Weight Type", "Net Amount", "Incentive Amount", "Tracking Number",
+    "Sender State", "Receiver State", "Invoice Currency Code"
+]
+
+# Date layouts accepted in invoice files, tried in order
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%Y%m%d", "%Y-%m-%d %H:%M:%S"]
+
+# Declared type of one gold column. kind: "int" (SQL INT), "decimal" (precision, scale), "date" (one of DATE_FORMATS)
+# or "str" (max length). Rows with a missing value in a nullable=False column are rejected, not inserted.
+ColumnSpec = namedtuple("ColumnSpec", ["kind", "nullable", "precision", "scale", "length"])
+
+
+def _int(nullable=True):
+    return ColumnSpec("int", nullable, None, None, None)
+
+
+def _decimal(precision=18, scale=2, nullable=True):
+    return ColumnSpec("decimal", nullable, precision, scale, None)
+
+
+def _date(nullable=True):
+    return ColumnSpec("date", nullable, None, None, None)
+
+
+def _str(length, nullable=True):
+    return ColumnSpec("str", nullable, None, None, length)
+
+
+# Schema registry for usps_ebill_prod / ups_ebill_prod, keyed by gold column name; keep in step with the table DDL.
+# Zips, zones and account/tracking numbers are strings so leading zeros survive.
+USPS_SCHEMA = {
+    "controlno": _int(nullable=False), "childid": _int(nullable=False),
+    "trackingnumber": _str(50, nullable=False), "invoicenumber": _str(50),
+    "invoicedate": _date(), "shipdate": _date(),
+    "length": _decimal(10, 2), "height": _decimal(10, 2), "width": _decimal(10, 2), "dimuom": _str(10),
+    "servicelevel": _str(100), "shippernumber": _str(50),
+    "originzip": _str(10), "destinationzip": _str(10), "zone": _str(10),
+    "billedweight_lb": _decimal(10, 2), "weightunit": _str(10),
+    "packagecharge": _decimal(), "fuelsurcharge": _decimal(), "residentialsurcharge": _decimal(),
+    "dascharge": _decimal(), "totalcharge": _decimal(),
+    "accessorialcode": _str(50), "accessorialdescription": _str(255), "packagestatus": _str(50),
+    "receivername": _str(255), "receivercity": _str(100), "receiverstate": _str(50), "receivercountry": _str(50),
+}
+
+UPS_SCHEMA = {
+    "Lead Shipment Number": _str(50), "ControlNo": _int(nullable=False), "ChildID": _int(nullable=False),
+    "BillToAccountNo": _str(50), "InvoiceDt": _date(), "Bill Option Code": _str(10),
+    "Container Type": _str(10), "Transaction Date": _date(), "Package Quantity": _int(),
+    "Sender Country": _str(50), "Receiver Country": _str(50),
+    "Charge Category Code": _str(10), "Charge Classification Code": _str(10), "Charge Category Detail Code": _str(10),
+    "Charge Description": _str(255), "Zone": _str(10), "Billed Weight": _decimal(10, 2),
+    "Billed Weight Unit of Measure": _str(10), "Billed Weight Type": _str(10),
+    "Net Amount": _decimal(), "Incentive Amount": _decimal(), "Tracking Number": _str(50),
+    "Sender State": _str(50), "Receiver State": _str(50), "Invoice Currency Code": _str(10),
+}
+
+# Coarse kinds for the Parquet writer and the benchmark stand-ins
+_KINDS = {"int": "int", "decimal": "float", "date": "date", "str": "str"}
+
+# v6 writes these names into the transformed files; v7 renames them for the gold tables
+TRANSFORMED_RENAMES = {"clientid": "ChildID", "controlno": "ControlNo"}
+
+
+# Maps a transformed-file column name to its gold column name (USPS gold columns are lowercase)
+def gold_column_name(carrier, name):
+    name = TRANSFORMED_RENAMES.get(name.strip(), name.strip())
+    return name.lower() if carrier == "USPS" else name
+
+
+def gold_columns(carrier):
+    return usps_cols if carrier == "USPS" else ups_cols
+
+
+# Gold column name -> ColumnSpec, in insert order
+def gold_schema(carrier):
+    schema = USPS_SCHEMA if carrier == "USPS" else UPS_SCHEMA
+    return {name: schema[name] for name in gold_columns(carrier)}
+
+
+# "int", "float", "date" or "str" for a transformed-file column; columns outside the schema are strings
+def column_kind(carrier, name):
+    spec = (USPS_SCHEMA if carrier == "USPS" else UPS_SCHEMA).get(gold_column_name(carrier, name))
+    return _KINDS[spec.kind] if spec else "str"
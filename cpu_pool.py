@@ -0,0 +1,163 @@
+# cpu_pool.py
+# Process pool for the CPU-bound part of ingest (SHA-256, record counting and the column-injecting CSV transform), so a busy day
+# uses every core instead of one GIL.
+# 🎯 Key features:
+# - File payloads travel through multiprocessing.shared_memory: the parent copies each file into a block once, workers
+#   attach to it by name and write their output into a block of their own; only names and sizes are pickled
+# - SharedBuffer looks like a SpooledFile (view/windows/reader/nbytes/close), so uploads, Parquet conversion and
+#   release_job work on it unchanged; close() also unlinks the block
+# - Worker count comes from CPU_POOL_WORKERS (0 = off, everything stays on threads); workers are started once and
+#   reused for the whole run
+# - Spooled (oversized) files are not copied into shared memory; they keep the windowed thread path
+
+import os
+import hashlib
+import threading
+import multiprocessing
+from multiprocessing import shared_memory, util
+from concurrent.futures import ProcessPoolExecutor
+from spool import ViewReader, SPOOL_WINDOW_BYTES
+from csv_transform import count_records
+
+# CPU pool config
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", 0))                    # 0 = off; e.g. the number of vCPUs
+CPU_POOL_START_METHOD = os.getenv("CPU_POOL_START_METHOD", "spawn")         # spawn: workers never inherit locks held by pipeline threads
+
+
+# A shared-memory block holding one payload; nbytes may be smaller than the block (blocks are never zero-sized)
+class SharedBuffer:
+    def __init__(self, shm, nbytes):
+        self.shm = shm
+        self.nbytes = nbytes
+        self._view = shm.buf[:nbytes].toreadonly()
+
+    @classmethod
+    def copy_of(cls, data):
+        view = memoryview(data).cast("B")
+        shm = shared_memory.SharedMemory(create=True, size=max(view.nbytes, 1))
+        shm.buf[:view.nbytes] = view
+        return cls(shm, view.nbytes)
+
+    @classmethod
+    def attach(cls, name, nbytes):
+        return cls(shared_memory.SharedMemory(name=name), nbytes)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def spooled(self):
+        return False
+
+    def __len__(self):
+        return self.nbytes
+
+    def view(self):
+        return self._view
+
+    def windows(self, size=SPOOL_WINDOW_BYTES):
+        for offset in range(0, self.nbytes, size):
+            yield self._view[offset:offset + size]
+
+    def reader(self):
+        return ViewReader(self._view)
+
+    # Drops this process's mapping; the owner also unlinks, which frees the block once every mapping is gone
+    def close(self, unlink=True):
+        if self.shm is None:
+            return
+        try:
+            self._view.release()
+            self.shm.close()
+        except BufferError:
+            pass   # a reader still holds a slice; the mapping goes away with its last reference
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.shm = None
+
+
+# --- Worker side: module-level so the spawned processes can import them ---
+
+# (SHA-256, record count) of the shared input
+def _inspect_shared(name, nbytes):
+    source = SharedBuffer.attach(name, nbytes)
+    try:
+        return hashlib.sha256(source.view()).hexdigest(), count_records(source.windows())
+    finally:
+        source.close(unlink=False)
+
+
+# Runs a (pickled, fresh) CsvColumnInjector over the shared input and returns (output block name, size, records)
+def _transform_shared(name, nbytes, injector):
+    source = SharedBuffer.attach(name, nbytes)
+    try:
+        parts = [injector.feed(window) for window in source.windows()]
+        parts.append(injector.finish())
+    finally:
+        source.close(unlink=False)
+    output = SharedBuffer.copy_of(b"".join(parts))
+    name, nbytes = output.name, output.nbytes
+    output.close(unlink=False)   # the parent attaches by name and owns the block from here on
+    return name, nbytes, injector.records
+
+
+def _ready(_):
+    return os.getpid()
+
+
+class CpuPool:
+    def __init__(self, workers=None, start_method=None):
+        self.workers = workers or CPU_POOL_WORKERS
+        context = multiprocessing.get_context(start_method or CPU_POOL_START_METHOD)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    # Starts every worker now, so the first files of a run do not pay for process start-up
+    def warm_up(self):
+        list(self._executor.map(_ready, range(self.workers)))
+        return self
+
+    # Copies a payload into shared memory once; the returned buffer can stand in for the original spool
+    def share(self, data):
+        return SharedBuffer.copy_of(data)
+
+    # (SHA-256, record count), what control_master needs before the file is transformed
+    def inspect(self, shared):
+        return self._executor.submit(_inspect_shared, shared.name, shared.nbytes).result()
+
+    # Returns (SharedBuffer with the transformed bytes, record count); the injector is used as a template only
+    def transform(self, shared, injector):
+        name, nbytes, records = self._executor.submit(_transform_shared, shared.name, shared.nbytes, injector).result()
+        return SharedBuffer.attach(name, nbytes), records
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# The process-wide pool, started on first use; None when CPU_POOL_WORKERS is 0
+def get_cpu_pool():
+    global _pool
+    if CPU_POOL_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = CpuPool().warm_up()
+            # Also shut the workers down when a multiprocessing child exits without calling close_cpu_pool(): that exit
+            # path joins child processes before concurrent.futures' own exit hook would tell them to stop
+            util.Finalize(None, close_cpu_pool, exitpriority=10)
+        return _pool
+
+
+def close_cpu_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,170 @@
+# csv_transform.py
+# Streaming CSV transform that adds constant per-file columns without parsing or re-serializing the data.
+# 🎯 Key features:
+# - Rewrites the header and prefixes/suffixes every record with the constant controlno/clientid/carrier values
+# - Source fields are passed through byte for byte, so numbers, dates and leading zeros are never reformatted
+# - Works chunk by chunk (quote-aware across chunk boundaries) and counts records in the same pass
+# - CsvRecordCounter gives the same record count without producing any output, so a file can be registered first
+# - Quote-free chunks take a bulk bytes.replace fast path; only chunks containing quotes are walked record by record
+# - Output is always UTF-8, as the silver readers expect: source text in another encoding (v6 reads client drops as
+#   ISO-8859-1) is transcoded chunk by chunk, ASCII chunks pass through untouched, and a UTF-8 BOM marks the source
+#   as UTF-8 already
+
+import codecs
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+
+def _csv_field(value):
+    text = str(value)
+    if any(c in text for c in ',"\r\n'):
+        text = '"' + text.replace('"', '""') + '"'
+    return text.encode("utf-8")
+
+
+# Finds the end of the record starting at pos (index just past its newline), ignoring newlines inside quotes
+def _record_end(data, pos):
+    search = pos
+    quotes = 0
+    while True:
+        nl = data.find(b"\n", search)
+        if nl == -1:
+            return -1
+        quotes += data.count(b'"', search, nl)
+        if quotes % 2 == 0:
+            return nl + 1
+        search = nl + 1
+
+
+class CsvColumnInjector:
+    def __init__(self, prefix_columns=(), suffix_columns=(), encoding="utf-8"):
+        # prefix_columns / suffix_columns: sequences of (column name, constant value); encoding is the source's
+        self.encoding = encoding
+        self._header_prefix = b"".join(_csv_field(name) + b"," for name, _ in prefix_columns)
+        self._header_suffix = b"".join(b"," + _csv_field(name) for name, _ in suffix_columns)
+        self._row_prefix = b"".join(_csv_field(value) + b"," for _, value in prefix_columns)
+        self._row_suffix = b"".join(b"," + _csv_field(value) for _, value in suffix_columns)
+        self._decoder = self._transcode = None   # decided on the first bytes, so a fresh injector still pickles for the CPU pool
+        self._head = b""                          # first bytes held back until there are enough to look for a BOM
+        self._carry = b""
+        self._header_done = False
+        self._eol = b"\n"
+        self.records = 0
+
+    def _rewrite(self, record, header=False):
+        if record.endswith(b"\r\n"):
+            body, eol = record[:-2], b"\r\n"
+        elif record.endswith(b"\n"):
+            body, eol = record[:-1], b"\n"
+        else:
+            body, eol = record, b""
+        if header:
+            bom = UTF8_BOM if body.startswith(UTF8_BOM) else b""
+            return bom + self._header_prefix + body[len(bom):] + self._header_suffix + eol
+        return self._row_prefix + body + self._row_suffix + eol
+
+    # Pieces of the rewritten run of complete lines data[start:end], which _is_simple has accepted
+    def _rewrite_block(self, data, start, end):
+        body = data[start:end - len(self._eol)]
+        return (self._row_prefix,
+                body.replace(self._eol, self._row_suffix + self._eol + self._row_prefix),
+                self._row_suffix + self._eol)
+
+    # A run of complete lines can be rewritten in bulk when it has no quotes, no blank lines and one line-ending style
+    def _is_simple(self, data, start, end):
+        eol = self._eol
+        if data.find(b'"', start, end) != -1 or data.startswith(eol, start) or data.find(eol + eol, start, end) != -1:
+            return False
+        if eol == b"\r\n":
+            return data.count(b"\r\n", start, end) == data.count(b"\n", start, end)
+        return data.find(b"\r", start, end) == -1
+
+    # Source bytes -> UTF-8 bytes; the decoder keeps any multi-byte sequence split across chunks for the next one
+    def _to_utf8(self, chunk, final=False):
+        if self._transcode is None:
+            chunk, self._head = self._head + chunk, b""
+            if len(chunk) < len(UTF8_BOM) and not final:
+                self._head = chunk   # too short to tell whether it starts with a BOM
+                return b""
+            source = "utf-8" if chunk.startswith(UTF8_BOM) else self.encoding
+            self._transcode = codecs.lookup(source).name != "utf-8"
+            if self._transcode:
+                self._decoder = codecs.getincrementaldecoder(source)()
+        if not self._transcode or (chunk.isascii() and not self._decoder.getstate()[0]):
+            return chunk
+        return self._decoder.decode(chunk, final).encode("utf-8")
+
+    def feed(self, chunk):
+        chunk = self._to_utf8(bytes(chunk))
+        data = self._carry + chunk if self._carry else chunk
+        out = []
+        pos = 0
+
+        if not self._header_done:
+            end = _record_end(data, 0)
+            if end == -1:
+                self._carry = data
+                return b""
+            header = data[:end]
+            self._eol = b"\r\n" if header.endswith(b"\r\n") else b"\n"
+            out.append(self._rewrite(header, header=True))
+            self._header_done = True
+            pos = end
+
+        block_end = data.rfind(b"\n", pos) + 1
+        if block_end > pos and self._is_simple(data, pos, block_end):
+            out.extend(self._rewrite_block(data, pos, block_end))
+            self.records += data.count(b"\n", pos, block_end)
+            pos = block_end
+        else:
+            while True:
+                end = _record_end(data, pos)
+                if end == -1:
+                    break
+                record = data[pos:end]
+                if record.strip(b"\r\n"):     # blank lines are dropped, as pandas did
+                    out.append(self._rewrite(record))
+                    self.records += 1
+                pos = end
+
+        self._carry = data[pos:]
+        return b"".join(out)
+
+    # Flushes a last record that has no trailing newline
+    def finish(self):
+        record, self._carry = self._carry + self._to_utf8(b"", final=True), b""
+        if not record.strip(b"\r\n"):
+            return b""
+        if not self._header_done:
+            self._header_done = True
+            return self._rewrite(record, header=True)
+        self.records += 1
+        return self._rewrite(record)
+
+
+# Counts records exactly as CsvColumnInjector would (header excluded, blank lines dropped, quote-aware) without
+# building any output; v6 uses it to register a file, and get its ControlNo, before the transform
+class CsvRecordCounter(CsvColumnInjector):
+    def _to_utf8(self, chunk, final=False):
+        return chunk   # transcoding never changes where records end
+
+    def _rewrite(self, record, header=False):
+        return b""
+
+    def _rewrite_block(self, data, start, end):
+        return ()
+
+
+def count_records(windows):
+    counter = CsvRecordCounter()
+    for window in windows:
+        counter.feed(window)
+    counter.finish()
+    return counter.records
+
+
+# Convenience wrapper for data that is already in memory; returns (transformed bytes, record count)
+def inject_columns(data, prefix_columns=(), suffix_columns=(), encoding="utf-8"):
+    injector = CsvColumnInjector(prefix_columns, suffix_columns, encoding)
+    transformed = injector.feed(data) + injector.finish()
+    return transformed, injector.records
@@ -0,0 +1,192 @@
+# file_pipeline.py
+# Bounded multi-stage worker pipeline used to overlap SFTP downloads, CPU transforms and Blob/SQL uploads.
+# 🎯 Key features:
+# - Each stage has its own worker pool and a bounded input queue, so a slow stage pushes back on the ones before it
+# - Per-worker resources (e.g. one SFTP channel per download worker) via init/teardown hooks
+# - Batching stages collect up to batch_size items (waiting at most linger seconds) and handle them in one call;
+#   a batch is sent early once the stages before it hold nothing more, so a small drop never waits out the linger
+# - A failing item is recorded and skipped; the rest of the batch keeps flowing. A batch call that raises fails the
+#   whole batch, while one that returns an exception in an item's place fails just that item
+# - Ordered stages hand results on in the order their items arrived, whichever worker finishes first
+
+import time
+import queue
+import threading
+
+_DONE = object()
+_DRAIN_POLL_SECONDS = 0.01   # how often a lingering batch checks whether anything is still coming
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, queue_size=4, init=None, teardown=None, batch_size=1, linger=0.0, ordered=False):
+        self.name = name
+        self.fn = fn                  # fn(item) or fn(resource, item) when init is given; returning None drops the item
+        self.workers = workers
+        self.queue_size = queue_size
+        self.init = init
+        self.teardown = teardown
+        self.batch_size = batch_size  # > 1: fn receives a list of items and returns one result per item, in order
+        self.linger = linger
+        self.ordered = ordered        # True: results leave in arrival order (dropped or failed items just give up their turn)
+
+
+# Arrival tickets for an ordered stage: taking from the inbox and drawing a ticket happen under one lock,
+# and a worker may only pass results on once every earlier ticket has been released
+class _Turns:
+    def __init__(self):
+        self.take_lock = threading.Lock()
+        self._issued = 0
+        self._next = 0
+        self._turn = threading.Condition()
+
+    def issue(self):
+        ticket = self._issued
+        self._issued += 1
+        return ticket
+
+    def wait(self, ticket):
+        with self._turn:
+            while self._next != ticket:
+                self._turn.wait()
+
+    def release(self):
+        with self._turn:
+            self._next += 1
+            self._turn.notify_all()
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = stages
+        self.results = []
+        self.errors = []
+        self._lock = threading.Lock()
+        self._feeding = False
+        self._in_stage = [0] * len(stages)   # items queued for or being handled by each stage
+
+    # True while an item may still reach stage index: one is being fed in or sits in an earlier stage
+    def _upstream_busy(self, index):
+        with self._lock:
+            return self._feeding or any(self._in_stage[:index])
+
+    def _take(self, inbox, stage, index):
+        item = inbox.get()
+        if item is _DONE:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + stage.linger
+        while len(batch) < stage.batch_size:
+            try:
+                item = inbox.get(timeout=min(max(deadline - time.monotonic(), 0.001), _DRAIN_POLL_SECONDS))
+            except queue.Empty:
+                if time.monotonic() >= deadline or not self._upstream_busy(index):
+                    break
+                continue
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _handle(self, stage, resource, init_error, batch):
+        args = (resource,) if stage.init else ()
+        try:
+            if init_error:
+                raise init_error
+            if stage.batch_size > 1:
+                return stage.fn(*args, batch)
+            return [stage.fn(*args, batch[0])]
+        except Exception as e:
+            with self._lock:
+                self.errors.extend((stage.name, item, e) for item in batch)
+            return []
+
+    # Passes a batch's results on, then stops counting the batch as in the stage (in that order, so a lingering
+    # stage downstream never sees everything upstream as empty while a result is on its way to it)
+    def _emit(self, index, batch, results, outbox):
+        for item, result in zip(batch, results):
+            if result is None:
+                continue
+            if isinstance(result, Exception):
+                with self._lock:
+                    self.errors.append((self.stages[index].name, item, result))
+                continue
+            if outbox is None:
+                with self._lock:
+                    self.results.append(result)
+            else:
+                with self._lock:
+                    self._in_stage[index + 1] += 1
+                outbox.put(result)
+        with self._lock:
+            self._in_stage[index] -= len(batch)
+
+    def _worker(self, index, inbox, outbox, remaining, turns):
+        stage = self.stages[index]
+        resource = None
+        init_error = None
+        try:
+            if stage.init:
+                resource = stage.init()
+        except Exception as e:
+            init_error = e   # keep draining the inbox so upstream stages never block on a dead worker
+        try:
+            done = False
+            while not done:
+                if turns is None:
+                    batch, done = self._take(inbox, stage, index)
+                    if batch:
+                        self._emit(index, batch, self._handle(stage, resource, init_error, batch), outbox)
+                    continue
+                with turns.take_lock:
+                    batch, done = self._take(inbox, stage, index)
+                    ticket = turns.issue() if batch else None
+                if batch:
+                    results = self._handle(stage, resource, init_error, batch)
+                    turns.wait(ticket)
+                    try:
+                        self._emit(index, batch, results, outbox)
+                    finally:
+                        turns.release()
+        finally:
+            if stage.teardown and resource is not None:
+                stage.teardown(resource)
+            # The last worker of a stage to finish tells the next stage there is nothing more coming
+            with self._lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and outbox is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    outbox.put(_DONE)
+
+    def run(self, items):
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        turns = [_Turns() if stage.ordered else None for stage in self.stages]
+        threads = []
+        for index, stage in enumerate(self.stages):
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(index, queues[index], outbox, remaining, turns[index]),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        self._feeding = True
+        try:
+            for item in items:
+                with self._lock:
+                    self._in_stage[0] += 1
+                queues[0].put(item)   # blocks while the first stage is saturated
+        finally:
+            with self._lock:
+                self._feeding = False
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_DONE)
+
+        for thread in threads:
+            thread.join()
+        return self.results, self.errors
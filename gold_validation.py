@@ -0,0 +1,188 @@
+# gold_validation.py
+# Vectorized validation and coercion of gold-table DataFrames against the schema registry in carrier_schemas.
+# 🎯 Key features:
+# - Every column is converted to its declared type in one pandas operation (to_numeric, to_datetime per format,
+#   .str.len()), never value by value
+# - Rows with an unparseable value, a value out of precision/length, or a missing required value are split off
+#   with a reject_reason naming the offending columns, instead of failing the whole file mid-executemany
+# - Clean frames come back with typed columns, ready for BulkLoader's typed path (gold_input_sizes); decimal columns
+#   hold validated decimal text (the source text, or exact digits at the declared scale), so amounts reach DECIMAL
+#   without passing through binary floats
+
+from decimal import Context, Decimal, InvalidOperation, ROUND_HALF_UP
+import numpy as np
+import pandas as pd
+import pyodbc
+from carrier_schemas import gold_schema, DATE_FORMATS
+
+REJECT_REASON_COLUMN = "reject_reason"
+
+_INT_MIN, _INT_MAX = -2 ** 31, 2 ** 31 - 1   # SQL INT
+_DECIMAL_CONTEXT = Context(prec=38, rounding=ROUND_HALF_UP)   # SQL DECIMAL's max precision; rounds like SQL Server
+_LIMIT_MARGIN = 1e-9   # relative band around a precision limit that float64 cannot settle
+_EXACT_FLOAT = 2 ** 50   # scaled values below this are parsed to well within half a unit
+_PLAIN_CHARS = frozenset("0123456789.+-\0")
+
+
+def _text(col):
+    return col.astype("string").str.strip() if not pd.api.types.is_string_dtype(col) else col.str.strip()
+
+
+def _numbers(col):
+    if pd.api.types.is_numeric_dtype(col):
+        return col.astype("float64")
+    return pd.to_numeric(_text(col), errors="coerce").astype("float64")
+
+
+def _coerce_int(col, spec):
+    present = col.notna().to_numpy()
+    num = _numbers(col)
+    invalid = present & ~(num.notna() & (num % 1 == 0) & num.between(_INT_MIN, _INT_MAX)).to_numpy()
+    return num.where(~invalid).astype("Int64"), invalid
+
+
+# Integer amounts in units of 10 ** -scale as decimal text (-1234 at scale 2 -> "-12.34"), with numpy string ops
+def _scaled_text(units, scale):
+    magnitude = np.abs(units)
+    text = (magnitude // 10 ** scale).astype(str)
+    if scale:
+        # 10 ** scale + remainder is "1" followed by exactly `scale` digits; its "1" becomes the point
+        places = np.strings.replace((magnitude % 10 ** scale + 10 ** scale).astype(str), "1", ".", 1)
+        text = np.strings.add(text, places)
+    return np.strings.add(np.where(units < 0, "-", ""), text).astype(object)
+
+
+# (mask, text): which values are plain "[+-]digits[.digits]" text SQL Server converts as is (no exponent, separators
+# or spaces), and the values as str; one scan of the joined column settles the usual case where every value is
+def _plain_text(values):
+    try:
+        if set("\0".join(values)) <= _PLAIN_CHARS:
+            return np.ones(len(values), dtype=bool), values
+    except TypeError:
+        pass   # not all str, e.g. floats in an object column
+    text = values.astype(np.dtypes.StringDType())
+    return np.strings.str_len(np.strings.strip(text, "0123456789.+-")) == 0, text.astype(object)
+
+
+# The one value the vectorized checks could not settle, rounded half-up to the scale; None if it does not fit
+def _exact_decimal(value, quantum, limit):
+    try:
+        exact = Decimal(str(value).strip()).quantize(quantum, context=_DECIMAL_CONTEXT)
+    except (InvalidOperation, ValueError):
+        return None
+    return format(exact, "f") if exact.is_finite() and abs(exact) < limit else None
+
+
+# Range and scale are checked vectorized on float64: the magnitude against the precision limit, and the value scaled
+# to integer units of the scale. Text that passes and is plain is bound as it is, numeric values as the digits of
+# their units. Only values with more places than the scale, unusual notation, or a magnitude right at the limit are
+# settled one by one with Decimal
+def _coerce_decimal(col, spec):
+    present = col.notna().to_numpy()
+    limit = 10 ** (spec.precision - spec.scale)
+    numeric = pd.api.types.is_numeric_dtype(col)
+    source = col.to_numpy(dtype=object) if not numeric else col.to_numpy(dtype=np.float64, na_value=np.nan)
+    if numeric:
+        num = source
+    else:
+        source = np.where(present, source, "nan")
+        try:
+            num = source.astype(np.float64)   # one C pass while every value parses, which is the normal case
+        except (TypeError, ValueError):
+            num = pd.to_numeric(pd.Series(source), errors="coerce").to_numpy(dtype=np.float64)
+
+    finite = np.isfinite(num)
+    magnitude = np.abs(np.where(finite, num, 0))
+    scaled = np.where(finite, num, 0) * 10.0 ** spec.scale
+    units = np.round(scaled)
+    decided = (finite & (magnitude < limit * (1 - _LIMIT_MARGIN))
+               & (np.abs(scaled - units) < 1e-6) & (np.abs(units) < _EXACT_FLOAT))
+
+    values = np.full(len(col), None, dtype=object)
+    if numeric:
+        if decided.any():
+            values[decided] = _scaled_text(units[decided].astype(np.int64), spec.scale)
+    elif decided.any():
+        plain, text = _plain_text(source[decided])
+        values[np.flatnonzero(decided)[plain]] = text[plain]
+        decided[decided] = plain
+
+    settled = decided.copy()
+    undecided = present & finite & ~decided & (magnitude < limit * (1 + _LIMIT_MARGIN))
+    if undecided.any():
+        quantum = Decimal(1).scaleb(-spec.scale)
+        values[undecided] = [_exact_decimal(value, quantum, limit) for value in source[undecided]]
+        settled[undecided] = np.not_equal(values[undecided], None)
+    return pd.Series(values, index=col.index, dtype=object), present & ~settled
+
+
+def _coerce_date(col, spec):
+    present = col.notna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(col):
+        parsed = col
+    else:
+        text = _text(col)
+        parsed = pd.Series(pd.NaT, index=col.index, dtype="datetime64[ns]")
+        for fmt in DATE_FORMATS:
+            todo = parsed.isna().to_numpy() & present
+            if not todo.any():
+                break
+            parsed[todo] = pd.to_datetime(text[todo], format=fmt, errors="coerce")
+    invalid = present & parsed.isna().to_numpy()
+    return parsed, invalid
+
+
+def _coerce_str(col, spec):
+    if pd.api.types.is_float_dtype(col) and (col.dropna() % 1 == 0).all():
+        col = col.astype("Int64")   # e.g. 12345.0 from a numeric read stays "12345"
+    text = col.astype("string")
+    invalid = (text.str.len() > spec.length).fillna(False).to_numpy()
+    return text, invalid
+
+
+_COERCERS = {"int": _coerce_int, "decimal": _coerce_decimal, "date": _coerce_date, "str": _coerce_str}
+
+
+# Returns (clean, rejects): clean holds only the gold columns, typed per the schema; rejects holds the original
+# values of every failing row plus a reject_reason column ("col1;col2;")
+def coerce_gold_frame(df, carrier):
+    schema = gold_schema(carrier)
+    columns = {}
+    failures = []
+    for name, spec in schema.items():
+        values, invalid = _COERCERS[spec.kind](df[name], spec)
+        if not spec.nullable:
+            invalid = invalid | values.isna().to_numpy()
+        columns[name] = values
+        if invalid.any():
+            failures.append((name, invalid))
+
+    bad = np.zeros(len(df), dtype=bool)
+    for _, invalid in failures:
+        bad |= invalid
+    clean = pd.DataFrame(columns, index=df.index)
+    if not bad.any():
+        return clean, df.iloc[:0]
+
+    rejects = df.loc[bad].copy()
+    reasons = pd.Series("", index=df.index, dtype=object)
+    for name, invalid in failures:
+        reasons[invalid] += f"{name};"
+    rejects[REJECT_REASON_COLUMN] = reasons[bad]
+    return clean.loc[~bad], rejects
+
+
+def _input_size(spec):
+    if spec.kind == "int":
+        return (pyodbc.SQL_INTEGER, 0, 0)
+    if spec.kind == "decimal":
+        return (pyodbc.SQL_DECIMAL, spec.precision, spec.scale)   # bound from the validated text, converted exactly
+    if spec.kind == "date":
+        return (pyodbc.SQL_TYPE_TIMESTAMP, 0, 0)
+    return (pyodbc.SQL_WVARCHAR, spec.length, 0)
+
+
+# cursor.setinputsizes() list for a carrier's insert, so fast_executemany binds each column once with its declared
+# type instead of guessing from the first row and re-binding whenever a later row's Python type differs
+def gold_input_sizes(carrier):
+    return [_input_size(spec) for spec in gold_schema(carrier).values()]
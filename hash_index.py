@@ -0,0 +1,92 @@
+# hash_index.py
+# Content-hash dedup cache, so identical invoices are skipped even when a client re-uploads them under a new name.
+# 🎯 Key features:
+# - Maps (ClientID, SHA-256) to the file that first loaded that content; preloaded from control_master.FileHash
+# - Remembers the SFTP stat fingerprint (size + mtime) of every hashed file. A file listed again under the name that
+#   loaded it is recognised from the listing alone; under another name the fingerprint only flags a likely copy, and
+#   the file is skipped once its FileHash confirms it
+# - Persisted as JSON at HASH_INDEX_PATH between runs; lookups are dict hits under a lock
+
+import os
+import json
+import threading
+
+# Hash index config
+HASH_INDEX_PATH = os.getenv("HASH_INDEX_PATH")   # unset = rebuilt from control_master every run
+
+
+class HashIndex:
+    def __init__(self, path=HASH_INDEX_PATH):
+        self.path = path
+        self.hashes = {}          # "clientid:sha256" -> filename that loaded it
+        self.fingerprints = {}    # "clientid:size:mtime" -> sha256
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @staticmethod
+    def _hash_key(clientid, file_hash):
+        return f"{clientid}:{file_hash}"
+
+    @staticmethod
+    def _fingerprint_key(clientid, size, mtime):
+        return f"{clientid}:{int(size)}:{int(mtime)}"
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    snapshot = json.load(f)
+                self.hashes = snapshot.get("hashes", {})
+                self.fingerprints = snapshot.get("fingerprints", {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Ignoring unreadable hash index {self.path}: {e}")
+        return self
+
+    # Adds every FileHash already in control_master; files loaded by other hosts or older runs count as known
+    def preload_from_sql(self, pool):
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT ClientID, FileName, FileHash FROM control_master WHERE FileHash IS NOT NULL")
+            rows = cursor.fetchall()
+            cursor.close()
+        with self._lock:
+            for clientid, filename, file_hash in rows:
+                self.hashes.setdefault(self._hash_key(clientid, file_hash), filename)
+        print(f"🧬 Hash index holds {len(self.hashes)} known files ({len(rows)} from control_master)")
+        return self
+
+    # Name of the file that already loaded this content, or None
+    def lookup(self, clientid, file_hash):
+        with self._lock:
+            return self.hashes.get(self._hash_key(clientid, file_hash))
+
+    # Name of the already loaded file whose content a remote file with this size and mtime had, or None.
+    # Size + mtime (seconds) is a heuristic that different files share easily, so only a match on the same file name
+    # is safe to act on without reading the content.
+    def match_fingerprint(self, clientid, size, mtime):
+        with self._lock:
+            file_hash = self.fingerprints.get(self._fingerprint_key(clientid, size, mtime))
+            return self.hashes.get(self._hash_key(clientid, file_hash)) if file_hash else None
+
+    # Records the content (and the file's fingerprint) and returns the name of the file that owns it: filename itself
+    # if the content is new, otherwise the file that loaded it first. Atomic, so concurrent duplicates have one winner.
+    def add(self, clientid, file_hash, filename, size=None, mtime=None):
+        with self._lock:
+            owner = self.hashes.setdefault(self._hash_key(clientid, file_hash), filename)
+            if size is not None and mtime is not None:
+                self.fingerprints[self._fingerprint_key(clientid, size, mtime)] = file_hash
+            return owner
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"hashes": self.hashes, "fingerprints": self.fingerprints}, f)
+        os.replace(tmp_path, self.path)
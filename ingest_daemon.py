@@ -0,0 +1,145 @@
+# ingest_daemon.py
+# Single long-running entry point for the v6 SFTP ingest and the v7 gold load, instead of one cron process per run.
+# 🎯 Key features:
+# - Cold start is paid once: imports, Blob clients, the SQL wake-up, the hash index, SFTP sessions, manifests,
+#   blob inventories and the CPU pool are set up on first use and reused by every later cycle
+# - v6 and v7 cycles run on their own intervals (DAEMON_V6_INTERVAL_SECONDS / DAEMON_V7_INTERVAL_SECONDS); a cycle
+#   that overruns its interval is followed by the next one straight away, never by a pile-up
+# - Each cycle is its own metrics run, so the summary and Prometheus export describe one poll; v6 and v7 export to
+#   their own files (see pipeline_metrics.prom_path_for)
+# - A failing cycle is reported and tried again at its next interval; the daemon keeps running
+# - SIGTERM / SIGINT let the running cycle finish, then pools and sessions are closed
+#
+# Usage: python ingest_daemon.py [--once] [--jobs v6,v7]   (same .env as v6 and v7)
+
+import os
+import time
+import signal
+import argparse
+import threading
+from pipeline_metrics import start_run, get_metrics
+from hash_index import HashIndex
+from blob_watermark import BlobWatermark
+from sql_pool import get_pool, close_all_pools
+from sftp_sessions import close_all_sessions
+from cpu_pool import close_cpu_pool
+
+# Daemon config
+DAEMON_JOBS = os.getenv("DAEMON_JOBS", "v6,v7")
+DAEMON_V6_INTERVAL_SECONDS = float(os.getenv("DAEMON_V6_INTERVAL_SECONDS", 300))
+DAEMON_V7_INTERVAL_SECONDS = float(os.getenv("DAEMON_V7_INTERVAL_SECONDS", 600))
+DAEMON_HASH_INDEX_REFRESH_SECONDS = float(os.getenv("DAEMON_HASH_INDEX_REFRESH_SECONDS", 3600))   # re-read control_master.FileHash
+
+
+# v6: SFTP -> control_master -> transform -> Blob, with the hash index kept in memory between polls
+class IngestJob:
+    name = "v6"
+
+    def __init__(self, interval=DAEMON_V6_INTERVAL_SECONDS, hash_refresh=DAEMON_HASH_INDEX_REFRESH_SECONDS):
+        self.interval = interval
+        self.hash_refresh = hash_refresh
+        self.hash_index = None
+        self._preloaded_at = 0.0
+
+    def run(self):
+        import v6_insertcontrolno_into_controlmaster_sqltable as v6
+        if self.hash_index is None:
+            v6.wake_up_sql()
+            self.hash_index = HashIndex().load()
+        # Files loaded by other hosts only reach the index through control_master, so it is re-read now and then
+        if time.monotonic() - self._preloaded_at >= self.hash_refresh:
+            self.hash_index.preload_from_sql(get_pool())
+            self._preloaded_at = time.monotonic()
+        return v6.run_cycle(list(v6.CLIENTS), self.hash_index)
+
+
+# v7: transformed blobs -> gold tables, with the incremental watermark kept in memory between polls
+class GoldLoadJob:
+    name = "v7"
+
+    def __init__(self, interval=DAEMON_V7_INTERVAL_SECONDS):
+        self.interval = interval
+        self.watermark = None
+        self._started = False
+
+    def run(self):
+        import v7_bronze_to_gold_insert as v7
+        if not self._started:
+            self.watermark = BlobWatermark(v7.WATERMARK_PATH) if v7.WATERMARK_PATH else None
+            self._started = True
+        v7.run_cycle(self.watermark)
+
+
+JOBS = {"v6": IngestJob, "v7": GoldLoadJob}
+
+
+def run_job(job):
+    print(f"\n⏰ {job.name} cycle starting")
+    start_run(job.name)
+    started = time.monotonic()
+    try:
+        job.run()
+    except Exception as e:
+        print(f"❌ {job.name} cycle failed: {e}")
+    finally:
+        get_metrics().finish()
+    print(f"⏱️ {job.name} cycle took {time.monotonic() - started:.1f}s")
+
+
+# Runs every job when due until stop is set; with once=True, runs each job one time and returns
+def run_daemon(jobs, stop=None, once=False):
+    stop = stop or threading.Event()
+    due = {job.name: 0.0 for job in jobs}
+    while not stop.is_set():
+        for job in jobs:
+            if stop.is_set():
+                break
+            started = time.monotonic()
+            if due[job.name] <= started:
+                run_job(job)
+                due[job.name] = started + job.interval
+        if once:
+            return
+        wait = min(due.values()) - time.monotonic()
+        if wait > 0:
+            print(f"💤 Next cycle in {wait:.0f}s")
+            stop.wait(wait)
+
+
+def shutdown():
+    close_cpu_pool()
+    close_all_pools()
+    close_all_sessions()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running v6 ingest / v7 gold load daemon")
+    parser.add_argument("--jobs", default=DAEMON_JOBS, help="comma-separated subset of: " + ", ".join(JOBS))
+    parser.add_argument("--once", action="store_true", help="run each job once and exit (cron-style)")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.jobs.split(",") if name.strip()]
+    unknown = [name for name in names if name not in JOBS]
+    if unknown:
+        parser.error(f"unknown jobs: {', '.join(unknown)}")
+    jobs = [JOBS[name]() for name in names]
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"\n🛑 Received signal {signum}; stopping after the current cycle")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"🚀 Daemon starting: {', '.join(f'{job.name} every {job.interval:.0f}s' for job in jobs)}")
+    try:
+        run_daemon(jobs, stop, once=args.once)
+    finally:
+        shutdown()
+    print("👋 Daemon stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# parquet_io.py
+# Typed, compressed Parquet for the transformed (silver) container, and column-pruned reads for the gold loader.
+# 🎯 Key features:
+# - Column types come from carrier_schemas, so nothing is inferred and leading zeros in zips/accounts survive
+# - CSV is converted with pyarrow's streaming reader and written in row groups of PARQUET_ROW_GROUP_ROWS
+# - The gold loader reads only the carrier + gold columns and hands Arrow buffers to pandas without extra copies
+# - pyarrow is only imported when Parquet is actually used
+
+import os
+import io
+import csv
+from carrier_schemas import column_kind, gold_column_name, gold_columns, DATE_FORMATS
+
+# Parquet config
+PARQUET_ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", 128 * 1024))
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet support needs pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+# Decimal columns are float64 in silver: up to 15 significant digits the float's shortest repr is the original text,
+# which is what gold_validation rebuilds its Decimals from
+def _arrow_type(pa, kind):
+    return {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "date": pa.timestamp("s"),
+        "str": pa.string(),
+    }[kind]
+
+
+# The header line of a bytes-like CSV, copying only as much as needed to find it (csv_bytes may be an mmapped view)
+def _first_line(csv_bytes, probe=64 * 1024):
+    view = memoryview(csv_bytes)
+    for start in range(0, len(view), probe):
+        end = bytes(view[start:start + probe]).find(b"\n")
+        if end != -1:
+            return bytes(view[:start + end])
+    return bytes(view)
+
+
+# Converts transformed (UTF-8) CSV bytes (or a memoryview of them) to Parquet bytes;
+# raises pyarrow.ArrowInvalid if a value does not fit its column type
+def csv_to_parquet(csv_bytes, carrier, encoding="utf-8", row_group_rows=PARQUET_ROW_GROUP_ROWS, compression=PARQUET_COMPRESSION):
+    pa = _pyarrow()
+    header_line = _first_line(csv_bytes).decode(encoding)
+    header = next(csv.reader(io.StringIO(header_line)), [])
+    column_types = {name: _arrow_type(pa, column_kind(carrier, name)) for name in header}
+
+    reader = pa.csv.open_csv(
+        pa.BufferReader(csv_bytes),
+        read_options=pa.csv.ReadOptions(encoding=encoding),
+        convert_options=pa.csv.ConvertOptions(column_types=column_types, timestamp_parsers=DATE_FORMATS),
+    )
+    sink = pa.BufferOutputStream()
+    with pa.parquet.ParquetWriter(sink, reader.schema, compression=compression) as writer:
+        pending, pending_rows = [], 0
+        for batch in reader:
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_rows:
+                writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_rows)
+                pending, pending_rows = [], 0
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending), row_group_size=row_group_rows)
+    return sink.getvalue().to_pybytes()
+
+
+# Reads a silver Parquet file as a DataFrame holding only the carrier column and that carrier's gold columns
+def read_gold_frame(data):
+    pa = _pyarrow()
+    parquet_file = pa.parquet.ParquetFile(pa.BufferReader(data))
+    names = parquet_file.schema_arrow.names
+
+    carrier = None
+    if "carrier" in names:
+        carrier_column = parquet_file.read(columns=["carrier"]).column(0)
+        carrier = carrier_column[0].as_py() if len(carrier_column) else None
+
+    columns = None
+    if carrier in ("USPS", "UPS"):
+        wanted = set(gold_columns(carrier))
+        columns = [name for name in names if name == "carrier" or gold_column_name(carrier, name) in wanted]
+
+    table = parquet_file.read(columns=columns)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
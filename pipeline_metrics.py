@@ -0,0 +1,233 @@
+# pipeline_metrics.py
+# Structured per-stage instrumentation for the v6 ingest and v7 gold load.
+# 🎯 Key features:
+# - span(stage) context manager records wall time, bytes, rows, retries and errors for one unit of work
+# - The client is taken from bind_client() on the current thread, so low-level helpers need no extra arguments
+# - Spans stream to METRICS_JSONL_PATH as JSON lines; totals are written as Prometheus gauges of the last run to one
+#   file per run name next to METRICS_PROM_PATH (metrics.prom -> metrics_v6.prom, metrics_v7.prom)
+# - finish() prints a run summary attributing busy time per stage and wall time per client
+
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Metrics config
+METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH")   # one JSON line per span; unset = off
+METRICS_PROM_PATH = os.getenv("METRICS_PROM_PATH")     # e.g. a node_exporter textfile collector path, suffixed per run; unset = off
+METRICS_PREFIX = "sftptoblob"
+
+_local = threading.local()
+
+
+# Tags every span recorded on this thread with the client until the with-block ends
+@contextmanager
+def bind_client(client_name):
+    previous = getattr(_local, "client", None)
+    _local.client = client_name.lower() if client_name else None
+    try:
+        yield
+    finally:
+        _local.client = previous
+
+
+def current_client():
+    return getattr(_local, "client", None)
+
+
+class Span:
+    def __init__(self, stage, client, fields):
+        self.stage = stage
+        self.client = client
+        self.fields = fields
+        self.bytes = 0
+        self.rows = 0
+        self.retries = 0
+
+
+class _Totals:
+    __slots__ = ("spans", "seconds", "bytes", "rows", "retries", "errors", "first_start", "last_end")
+
+    def __init__(self):
+        self.spans = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.rows = 0
+        self.retries = 0
+        self.errors = 0
+        self.first_start = None
+        self.last_end = None
+
+    def add(self, started, ended, nbytes, rows, retries, error, counted=True):
+        self.spans += int(counted)
+        self.seconds += ended - started
+        self.bytes += nbytes
+        self.rows += rows
+        self.retries += retries
+        self.errors += int(error)
+        self.first_start = started if self.first_start is None else min(self.first_start, started)
+        self.last_end = ended if self.last_end is None else max(self.last_end, ended)
+
+
+# The run's own export file: the run name goes before the extension, so the textfile collector still picks it up
+def prom_path_for(run_name, path=METRICS_PROM_PATH):
+    if not path:
+        return None
+    root, ext = os.path.splitext(path)
+    return f"{root}_{run_name}{ext}"
+
+
+class RunMetrics:
+    def __init__(self, run_name, jsonl_path=METRICS_JSONL_PATH, prom_path=None):
+        self.run_name = run_name
+        self.run_id = uuid.uuid4().hex[:12]
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path or prom_path_for(run_name)
+        self.started = time.monotonic()
+        self.totals = {}               # (client, stage) -> _Totals
+        self._lock = threading.Lock()
+        self._jsonl = None
+
+    @contextmanager
+    def span(self, stage, client=None, **fields):
+        span = Span(stage, client or current_client(), fields)
+        started = time.monotonic()
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._record(span, started, time.monotonic(), error)
+
+    # Counts a retry outside any span (e.g. a reconnect inside a shared helper)
+    def retry(self, stage, client=None):
+        now = time.monotonic()
+        span = Span(stage, client or current_client(), {})
+        span.retries = 1
+        self._record(span, now, now, None, counted=False)
+
+    def _record(self, span, started, ended, error, counted=True):
+        key = (span.client or "-", span.stage)
+        with self._lock:
+            self.totals.setdefault(key, _Totals()).add(started, ended, span.bytes, span.rows, span.retries, error is not None, counted)
+            if self.jsonl_path:
+                if self._jsonl is None:
+                    self._jsonl = open(self.jsonl_path, "a", buffering=1)
+                self._jsonl.write(json.dumps({
+                    "ts": datetime.now(timezone.utc).isoformat(),
+                    "run": self.run_name,
+                    "run_id": self.run_id,
+                    "client": span.client,
+                    "stage": span.stage,
+                    "seconds": round(ended - started, 6),
+                    "bytes": span.bytes,
+                    "rows": span.rows,
+                    "retries": span.retries,
+                    "error": f"{type(error).__name__}: {error}" if error is not None else None,
+                    **span.fields,
+                }, default=str) + "\n")
+
+    # Totals start over with every run, so they are exported as gauges of the last run; as counters, each new run
+    # would read as a counter reset and break rate()
+    def prometheus_text(self):
+        metrics = [
+            ("spans", "Units of work completed per stage in the last run", lambda t: t.spans),
+            ("seconds", "Busy seconds spent per stage in the last run", lambda t: round(t.seconds, 6)),
+            ("bytes", "Bytes moved per stage in the last run", lambda t: t.bytes),
+            ("rows", "Rows handled per stage in the last run", lambda t: t.rows),
+            ("retries", "Retries per stage in the last run", lambda t: t.retries),
+            ("errors", "Failed units of work per stage in the last run", lambda t: t.errors),
+        ]
+        with self._lock:
+            totals = sorted(self.totals.items())
+        run = _label(self.run_name)
+        lines = []
+        for name, help_text, value in metrics:
+            lines.append(f"# HELP {METRICS_PREFIX}_stage_{name} {help_text}")
+            lines.append(f"# TYPE {METRICS_PREFIX}_stage_{name} gauge")
+            for (client, stage), t in totals:
+                lines.append(f'{METRICS_PREFIX}_stage_{name}{{run="{run}",client="{_label(client)}",stage="{_label(stage)}"}} {value(t)}')
+        lines.append(f"# HELP {METRICS_PREFIX}_run_wall_seconds Wall time of the last run")
+        lines.append(f"# TYPE {METRICS_PREFIX}_run_wall_seconds gauge")
+        lines.append(f'{METRICS_PREFIX}_run_wall_seconds{{run="{run}"}} {time.monotonic() - self.started:.3f}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def print_summary(self):
+        wall = time.monotonic() - self.started
+        with self._lock:
+            totals = dict(self.totals)
+
+        by_stage = {}
+        by_client = {}
+        for (client, stage), t in totals.items():
+            by_stage.setdefault(stage, []).append(t)
+            by_client.setdefault(client, {})[stage] = t
+
+        print(f"\n📊 Run summary ({self.run_name} {self.run_id}): {wall:.1f}s wall")
+        print(f"   {'stage':<16}{'spans':>7}{'busy s':>10}{'MB':>10}{'MB/s':>9}{'rows':>12}{'retries':>9}{'errors':>8}")
+        for stage, parts in sorted(by_stage.items(), key=lambda kv: -sum(t.seconds for t in kv[1])):
+            seconds = sum(t.seconds for t in parts)
+            mb = sum(t.bytes for t in parts) / (1024 * 1024)
+            print(f"   {stage:<16}{sum(t.spans for t in parts):>7}{seconds:>10.1f}{mb:>10.1f}"
+                  f"{(mb / seconds if seconds else 0):>9.1f}{sum(t.rows for t in parts):>12,}"
+                  f"{sum(t.retries for t in parts):>9}{sum(t.errors for t in parts):>8}")
+
+        # Stages overlap inside a client, so busy seconds can add up to more than the client's wall time
+        for client, stages in sorted(by_client.items()):
+            starts = [t.first_start for t in stages.values() if t.first_start is not None]
+            ends = [t.last_end for t in stages.values() if t.last_end is not None]
+            client_wall = max(ends) - min(starts) if starts else 0.0
+            busy = " | ".join(f"{stage} {t.seconds:.1f}s" for stage, t in sorted(stages.items(), key=lambda kv: -kv[1].seconds))
+            print(f"   👤 {client:<12}{client_wall:>7.1f}s wall   {busy}")
+
+    # Flushes the exports and prints the summary; safe to call once per run
+    def finish(self):
+        if self.prom_path:
+            try:
+                self.write_prometheus(self.prom_path)
+            except OSError as e:
+                print(f"⚠️ Could not write Prometheus metrics to {self.prom_path}: {e}")
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+        self.print_summary()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_run = RunMetrics("default")
+_run_lock = threading.Lock()
+
+
+# Starts a fresh set of totals; the entry points call this once per run
+def start_run(run_name):
+    global _run
+    with _run_lock:
+        _run = RunMetrics(run_name)
+    return _run
+
+
+def get_metrics():
+    return _run
+
+
+def span(stage, client=None, **fields):
+    return _run.span(stage, client, **fields)
+
+
+def retry(stage, client=None):
+    _run.retry(stage, client)
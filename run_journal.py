@@ -0,0 +1,147 @@
+# run_journal.py
+# Local write-ahead journal of per-file progress, so a run that dies halfway resumes instead of starting over.
+# 🎯 Key features:
+# - SQLite in WAL mode at RUN_JOURNAL_PATH; every record is its own small transaction, safe across threads
+# - v6 records each file's stages (downloaded, hashed, registered, named, gold loaded, silver/raw uploaded) with what
+#   a restart needs to skip them: the ControlNo, the FileHash and the blob names already used
+# - Gold loads record an intent before every batch and the commit after it, so a batch that was sent but never
+#   acknowledged is recognised as "in doubt" and settled against the table instead of being re-inserted blindly
+# - Finishing a gold load and marking its source done happen in one transaction
+#
+# Unset RUN_JOURNAL_PATH = off (bulk loads fall back to BULK_CHECKPOINT_PATH, if set)
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Journal config
+RUN_JOURNAL_PATH = os.getenv("RUN_JOURNAL_PATH")   # unset = no journal
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_stages (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    detail TEXT,
+    recorded_at REAL NOT NULL,
+    PRIMARY KEY (kind, key, stage)
+);
+CREATE TABLE IF NOT EXISTS gold_progress (
+    source TEXT PRIMARY KEY,
+    batches INTEGER NOT NULL,
+    committed_rows INTEGER NOT NULL,
+    intended_rows INTEGER,
+    updated_at REAL NOT NULL
+);
+"""
+
+GOLD_KIND = "gold"
+GOLD_LOADED = "gold_loaded"
+
+
+class RunJournal:
+    def __init__(self, path=RUN_JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")   # durable against a process crash, which is what we resume from
+            self._conn.executescript(_SCHEMA)
+
+    def record(self, kind, key, stage, **detail):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_stages (kind, key, stage, detail, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, stage, json.dumps(detail), time.time()))
+
+    # stage -> detail dict for one file
+    def stages(self, kind, key):
+        with self._lock:
+            rows = self._conn.execute("SELECT stage, detail FROM file_stages WHERE kind = ? AND key = ?", (kind, key)).fetchall()
+        return {stage: json.loads(detail) if detail else {} for stage, detail in rows}
+
+    def forget(self, kind, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM file_stages WHERE kind = ? AND key = ?", (kind, key))
+
+    # Keys with journal entries left behind by an earlier run
+    def unfinished(self, kind):
+        with self._lock:
+            return [key for (key,) in self._conn.execute("SELECT DISTINCT key FROM file_stages WHERE kind = ?", (kind,))]
+
+    def gold_loaded(self, source):
+        return GOLD_LOADED in self.stages(GOLD_KIND, source)
+
+    def gold_checkpoint(self):
+        return GoldCheckpoint(self)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# BulkLoader checkpoint backed by the journal; same get/set/clear as bulk_loader.FileCheckpoint, plus the
+# begin/in_doubt intent records
+class GoldCheckpoint:
+    def __init__(self, journal):
+        self.journal = journal
+
+    def _execute(self, sql, params=()):
+        with self.journal._lock:
+            return self.journal._conn.execute(sql, params).fetchone()
+
+    # Rows of source known to be committed
+    def get(self, source_name):
+        row = self._execute("SELECT committed_rows FROM gold_progress WHERE source = ?", (source_name,))
+        return row[0] if row else 0
+
+    # Row count the last batch would have reached, if it was sent but its commit never recorded; else None
+    def in_doubt(self, source_name):
+        row = self._execute("SELECT intended_rows FROM gold_progress WHERE source = ?", (source_name,))
+        return row[0] if row else None
+
+    # Written before a batch is sent
+    def begin(self, source_name, rows):
+        self._execute("""
+            INSERT INTO gold_progress (source, batches, committed_rows, intended_rows, updated_at) VALUES (?, 0, 0, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET intended_rows = excluded.intended_rows, updated_at = excluded.updated_at
+        """, (source_name, rows, time.time()))
+
+    # Written once a batch is committed (or an in-doubt batch has been settled)
+    def set(self, source_name, rows):
+        self._execute("""
+            INSERT INTO gold_progress (source, batches, committed_rows, intended_rows, updated_at) VALUES (?, 1, ?, NULL, ?)
+            ON CONFLICT(source) DO UPDATE SET batches = batches + 1, committed_rows = excluded.committed_rows,
+                                              intended_rows = NULL, updated_at = excluded.updated_at
+        """, (source_name, rows, time.time()))
+
+    # The whole source is loaded: drop its progress and mark it done in one transaction
+    def clear(self, source_name):
+        journal = self.journal
+        with journal._lock:
+            with journal._conn:
+                journal._conn.execute("BEGIN")
+                batches = journal._conn.execute("SELECT batches, committed_rows FROM gold_progress WHERE source = ?", (source_name,)).fetchone()
+                journal._conn.execute("DELETE FROM gold_progress WHERE source = ?", (source_name,))
+                journal._conn.execute(
+                    "INSERT OR REPLACE INTO file_stages (kind, key, stage, detail, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                    (GOLD_KIND, source_name, GOLD_LOADED,
+                     json.dumps({"batches": batches[0], "rows": batches[1]} if batches else {}), time.time()))
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+# The process-wide journal, opened on first use; None when RUN_JOURNAL_PATH is unset
+def get_journal():
+    global _journal
+    if not RUN_JOURNAL_PATH:
+        return None
+    with _journal_lock:
+        if _journal is None:
+            _journal = RunJournal(RUN_JOURNAL_PATH)
+        return _journal
@@ -0,0 +1,87 @@
+# sftp_manifest.py
+# Per-client manifest of the SFTP upload directory, used to detect changes from one listdir_attr call.
+# 🎯 Key features:
+# - Records filename, size and mtime of every file the pipeline has finished with
+# - diff() splits a fresh listing into files that are ready (new or modified), unchanged, and still being written
+# - A file is treated as still being written while its size/mtime differs from the previous poll and it was touched
+#   within SFTP_SETTLE_SECONDS; it is picked up on the first poll where it has stopped changing
+# - Files that disappeared from the server are dropped, so the manifest only ever mirrors the current directory
+
+import os
+import json
+import time
+import threading
+
+# Manifest config
+SFTP_MANIFEST_DIR = os.getenv("SFTP_MANIFEST_DIR")                     # unset = keep manifests in memory only
+SFTP_SETTLE_SECONDS = int(os.getenv("SFTP_SETTLE_SECONDS", 60))        # untouched this long = fully written
+
+
+class SFTPManifest:
+    def __init__(self, client_name, manifest_dir=SFTP_MANIFEST_DIR, settle_seconds=SFTP_SETTLE_SECONDS):
+        self.client_name = client_name
+        self.settle_seconds = settle_seconds
+        self.path = os.path.join(manifest_dir, f"{client_name.lower()}.json") if manifest_dir else None
+        self.done = {}       # filename -> [size, mtime] of the version the pipeline finished with
+        self.seen = {}       # filename -> [size, mtime] at the previous poll, for files not done yet
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    snapshot = json.load(f)
+                self.done = snapshot.get("done", {})
+                self.seen = snapshot.get("seen", {})
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Ignoring unreadable SFTP manifest {self.path}: {e}")
+        return self
+
+    # Returns (ready, deferred) lists of the listing's attrs; unchanged files are in neither
+    def diff(self, attrs, now=None):
+        now = time.time() if now is None else now
+        ready, deferred = [], []
+        with self._lock:
+            listed = set()
+            for attr in attrs:
+                listed.add(attr.filename)
+                current = [attr.st_size, attr.st_mtime]
+                if self.done.get(attr.filename) == current:
+                    continue
+                stable = self.seen.get(attr.filename) == current or now - attr.st_mtime >= self.settle_seconds
+                self.seen[attr.filename] = current
+                (ready if stable else deferred).append(attr)
+            for name in list(self.done):
+                if name not in listed:
+                    del self.done[name]
+            for name in list(self.seen):
+                if name not in listed:
+                    del self.seen[name]
+        return ready, deferred
+
+    def mark_done(self, attr):
+        with self._lock:
+            self.done[attr.filename] = [attr.st_size, attr.st_mtime]
+            self.seen.pop(attr.filename, None)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"done": self.done, "seen": self.seen}, f)
+        os.replace(tmp_path, self.path)
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+# One manifest per client for the life of the process, so in-memory manifests still carry over between polls
+def get_manifest(client_name):
+    with _manifests_lock:
+        if client_name not in _manifests:
+            _manifests[client_name] = SFTPManifest(client_name).load()
+        return _manifests[client_name]
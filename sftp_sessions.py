@@ -0,0 +1,251 @@
+# sftp_sessions.py
+# Long-lived, authenticated SFTP sessions shared by every run in the process.
+# 🎯 Key features:
+# - One paramiko Transport per (host, port, user), kept alive with SSH keepalives, so repeat runs skip key exchange + auth
+# - Each session hands out pooled SFTPClient channels, so parallel workers read over one transport at the same time
+# - A dropped connection is re-established with backoff and the call is retried; downloads resume at the byte they
+#   stopped at instead of restarting the file or aborting the client's batch
+# - An SFTPSession can be passed wherever the pipeline expects an SFTPClient (listdir, listdir_attr, stat, getfo, open)
+
+import os
+import time
+import queue
+import threading
+import paramiko
+from blob_streaming import iter_sftp_chunks
+from pipeline_metrics import span, retry
+
+# Session config
+SFTP_KEEPALIVE_SECONDS = int(os.getenv("SFTP_KEEPALIVE_SECONDS", 30))
+SFTP_CHANNELS_PER_SESSION = int(os.getenv("SFTP_CHANNELS_PER_SESSION", 8))
+SFTP_RECONNECT_RETRIES = int(os.getenv("SFTP_RECONNECT_RETRIES", 3))
+SFTP_BACKOFF_BASE_SECONDS = float(os.getenv("SFTP_BACKOFF_BASE_SECONDS", 2))
+SFTP_BACKOFF_MAX_SECONDS = float(os.getenv("SFTP_BACKOFF_MAX_SECONDS", 30))
+
+# What a dropped connection looks like; plain SFTP errors (e.g. no such file) on a live channel are not retried
+_CONNECTION_ERRORS = (paramiko.SSHException, EOFError, OSError)
+
+
+class SFTPSession:
+    def __init__(self, host, port, username, password, channels=SFTP_CHANNELS_PER_SESSION):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self._password = password
+        self._transport = None
+        self._lock = threading.Lock()
+        self._idle = queue.LifoQueue()          # (SFTPClient, transport it was opened on)
+        self._slots = threading.BoundedSemaphore(channels)
+        self.reconnects = 0
+
+    def __repr__(self):
+        return f"SFTPSession({self.username}@{self.host}:{self.port})"
+
+    def _connect(self):
+        for attempt in range(SFTP_RECONNECT_RETRIES + 1):
+            try:
+                with span("sftp_connect"):
+                    transport = paramiko.Transport((self.host, self.port))
+                    try:
+                        transport.set_keepalive(SFTP_KEEPALIVE_SECONDS)
+                        transport.connect(username=self.username, password=self._password)
+                    except BaseException:
+                        transport.close()
+                        raise
+                return transport
+            except paramiko.AuthenticationException:
+                raise
+            except _CONNECTION_ERRORS as e:
+                if attempt == SFTP_RECONNECT_RETRIES:
+                    raise
+                delay = min(SFTP_BACKOFF_BASE_SECONDS * 2 ** attempt, SFTP_BACKOFF_MAX_SECONDS)
+                print(f"⚠️ SFTP connect to {self.host} as {self.username} failed ({e}). Retrying in {delay:.0f}s...")
+                retry("sftp_connect")
+                time.sleep(delay)
+
+    # The live transport, (re)connecting if there is none or the old one died
+    def transport(self):
+        with self._lock:
+            if self._transport is None or not self._transport.is_active():
+                if self._transport is not None:
+                    self._transport.close()
+                    self.reconnects += 1
+                    retry("sftp_reconnect")
+                    print(f"🔌 Reconnecting SFTP session {self.username}@{self.host}...")
+                self._transport = self._connect()
+            return self._transport
+
+    def _alive(self, sftp, transport):
+        return transport is self._transport and transport.is_active() and not sftp.get_channel().closed
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    sftp, transport = self._idle.get_nowait()
+                except queue.Empty:
+                    transport = self.transport()
+                    return paramiko.SFTPClient.from_transport(transport), transport
+                if self._alive(sftp, transport):
+                    return sftp, transport
+                _close_quietly(sftp)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, sftp, transport, broken=False):
+        if broken:
+            _close_quietly(sftp)
+        else:
+            self._idle.put((sftp, transport))
+        self._slots.release()
+
+    # Runs op(sftp) on a pooled channel; if the connection drops, reconnects and runs it again
+    def call(self, op):
+        for attempt in range(SFTP_RECONNECT_RETRIES + 1):
+            sftp, transport = self._acquire()
+            try:
+                result = op(sftp)
+            except _CONNECTION_ERRORS as e:
+                if self._alive(sftp, transport):
+                    self._release(sftp, transport)
+                    raise
+                self._release(sftp, transport, broken=True)   # a dead transport is replaced on the next _acquire
+                if attempt == SFTP_RECONNECT_RETRIES:
+                    raise
+                print(f"⚠️ SFTP connection to {self.host} dropped ({e}); retrying...")
+                time.sleep(min(SFTP_BACKOFF_BASE_SECONDS * 2 ** attempt, SFTP_BACKOFF_MAX_SECONDS))
+                continue
+            self._release(sftp, transport)
+            return result
+
+    def listdir(self, path="."):
+        return self.call(lambda sftp: sftp.listdir(path))
+
+    def listdir_attr(self, path="."):
+        return self.call(lambda sftp: sftp.listdir_attr(path))
+
+    def stat(self, path):
+        return self.call(lambda sftp: sftp.stat(path))
+
+    # SFTPClient.getfo that survives dropped connections: a retry continues at the byte where the last attempt stopped
+    def getfo(self, remotepath, fl, callback=None):
+        received = 0
+
+        def read_rest(sftp):
+            nonlocal received
+            with sftp.open(remotepath, "rb") as remote_file:
+                size = remote_file.stat().st_size
+                for chunk in iter_sftp_chunks(remote_file, size, start=received):
+                    fl.write(chunk)
+                    received += len(chunk)
+                    if callback:
+                        callback(received, size)
+            return received
+
+        return self.call(read_rest)
+
+    def open(self, filename, mode="r", bufsize=-1):
+        if any(flag in mode for flag in "wa+"):
+            raise ValueError("SFTPSession.open only supports reading; use a channel from call() to write")
+        return ResumableSFTPFile(self, filename)
+
+    def close(self):
+        while True:
+            try:
+                sftp, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            _close_quietly(sftp)
+        with self._lock:
+            if self._transport is not None:
+                self._transport.close()
+                self._transport = None
+
+
+# Read-only remote file whose readv() reopens the file on a fresh channel and re-reads the window if the connection drops.
+# iter_sftp_chunks addresses every window by offset, so a streaming transfer picks up at the window that failed.
+class ResumableSFTPFile:
+    def __init__(self, session, path):
+        self._session = session
+        self._path = path
+        self._sftp = self._transport = self._file = None
+        self._open()
+
+    def _open(self):
+        self._sftp, self._transport = self._session._acquire()
+        try:
+            self._file = self._sftp.open(self._path, "rb")
+        except BaseException:
+            self._session._release(self._sftp, self._transport, broken=True)
+            self._sftp = self._file = None
+            raise
+
+    def _reopen(self, attempt, error):
+        self._session._release(self._sftp, self._transport, broken=True)
+        self._sftp = self._file = None
+        print(f"⚠️ SFTP read of {self._path} interrupted ({error}); resuming...")
+        time.sleep(min(SFTP_BACKOFF_BASE_SECONDS * 2 ** attempt, SFTP_BACKOFF_MAX_SECONDS))
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _with_retry(self, op):
+        for attempt in range(SFTP_RECONNECT_RETRIES + 1):
+            try:
+                return op(self._file)
+            except _CONNECTION_ERRORS as e:
+                if self._session._alive(self._sftp, self._transport) or attempt == SFTP_RECONNECT_RETRIES:
+                    raise
+                self._reopen(attempt, e)
+
+    def stat(self):
+        return self._with_retry(lambda f: f.stat())
+
+    def readv(self, chunks):
+        # Each window is read whole before it is yielded, so a retry never hands back half a window twice
+        for offset, length in chunks:
+            yield from self._with_retry(lambda f: list(f.readv([(offset, length)])))
+
+    def close(self):
+        if self._sftp is None:
+            return
+        try:
+            self._file.close()
+            self._session._release(self._sftp, self._transport)
+        except _CONNECTION_ERRORS:
+            self._session._release(self._sftp, self._transport, broken=True)
+        self._sftp = self._file = None
+
+
+def _close_quietly(sftp):
+    try:
+        sftp.close()
+    except Exception:
+        pass
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# One session per (host, port, user) for the life of the process
+def get_session(host, port, username, password):
+    key = (host, int(port), username)
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = SFTPSession(host, port, username, password)
+        return _sessions[key]
+
+
+def close_all_sessions():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,124 @@
+# spool.py
+# File buffers that move to disk above a size threshold and are then read through a memory map.
+# 🎯 Key features:
+# - SpooledFile collects writes (e.g. from sftp.getfo) in memory and rolls over to an anonymous temp file once it
+#   grows past SPOOL_THRESHOLD_BYTES, so oversized files never sit on the heap
+# - view() hands out one read-only memoryview (BytesIO buffer or mmap of the temp file); hashing, parsing and
+#   transforming slice it instead of rewinding and copying the buffer
+# - reader() gives each upload its own seekable stream over the same view, so the raw and transformed uploads and
+#   any retries all read the one copy of the data
+
+import io
+import os
+import mmap
+import tempfile
+
+# Spool config
+SPOOL_THRESHOLD_BYTES = int(os.getenv("SPOOL_THRESHOLD_BYTES", 64 * 1024 * 1024))   # larger files are spooled to disk
+SPOOL_DIR = os.getenv("SPOOL_DIR")                                                  # unset = the system temp dir
+SPOOL_WINDOW_BYTES = int(os.getenv("SPOOL_WINDOW_BYTES", 4 * 1024 * 1024))           # slice size for windowed consumers
+
+
+class SpooledFile:
+    def __init__(self, data=None, threshold=SPOOL_THRESHOLD_BYTES):
+        self.threshold = threshold
+        self.nbytes = 0
+        self._buffer = io.BytesIO()
+        self._file = None
+        self._mmap = None
+        self._view = None
+        if data is not None:
+            # Already in memory (e.g. a transform result): wrap it without copying; the spool is then read-only
+            self._buffer = None
+            self._view = memoryview(data).cast("B")
+            self.nbytes = self._view.nbytes
+
+    def __len__(self):
+        return self.nbytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def spooled(self):
+        return self._file is not None
+
+    def write(self, data):
+        if self._view is not None:
+            raise ValueError("SpooledFile is read-only once view() has been taken")
+        n = len(data)
+        if self._file is None and self.nbytes + n > self.threshold:
+            self._file = tempfile.TemporaryFile(prefix="sftptoblob-", dir=SPOOL_DIR)
+            self._file.write(self._buffer.getbuffer())
+            self._buffer = None
+        (self._file or self._buffer).write(data)
+        self.nbytes += n
+        return n
+
+    # The whole content as one read-only memoryview; ends the write phase
+    def view(self):
+        if self._view is None:
+            if self._file is not None:
+                self._file.flush()
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+            else:
+                self._view = self._buffer.getbuffer().toreadonly()
+        return self._view
+
+    # Consecutive slices of the view, for consumers that work chunk by chunk
+    def windows(self, size=SPOOL_WINDOW_BYTES):
+        view = self.view()
+        for offset in range(0, self.nbytes, size):
+            yield view[offset:offset + size]
+
+    def reader(self):
+        return ViewReader(self.view())
+
+    def close(self):
+        self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass   # a consumer still holds a slice; the map goes away with its last reference
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()   # anonymous temp file, nothing left on disk
+            self._file = None
+        self._buffer = None
+
+
+# Seekable read-only stream over a memoryview; what upload_blob and other file-object consumers read from
+class ViewReader(io.RawIOBase):
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+        self.nbytes = view.nbytes
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.nbytes}[whence]
+        self._pos = min(max(base + offset, 0), self.nbytes)
+        return self._pos
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self.nbytes - self._pos)
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        self._view = memoryview(b"")
+        super().close()
@@ -0,0 +1,151 @@
+# sql_pool.py
+# Shared, long-lived pyodbc connection pool for the control_master and *_ebill_prod code paths.
+# 🎯 Key features:
+# - Connections are opened once and reused, so per-file SQL work costs a round trip instead of a TLS + login handshake
+# - Connections idle longer than SQL_POOL_HEALTHCHECK_SECONDS are pinged before being handed out; dead ones are replaced
+# - Connecting retries with exponential backoff, which also covers a paused serverless Azure SQL database waking up
+# - One pool per connection string, shared by every thread in the process
+
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+import pyodbc
+from pipeline_metrics import retry
+
+# Pool config
+SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", 8))
+SQL_POOL_HEALTHCHECK_SECONDS = int(os.getenv("SQL_POOL_HEALTHCHECK_SECONDS", 60))
+SQL_CONNECT_RETRIES = int(os.getenv("SQL_CONNECT_RETRIES", 6))
+SQL_BACKOFF_BASE_SECONDS = float(os.getenv("SQL_BACKOFF_BASE_SECONDS", 2))
+SQL_BACKOFF_MAX_SECONDS = float(os.getenv("SQL_BACKOFF_MAX_SECONDS", 60))
+
+
+def build_conn_str():
+    return (
+        f"DRIVER={os.getenv('SQL_DRIVER')};"
+        f"SERVER={os.getenv('SQL_SERVER')};"
+        f"DATABASE={os.getenv('SQL_DATABASE')};"
+        f"UID={os.getenv('SQL_USERNAME')};"
+        f"PWD={os.getenv('SQL_PASSWORD')}"
+    )
+
+
+class SQLConnectionPool:
+    def __init__(self, conn_str, size=SQL_POOL_SIZE, connect=None):
+        self.conn_str = conn_str
+        self._connect_fn = connect or _connect_factory
+        self._idle = queue.LifoQueue()               # (connection, last_used); most recently used first
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        for attempt in range(SQL_CONNECT_RETRIES + 1):
+            try:
+                return self._connect_fn(self.conn_str)
+            except pyodbc.Error as e:
+                if attempt == SQL_CONNECT_RETRIES:
+                    raise
+                delay = min(SQL_BACKOFF_BASE_SECONDS * 2 ** attempt, SQL_BACKOFF_MAX_SECONDS)
+                retry("sql_connect")
+                print(f"⚠️ SQL connect failed ({str(e).splitlines()[0]}). Retrying in {delay:.0f}s...")
+                time.sleep(delay)
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1;")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if time.monotonic() - last_used < SQL_POOL_HEALTHCHECK_SECONDS or self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        if broken:
+            self._discard(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+        self._slots.release()
+
+    # Borrow a connection for a with-block; uncommitted work is rolled back if the block raises
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+                self.release(conn)
+            except pyodbc.Error:
+                self.release(conn, broken=True)
+            raise
+        else:
+            self.release(conn)
+
+    # Replaces the old connect / sleep 30s / connect-again wake-up with the pool's backoff
+    def warm_up(self):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GETDATE();")
+            cursor.fetchone()
+            cursor.close()
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_connect_factory = pyodbc.connect
+
+
+# Swaps the function used to open new connections (e.g. a local stand-in for offline benchmarks)
+def set_connect_factory(connect):
+    global _connect_factory
+    _connect_factory = connect
+
+
+def get_pool(conn_str=None, size=SQL_POOL_SIZE):
+    conn_str = conn_str or build_conn_str()
+    with _pools_lock:
+        if conn_str not in _pools:
+            _pools[conn_str] = SQLConnectionPool(conn_str, size)
+        return _pools[conn_str]
+
+
+# Closes the idle connections of every pool this process opened (v6 and v7 build their connection strings differently)
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
@@ -1,8 +1,11 @@
 import os
-import paramiko
 from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceExistsError
 from dotenv import load_dotenv
-from io import BytesIO
+from blob_streaming import stream_sftp_to_blob
+from blob_inventory import BlobInventory
+from spool import SpooledFile
+from sftp_sessions import get_session, close_all_sessions
 
 # Load environment variables from .env file 
 load_dotenv()
@@ -14,6 +17,9 @@ SFTP_USER = os.getenv("SFTP_USER")
 SFTP_PASSWORD = os.getenv("SFTP_PASSWORD")
 SFTP_DIR = "/uploads"
 
+# Stream files in fixed-size blocks instead of buffering each one in memory
+STREAM_TRANSFER = os.getenv("STREAM_TRANSFER", "false").lower() == "true"
+
 # Azure Blob Storage credentials
 AZURE_STORAGE_ACCOUNT = os.getenv("AZURE_STORAGE_ACCOUNT")
 AZURE_CONTAINER = os.getenv("AZURE_CONTAINER")
@@ -24,43 +30,54 @@ blob_service_client = BlobServiceClient(account_url=f"https://{AZURE_STORAGE_ACC
 container_client = blob_service_client.get_container_client(AZURE_CONTAINER)
 
 def upload_to_blob(file_data, blob_name):
-    """Upload a file directly to Azure Blob Storage"""
+    """Upload a file directly to Azure Blob Storage (conditional write, never overwrites)"""
     blob_client = container_client.get_blob_client(blob_name)
-    if not blob_client.exists():
-        # Upload the file content directly to Blob Storage
-        blob_client.upload_blob(file_data, overwrite=True)
+    try:
+        # overwrite=False sends If-None-Match: * so a concurrent writer cannot be clobbered
+        blob_client.upload_blob(file_data, overwrite=False)
         print(f"✅ Successfully uploaded {blob_name} to Azure Blob Storage.")
-    else:
+    except ResourceExistsError:
         print(f"⚠️ File {blob_name} already exists in Blob Storage. Skipping upload.")
 
 def transfer_files_from_sftp_to_blob():
     """Stream files from SFTP to Azure Blob Storage"""
     try:
-        # Connect to SFTP server
-        transport = paramiko.Transport((SFTP_HOST, SFTP_PORT))
-        transport.connect(username=SFTP_USER, password=SFTP_PASSWORD)
+        # Connect to SFTP server (reconnects and resumes on its own if the connection drops)
+        sftp = get_session(SFTP_HOST, SFTP_PORT, SFTP_USER, SFTP_PASSWORD)
 
-        sftp = paramiko.SFTPClient.from_transport(transport)
+        # One container listing up front instead of an exists() round trip per file
+        inventory = BlobInventory(container_client).load()
 
         # List files in the SFTP uploads directory
         sftp_files = sftp.listdir(SFTP_DIR)
         for file_name in sftp_files:
             remote_file_path = os.path.join(SFTP_DIR, file_name)
-            
-            # Open the remote file on SFTP
-            file_data = BytesIO()
-            sftp.getfo(remote_file_path, file_data)  # Stream the file directly into memory
-            file_data.seek(0)  # Rewind file pointer to the beginning
 
-            # Upload the streamed file to Azure Blob Storage
-            upload_to_blob(file_data, file_name)
+            if file_name in inventory:
+                print(f"⚠️ File {file_name} already exists in Blob Storage. Skipping upload.")
+                continue
 
-        # Close the SFTP connection
-        sftp.close()
-        transport.close()
+            if STREAM_TRANSFER:
+                try:
+                    file_hash, size = stream_sftp_to_blob(sftp, remote_file_path, container_client.get_blob_client(file_name))
+                    print(f"✅ Streamed {file_name} to Azure Blob Storage ({size} bytes, sha256 {file_hash[:12]}…).")
+                except ResourceExistsError:
+                    print(f"⚠️ File {file_name} already exists in Blob Storage. Skipping upload.")
+                continue
+            
+            # Pull the remote file into a spool (memory, or an mmapped temp file above SPOOL_THRESHOLD_BYTES)
+            with SpooledFile() as file_data:
+                sftp.getfo(remote_file_path, file_data)
+
+                # Upload straight from the spool's view, no rewind or extra copy
+                upload_to_blob(file_data.reader(), file_name)
 
     except Exception as e:
         print(f"❌ Error during SFTP to Blob transfer: {e}")
 
+    finally:
+        # Close the SFTP connection
+        close_all_sessions()
+
 if __name__ == "__main__":
     transfer_files_from_sftp_to_blob()
@@ -3,11 +3,12 @@
 
 
 import os
-import paramiko
-import pandas as pd
 from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceExistsError
 from dotenv import load_dotenv
 from io import BytesIO
+from csv_transform import inject_columns
+from sftp_sessions import get_session, close_all_sessions
 
 # Load environment variables from .env file
 load_dotenv()
@@ -32,20 +33,25 @@ transformed_container_client = blob_service_client.get_container_client("clienti
 # Define static client ID
 CLIENT_ID = 12659  # Static client ID
 
-def add_controlno_and_clientid(df, controlno=1001):
+def add_controlno_and_clientid(data, controlno=1001):
     """
-    Adds controlno and clientid to the DataFrame.
+    Appends controlno and clientid columns to raw CSV bytes.
+
+    The source fields are copied byte for byte; the CSV is never parsed into
+    a DataFrame or re-serialized.
 
     Args:
-    - df: DataFrame containing the data
+    - data: Raw CSV file content (bytes)
     - controlno: The control number to assign to the rows (default is 1001)
 
     Returns:
-    - The DataFrame with the added controlno and clientid columns
+    - The transformed CSV bytes with the added controlno and clientid columns
     """
-    df['controlno'] = controlno  # Control number starts at 1001
-    df['clientid'] = CLIENT_ID   # Static client ID (12659)
-    return df
+    transformed, _ = inject_columns(data, suffix_columns=[
+        ("controlno", controlno),  # Control number starts at 1001
+        ("clientid", CLIENT_ID),   # Static client ID (12659)
+    ])
+    return transformed
 
 def upload_to_blob(file_data, blob_name, is_transformed=False):
     """
@@ -56,16 +62,17 @@ def upload_to_blob(file_data, blob_name, is_transformed=False):
     - blob_name: The name of the blob (file name in storage)
     - is_transformed: Boolean flag indicating if this is a transformed file
 
-    This function checks if the file already exists in the container. 
-    If it doesn't, it uploads the file.
+    The upload is conditional (If-None-Match: *): if the blob already exists
+    the service rejects the write and the file is skipped, with no separate
+    exists() round trip.
     """
     blob_client = transformed_container_client.get_blob_client(blob_name) if is_transformed else raw_container_client.get_blob_client(blob_name)
     
-    if not blob_client.exists():
+    try:
         # Upload the file content directly to Blob Storage
-        blob_client.upload_blob(file_data, overwrite=True)
+        blob_client.upload_blob(file_data, overwrite=False)
         print(f"✅ Successfully uploaded {'transformed' if is_transformed else 'raw'} {blob_name} to Azure Blob Storage.")
-    else:
+    except ResourceExistsError:
         print(f"⚠️ {('Transformed' if is_transformed else 'Raw')} file {blob_name} already exists in Blob Storage. Skipping upload.")
 
 def process_sftp_file(file_name, sftp, controlno):
@@ -86,16 +93,8 @@ def process_sftp_file(file_name, sftp, controlno):
     sftp.getfo(remote_file_path, file_data)  # Stream the file directly into memory
     file_data.seek(0)  # Rewind file pointer to the beginning
 
-    # Load data into DataFrame
-    df = pd.read_csv(file_data)
-
-    # Add controlno and clientid columns
-    df = add_controlno_and_clientid(df, controlno)
-
-    # Save transformed data to Blob Storage (in the transformed container)
-    output_buffer = BytesIO()
-    df.to_csv(output_buffer, index=False)
-    output_buffer.seek(0)  # Rewind buffer before uploading
+    # Add controlno and clientid columns in a single pass over the raw bytes
+    output_buffer = BytesIO(add_controlno_and_clientid(file_data.getvalue(), controlno))
 
     # Create a new file name for transformed files
     transformed_file_name = f"transformed_{file_name}"
@@ -119,9 +118,7 @@ def transfer_and_transform_files_from_sftp_to_blob():
     try:
         # Connect to SFTP server
         print("Starting file transfer from SFTP to Blob...")  # Debug message
-        transport = paramiko.Transport((SFTP_HOST, SFTP_PORT))
-        transport.connect(username=SFTP_USER, password=SFTP_PASSWORD)
-        sftp = paramiko.SFTPClient.from_transport(transport)
+        sftp = get_session(SFTP_HOST, SFTP_PORT, SFTP_USER, SFTP_PASSWORD)
 
         # List files in the SFTP uploads directory
         sftp_files = sftp.listdir(SFTP_DIR)
@@ -135,14 +132,14 @@ def transfer_and_transform_files_from_sftp_to_blob():
             # Process and upload the file
             controlno = process_sftp_file(file_name, sftp, controlno)
 
-        # Close the SFTP connection
-        sftp.close()
-        transport.close()
-
         print("File transfer and transformation completed!")  # Success message
 
     except Exception as e:
         print(f"❌ Error during file transfer: {e}")
 
+    finally:
+        # Close the SFTP connection
+        close_all_sessions()
+
 if __name__ == "__main__":
     transfer_and_transform_files_from_sftp_to_blob()
@@ -5,16 +5,19 @@
 # - Distinguishes between clientA/clientB by login + folder path
 # - Uploads raw files prefixed with client name to "clientinvoicesraw"
 # - Uploads transformed files (with clientid + controlno) to "clientinvoices-transformed-with-controlno-and-clientid-added"
-# - Avoids duplicates using Azure Blob existence check
+# - Avoids duplicates using a per-client blob inventory plus conditional (If-None-Match) uploads
 # - Increments a global controlno (starting at 1000) across all files
 
 
 import os
-import paramiko
-import pandas as pd
 from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceExistsError
 from dotenv import load_dotenv
-from io import BytesIO
+from spool import SpooledFile
+from blob_streaming import BlockUploader, iter_sftp_chunks
+from csv_transform import CsvColumnInjector
+from blob_inventory import BlobInventory
+from sftp_sessions import get_session, close_all_sessions
 
 # Load environment variables
 load_dotenv()
@@ -25,6 +28,9 @@ AZURE_STORAGE_KEY = os.getenv("AZURE_STORAGE_KEY")
 RAW_CONTAINER = os.getenv("AZURE_RAW_CONTAINER")
 TRANSFORMED_CONTAINER = os.getenv("AZURE_TRANSFORMED_CONTAINER")
 
+# Streaming transfer config (bounded memory for multi-GB eBill dumps)
+STREAM_TRANSFER = os.getenv("STREAM_TRANSFER", "false").lower() == "true"
+
 # Client config
 CLIENTS = {
     "clientA": {"user": os.getenv("SFTP_CLIENTA_USER"), "pass": os.getenv("SFTP_CLIENTA_PASS"), "id": 12659},
@@ -38,64 +44,82 @@ transformed_container_client = blob_service_client.get_container_client(TRANSFOR
 
 CONTROLNO_START = 1000
 
-# Wrapper 1: Adds controlno and clientid as the first two columns in the DataFrame
-def add_controlno_and_clientid(df, controlno, clientid):
-    df.insert(0, 'controlno', controlno)
-    df.insert(1, 'clientid', clientid)
-    return df
+# Wrapper 1: Adds controlno and clientid as the first two columns, copying the source fields byte for byte
+def add_controlno_and_clientid(controlno, clientid):
+    return CsvColumnInjector(prefix_columns=[("controlno", controlno), ("clientid", clientid)])
 
 # Wrapper 2: Uploads raw or transformed file data to the correct Azure Blob container
 def upload_to_blob(file_data, blob_name, is_transformed=False):
     blob_client = (transformed_container_client if is_transformed else raw_container_client).get_blob_client(blob_name)
-    if not blob_client.exists():
-        blob_client.upload_blob(file_data, overwrite=True)
+    try:
+        blob_client.upload_blob(file_data, overwrite=False)
         print(f"✅ Uploaded {'transformed' if is_transformed else 'raw'}: {blob_name}")
-    else:
+    except ResourceExistsError:
         print(f"⚠️ Skipped duplicate blob: {blob_name}")
 
 # Wrapper 3: Downloads a file from SFTP, transforms it, and uploads both versions to Blob Storage
 def process_file(sftp, client_name, file_name, controlno):
+    if STREAM_TRANSFER:
+        return process_file_streaming(sftp, client_name, file_name, controlno)
+
     remote_path = f"/upload/{file_name}"
-    file_data = BytesIO()
-    sftp.getfo(remote_path, file_data)
-    file_data.seek(0)
+    with SpooledFile() as file_data, SpooledFile() as output_buffer:
+        sftp.getfo(remote_path, file_data)
 
-    df = pd.read_csv(file_data)
-    df = add_controlno_and_clientid(df, controlno, CLIENTS[client_name]['id'])
+        # Transform window by window from the spool's view, so an oversized file is never copied whole onto the heap
+        injector = add_controlno_and_clientid(controlno, CLIENTS[client_name]['id'])
+        for window in file_data.windows():
+            output_buffer.write(injector.feed(window))
+        output_buffer.write(injector.finish())
 
-    output_buffer = BytesIO()
-    df.to_csv(output_buffer, index=False)
-    output_buffer.seek(0)
+        transformed_name = f"{client_name.lower()}_transformed_{file_name}"
+        upload_to_blob(output_buffer.reader(), transformed_name, is_transformed=True)
 
-    transformed_name = f"{client_name.lower()}_transformed_{file_name}"
-    upload_to_blob(output_buffer, transformed_name, is_transformed=True)
+        raw_name = f"{client_name.lower()}_{file_name}"
+        upload_to_blob(file_data.reader(), raw_name, is_transformed=False)
+
+    return controlno + 1
 
-    file_data.seek(0)
+# Wrapper 3b: Streaming variant of process_file – each chunk goes to the raw blob and through the column injector
+def process_file_streaming(sftp, client_name, file_name, controlno):
+    remote_path = f"/upload/{file_name}"
+    transformed_name = f"{client_name.lower()}_transformed_{file_name}"
     raw_name = f"{client_name.lower()}_{file_name}"
-    upload_to_blob(file_data, raw_name, is_transformed=False)
+    injector = add_controlno_and_clientid(controlno, CLIENTS[client_name]['id'])
+
+    with BlockUploader(raw_container_client.get_blob_client(raw_name)) as raw_uploader, \
+         BlockUploader(transformed_container_client.get_blob_client(transformed_name)) as transformed_uploader:
+        with sftp.open(remote_path, "rb") as remote_file:
+            for chunk in iter_sftp_chunks(remote_file, remote_file.stat().st_size):
+                raw_uploader.write(chunk)
+                transformed_uploader.write(injector.feed(chunk))
+        transformed_uploader.write(injector.finish())
+
+        for uploader, blob_name, kind in ((transformed_uploader, transformed_name, "transformed"), (raw_uploader, raw_name, "raw")):
+            try:
+                uploader.commit()
+                print(f"✅ Uploaded {kind}: {blob_name}")
+            except ResourceExistsError:
+                print(f"⚠️ Skipped duplicate blob: {blob_name}")
 
     return controlno + 1
 
 # Wrapper 4: Connects to each client's SFTP, processes new files, and skips previously processed ones
 def handle_client(client_name, controlno):
     print(f"\n🔄 Connecting to {client_name}...")
-    transport = paramiko.Transport((os.getenv("SFTP_HOST"), int(os.getenv("SFTP_PORT"))))
-    transport.connect(username=CLIENTS[client_name]['user'], password=CLIENTS[client_name]['pass'])
-    sftp = paramiko.SFTPClient.from_transport(transport)
-
-    try:
-        files = sftp.listdir("/upload")
-        for file_name in files:
-            if file_name.startswith("transformed"):
-                continue
-            blob_name = f"{client_name.lower()}_{file_name}"
-            if not raw_container_client.get_blob_client(blob_name).exists():
-                controlno = process_file(sftp, client_name, file_name, controlno)
-            else:
-                print(f"🔁 Already processed: {blob_name}")
-    finally:
-        sftp.close()
-        transport.close()
+    # Reconnects and resumes on its own if the connection drops mid-file
+    sftp = get_session(os.getenv("SFTP_HOST"), int(os.getenv("SFTP_PORT")), CLIENTS[client_name]['user'], CLIENTS[client_name]['pass'])
+
+    inventory = BlobInventory(raw_container_client, prefix=f"{client_name.lower()}_").load()
+    files = sftp.listdir("/upload")
+    for file_name in files:
+        if file_name.startswith("transformed"):
+            continue
+        blob_name = f"{client_name.lower()}_{file_name}"
+        if blob_name not in inventory:
+            controlno = process_file(sftp, client_name, file_name, controlno)
+        else:
+            print(f"🔁 Already processed: {blob_name}")
 
     return controlno
 
@@ -104,6 +128,7 @@ def main():
     controlno = CONTROLNO_START
     for client_name in CLIENTS:
         controlno = handle_client(client_name, controlno)
+    close_all_sessions()
     print("\n✅ All client files processed.")
 
 if __name__ == "__main__":
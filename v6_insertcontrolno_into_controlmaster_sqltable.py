@@ -1,17 +1,34 @@
 # v6_sftp_to_blob_with_controlmaster.py
 # This version builds on V5 and also inserts clientid metadata into the control_master SQL table, with SCOPE_IDENTITY capture.
 
+import io
 import os
-import paramiko
+import hashlib
 import pandas as pd
 import pyodbc
-import hashlib
-from io import BytesIO
 from dotenv import load_dotenv
 from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import ResourceExistsError
 from datetime import datetime
 import pytz
 import time 
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from blob_streaming import BlockUploader, iter_sftp_chunks
+from csv_transform import CsvColumnInjector, count_records
+from parquet_io import csv_to_parquet, read_gold_frame
+from bulk_loader import BulkLoader, default_checkpoint
+from file_pipeline import Pipeline, Stage
+from blob_inventory import BlobInventory
+from sql_pool import get_pool
+from pipeline_metrics import span, bind_client, start_run, get_metrics
+from sftp_sessions import get_session, close_all_sessions
+from hash_index import HashIndex
+from spool import SpooledFile
+from cpu_pool import get_cpu_pool, close_cpu_pool, CPU_POOL_WORKERS
+from blob_compression import encode_upload, block_upload_options
+from sftp_manifest import get_manifest
+from run_journal import get_journal
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +39,36 @@ AZURE_STORAGE_KEY = os.getenv("AZURE_STORAGE_KEY")
 RAW_CONTAINER = os.getenv("AZURE_RAW_CONTAINER")
 TRANSFORMED_CONTAINER = os.getenv("AZURE_TRANSFORMED_CONTAINER")
 
+# Streaming transfer config (bounded memory for multi-GB eBill dumps)
+STREAM_TRANSFER = os.getenv("STREAM_TRANSFER", "false").lower() == "true"
+
+# Silver layer format: "csv" or "parquet" (typed, compressed; applies to the in-memory path, streaming stays CSV)
+TRANSFORMED_FORMAT = os.getenv("TRANSFORMED_FORMAT", "csv").lower()
+
+# Fused mode: transformed files are loaded straight into the gold tables with v7's carrier loaders while still in
+# memory; the silver blob is written in the background for lineage only and marked so v7 skips it
+FUSED_GOLD = os.getenv("FUSED_GOLD", "false").lower() == "true"
+GOLD_WORKERS = int(os.getenv("GOLD_WORKERS", 2))
+SILVER_UPLOAD_WORKERS = int(os.getenv("SILVER_UPLOAD_WORKERS", 4))
+SILVER_MAX_PENDING = int(os.getenv("SILVER_MAX_PENDING", 32))   # silver copies held in memory awaiting upload
+
+# Scheduler config: clients run side by side, each with its own pool of SFTP channels
+MAX_CLIENT_WORKERS = int(os.getenv("MAX_CLIENT_WORKERS", 4))
+PER_CLIENT_CONCURRENCY = int(os.getenv("PER_CLIENT_CONCURRENCY", 2))   # SFTP download channels per client
+
+# Per-client pipeline config: files in flight per client <= workers + queue slots of each stage
+TRANSFORM_WORKERS = int(os.getenv("TRANSFORM_WORKERS", 2))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 4))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+
+# Client drops are read as ISO-8859-1 (as the pandas transform did) and written to silver as UTF-8
+SOURCE_CSV_ENCODING = os.getenv("SOURCE_CSV_ENCODING", "ISO-8859-1")
+
+# control_master registration batching: a batch is sent when it is full, when no more files are on their way to it
+# (a drop smaller than the batch goes out at once), or at the latest after the linger time
+REGISTER_BATCH_SIZE = int(os.getenv("REGISTER_BATCH_SIZE", 50))
+REGISTER_BATCH_LINGER_SECONDS = float(os.getenv("REGISTER_BATCH_LINGER_SECONDS", 2))
+
 # Client config
 CLIENTS = {
     "clientA": {"user": os.getenv("SFTP_CLIENTA_USER"), "pass": os.getenv("SFTP_CLIENTA_PASS"), "id": 12659},  ###USPS Client
@@ -29,193 +76,655 @@ CLIENTS = {
     "clientC": {"user": os.getenv("SFTP_CLIENTC_USER"), "pass": os.getenv("SFTP_CLIENTB_PASS"), "id": 12661}   ###UPS Client
 }
 
-# Initialize Azure Blob client
-blob_service_client = BlobServiceClient(account_url=f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net", credential=AZURE_STORAGE_KEY)
-raw_container_client = blob_service_client.get_container_client(RAW_CONTAINER)
-transformed_container_client = blob_service_client.get_container_client(TRANSFORMED_CONTAINER)
+# Azure Blob clients are built on first use, so importing v6 (e.g. from the daemon or the fused v7 path) costs no
+# client setup; the benchmark and tests may assign raw_container_client / transformed_container_client directly
+blob_service_client = raw_container_client = transformed_container_client = None
+_blob_clients_lock = threading.Lock()
+
+def get_raw_container_client():
+    global blob_service_client, raw_container_client
+    with _blob_clients_lock:
+        if raw_container_client is None:
+            blob_service_client = blob_service_client or BlobServiceClient(account_url=f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net", credential=AZURE_STORAGE_KEY)
+            raw_container_client = blob_service_client.get_container_client(RAW_CONTAINER)
+        return raw_container_client
+
+def get_transformed_container_client():
+    global blob_service_client, transformed_container_client
+    with _blob_clients_lock:
+        if transformed_container_client is None:
+            blob_service_client = blob_service_client or BlobServiceClient(account_url=f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net", credential=AZURE_STORAGE_KEY)
+            transformed_container_client = blob_service_client.get_container_client(TRANSFORMED_CONTAINER)
+        return transformed_container_client
 
 CONTROLNO_START = 999
 
-def get_next_controlno_from_sql():
-    conn = pyodbc.connect(
-        f"DRIVER={os.getenv('SQL_DRIVER')};"
-        f"SERVER={os.getenv('SQL_SERVER')};"
-        f"DATABASE={os.getenv('SQL_DATABASE')};"
-        f"UID={os.getenv('SQL_USERNAME')};"
-        f"PWD={os.getenv('SQL_PASSWORD')}"
+CARRIER_BY_CLIENTID = {
+    12659: "USPS",      # Client A – USPS
+    12660: "USPS",      # Client B – USPS
+    12661: "UPS",      # Client C – UPS only
+}
+
+# controlno and clientid become the first two columns and carrier (based on clientid) the last one.
+# Source fields are copied byte for byte; nothing is parsed or re-serialized.
+def build_injector(controlno, clientid):
+    return CsvColumnInjector(
+        prefix_columns=[("controlno", controlno), ("clientid", clientid)],
+        suffix_columns=[("carrier", CARRIER_BY_CLIENTID.get(clientid, ""))],
+        encoding=SOURCE_CSV_ENCODING,
     )
-    cursor = conn.cursor()
-    cursor.execute("SELECT ISNULL(MAX(ControlNo), 999) + 1 FROM control_master")
-    result = cursor.fetchone()[0]
-    cursor.close()
-    conn.close()
-    return result
-
-def add_controlno_and_clientid(df, controlno, clientid):
-    df.insert(0, 'controlno', controlno)
-    df.insert(1, 'clientid', clientid)
-    return df
-
-# Add carrier based on clientid
-def assign_carrier(df):
-    df["carrier"] = df["clientid"].map({
-        12659: "USPS",      # Client A – USPS
-        12660: "USPS",      # Client B – USPS
-        12661: "UPS",      # Client C – UPS only
-    })
-    return df
-
-
-def upload_to_blob(file_data, blob_name, is_transformed=False):
-    blob_client = (transformed_container_client if is_transformed else raw_container_client).get_blob_client(blob_name)
-    if not blob_client.exists():
-        blob_client.upload_blob(file_data, overwrite=True)
-        print(f"✅ Uploaded {'transformed' if is_transformed else 'raw'}: {blob_name}")
-    else:
-        print(f"⚠️ Skipped duplicate blob: {blob_name}")
 
-def insert_into_control_master(clientid, filename, recordcount, file_bytes, carrier):
-    try:
-        file_hash = hashlib.sha256(file_bytes).hexdigest()
-        est = pytz.timezone('US/Eastern')
-        load_timestamp = datetime.now(est).strftime('%Y-%m-%d %H:%M:%S')
-
-        conn = pyodbc.connect(
-            f"DRIVER={os.getenv('SQL_DRIVER')};"
-            f"SERVER={os.getenv('SQL_SERVER')};"
-            f"DATABASE={os.getenv('SQL_DATABASE')};"
-            f"UID={os.getenv('SQL_USERNAME')};"
-            f"PWD={os.getenv('SQL_PASSWORD')}"
-        )
+
+def _payload_size(file_data):
+    if hasattr(file_data, "nbytes"):
+        return file_data.nbytes
+    return file_data.getbuffer().nbytes if hasattr(file_data, "getbuffer") else len(file_data)
+
+# Conditional write (If-None-Match: *) instead of exists() + overwrite, so two writers can never double-write a blob.
+# With BLOB_COMPRESSION set, CSV payloads are compressed on the way out and stored with a matching Content-Encoding.
+def upload_to_blob(file_data, blob_name, is_transformed=False, inventory=None, metadata=None):
+    if inventory is not None and blob_name in inventory:
+        print(f"⚠️ Skipped duplicate blob: {blob_name}")
+        return False
+    blob_client = (get_transformed_container_client() if is_transformed else get_raw_container_client()).get_blob_client(blob_name)
+    with span("upload", container="transformed" if is_transformed else "raw") as s:
+        payload, settings = encode_upload(file_data, blob_name)
+        try:
+            blob_client.upload_blob(payload, overwrite=False, metadata=metadata, content_settings=settings)
+        except ResourceExistsError:
+            print(f"⚠️ Skipped duplicate blob: {blob_name}")
+            return False
+        s.bytes = _payload_size(file_data)
+        if settings is not None:
+            s.fields["stored_bytes"] = payload.bytes_read
+    if inventory is not None:
+        inventory.add(blob_name)
+    print(f"✅ Uploaded {'transformed' if is_transformed else 'raw'}: {blob_name}")
+    return True
+
+# 7 parameters per row keeps each statement under SQL Server's 2,100-parameter limit
+CONTROL_MASTER_BATCH_ROWS = 250
+
+# Registers many files in one transaction: a multi-row INSERT ... OUTPUT guarded by NOT EXISTS skips files that are
+# already registered, then one lookup fetches the ControlNo of those. Returns {(clientid, filename): ControlNo}.
+def register_files(files):
+    est = pytz.timezone('US/Eastern')
+    load_timestamp = datetime.now(est).strftime('%Y-%m-%d %H:%M:%S')
+    unique = list({(f["clientid"], f["filename"]): f for f in files}.values())
+    controlnos = {}
+
+    with span("sql_register") as s, get_pool().connection() as conn:
+        s.rows = len(unique)
         cursor = conn.cursor()
 
-        cursor.execute("SELECT 1 FROM control_master WHERE FileName = ? AND ClientID = ?", (filename, clientid))
-        if cursor.fetchone():
-            print(f"⚠️ Entry for {filename} and ClientID {clientid} already exists in control_master. Skipping insert.")
-            conn.close()
-            return
-
-        cursor.execute("""
-            INSERT INTO control_master (ClientID, FileName, RecordCount, LoadTimestamp, SourceSystem, FileHash, carrier)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            clientid,
-            filename,
-            recordcount,
-            load_timestamp,
-            "pipeline transfer",
-            file_hash,
-            carrier
-        ))
-
-        cursor.execute("SELECT SCOPE_IDENTITY();")
-        new_controlno = cursor.fetchone()[0]
-        print(f"✅ SQL generated ControlNo: {new_controlno}")
+        for start in range(0, len(unique), CONTROL_MASTER_BATCH_ROWS):
+            batch = unique[start:start + CONTROL_MASTER_BATCH_ROWS]
+            values = ", ".join(["(?, ?, ?, ?, ?, ?, ?)"] * len(batch))
+            params = []
+            for f in batch:
+                params += [f["clientid"], f["filename"], f["recordcount"], load_timestamp, "pipeline transfer", f["file_hash"], f["carrier"]]
+            cursor.execute(f"""
+                INSERT INTO control_master (ClientID, FileName, RecordCount, LoadTimestamp, SourceSystem, FileHash, carrier)
+                OUTPUT inserted.ClientID, inserted.FileName, inserted.ControlNo
+                SELECT v.ClientID, v.FileName, v.RecordCount, v.LoadTimestamp, v.SourceSystem, v.FileHash, v.carrier
+                FROM (VALUES {values}) AS v (ClientID, FileName, RecordCount, LoadTimestamp, SourceSystem, FileHash, carrier)
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM control_master cm WITH (UPDLOCK, HOLDLOCK)
+                    WHERE cm.FileName = v.FileName AND cm.ClientID = v.ClientID
+                )
+            """, params)
+            for clientid, filename, controlno in cursor.fetchall():
+                controlnos[(clientid, filename)] = controlno
+                print(f"✅ SQL generated ControlNo: {controlno} for {filename}")
+
+        existing = [f for f in unique if (f["clientid"], f["filename"]) not in controlnos]
+        for start in range(0, len(existing), CONTROL_MASTER_BATCH_ROWS):
+            batch = existing[start:start + CONTROL_MASTER_BATCH_ROWS]
+            values = ", ".join(["(?, ?)"] * len(batch))
+            params = [p for f in batch for p in (f["clientid"], f["filename"])]
+            cursor.execute(f"""
+                SELECT cm.ClientID, cm.FileName, cm.ControlNo
+                FROM control_master cm
+                JOIN (VALUES {values}) AS v (ClientID, FileName) ON cm.ClientID = v.ClientID AND cm.FileName = v.FileName
+            """, params)
+            for clientid, filename, controlno in cursor.fetchall():
+                controlnos[(clientid, filename)] = controlno
+                print(f"⚠️ Entry for {filename} and ClientID {clientid} already exists in control_master. Skipping insert.")
 
         conn.commit()
         cursor.close()
-        conn.close()
 
+    return controlnos
+
+def insert_into_control_master(clientid, filename, recordcount, file_bytes, carrier, file_hash=None):
+    try:
+        if file_hash is None:
+            file_hash = hashlib.sha256(file_bytes).hexdigest()
+        register_files([{
+            "clientid": clientid,
+            "filename": filename,
+            "recordcount": recordcount,
+            "file_hash": file_hash,
+            "carrier": carrier,
+        }])
     except Exception as e:
         print(f"❌ Failed to insert or fetch ControlNo: {e}")
 
-def process_file(sftp, client_name, file_name, controlno):
+# Fills in the record count and hash of a file registered before it was streamed (they are only known at the end)
+def complete_registration(controlno, recordcount, file_hash):
+    with span("sql_register") as s, get_pool().connection() as conn:
+        s.rows = 1
+        cursor = conn.cursor()
+        cursor.execute("UPDATE control_master SET RecordCount = ?, FileHash = ? WHERE ControlNo = ?", (recordcount, file_hash, controlno))
+        conn.commit()
+        cursor.close()
+
+# Run journal (RUN_JOURNAL_PATH): each file's finished stages, so a run that dies mid-file resumes it with the same
+# ControlNo, control_master row and blob names instead of starting it over
+_journal = get_journal()
+JOURNAL_KIND = "v6"
+
+def _journal_key(client_name, file_name):
+    return f"{client_name}/{file_name}"
+
+# Stages an earlier run finished for this file; they only count while the SFTP file has the same size and mtime
+def resumed_stages(job):
+    if _journal is None:
+        return {}
+    key = _journal_key(job["client_name"], job["file_name"])
+    stages = _journal.stages(JOURNAL_KIND, key)
+    downloaded = stages.get("downloaded", {})
+    if stages and (downloaded.get("size"), downloaded.get("mtime")) != (job.get("size"), job.get("mtime")):
+        _journal.forget(JOURNAL_KIND, key)
+        return {}
+    if len(stages) > 1:
+        print(f"🩹 Resuming {job['file_name']} after: {', '.join(stage for stage in stages if stage != 'downloaded')}")
+    return stages
+
+def journal_stage(job, stage, **detail):
+    if _journal is not None:
+        _journal.record(JOURNAL_KIND, _journal_key(job["client_name"], job["file_name"]), stage, **detail)
+
+# Called once the manifest marks a file done; nothing about it needs resuming any more
+def forget_file(client_name, file_name):
+    if _journal is not None:
+        _journal.forget(JOURNAL_KIND, _journal_key(client_name, file_name))
+
+# Stage 1 (network): pull the raw file off SFTP into a spool (memory, or an mmapped temp file above SPOOL_THRESHOLD_BYTES);
+# attrs (from listdir_attr) carry the stat fingerprint along
+def download_file(sftp, client_name, file_name, attrs=None):
     remote_path = f"/upload/{file_name}"
-    file_data = BytesIO()
-    sftp.getfo(remote_path, file_data)
-    file_data.seek(0)
-
-    df = pd.read_csv(file_data, encoding='ISO-8859-1')
-    df = add_controlno_and_clientid(df, controlno, CLIENTS[client_name]['id'])
-    df = assign_carrier(df)  ### Add carrier based on clientid
-
-
-    recordcount = len(df)
-    file_data.seek(0)
-    insert_into_control_master(
-    clientid=CLIENTS[client_name]['id'],
-    filename=file_name,
-    recordcount=recordcount,
-    file_bytes=file_data.read(),
-    carrier=df["carrier"].iloc[0]   ### New param added
-)
-
-    file_data.seek(0)
-    output_buffer = BytesIO()
-    df.to_csv(output_buffer, index=False)
-    output_buffer.seek(0)
+    file_data = SpooledFile()
+    with span("download") as s:
+        s.bytes = sftp.getfo(remote_path, file_data)
+        s.fields["spooled"] = file_data.spooled
+    job = {"client_name": client_name, "file_name": file_name, "file_data": file_data,
+           "size": getattr(attrs, "st_size", None), "mtime": getattr(attrs, "st_mtime", None)}
+    job["resumed"] = resumed_stages(job)
+    journal_stage(job, "downloaded", size=job["size"], mtime=job["mtime"])
+    return job
+
+# Stage 2 (CPU): hash the raw file and count its records, everything control_master needs before the transform.
+# Content already loaded under another name is dropped here, before any SQL, transform or upload work.
+# With CPU_POOL_WORKERS set, hashing and the transform run in worker processes on a shared-memory copy of the file.
+def hash_file(job, hash_index=None):
+    clientid = CLIENTS[job["client_name"]]['id']
+    spool = job["file_data"]
+    pool = None if spool.spooled else get_cpu_pool()
+    if pool is not None:
+        shared = pool.share(spool.view())
+        spool.close()
+        job["file_data"] = spool = shared   # the transform and the raw upload read the shared copy too
+
+    with span("hash") as s:
+        s.bytes = spool.nbytes
+        s.fields["pool"] = pool is not None
+        if pool is not None:
+            file_hash, records = pool.inspect(spool)
+        else:
+            file_hash, records = hashlib.sha256(spool.view()).hexdigest(), count_records(spool.windows())
+        s.rows = records
+    if hash_index is not None:
+        owner = hash_index.add(clientid, file_hash, job["file_name"], job.get("size"), job.get("mtime"))
+        if owner != job["file_name"]:
+            print(f"🧬 Skipped {job['file_name']}: identical content already loaded as {owner}")
+            release_job(job)
+            return None
+
+    job.update(clientid=clientid, carrier=CARRIER_BY_CLIENTID.get(clientid), recordcount=records, file_hash=file_hash)
+    journal_stage(job, "hashed", file_hash=file_hash, recordcount=records)
+    return job
+
+# Stage 3 (SQL): register a batch of hashed files in control_master with one statement and one commit. The identity
+# it assigns is the file's ControlNo, injected by the transform, so gold rows always join back to control_master.
+# Files the run journal already has registered keep their recorded ControlNo and skip the round trip. Returns one
+# result per job: the job, or the error for a job that got no ControlNo back, so only that file fails.
+def register_jobs(jobs):
+    fresh = [job for job in jobs if "registered" not in job.get("resumed", {})]
+    controlnos = register_files([{
+        "clientid": job["clientid"],
+        "filename": job["file_name"],
+        "recordcount": job["recordcount"],
+        "file_hash": job["file_hash"],
+        "carrier": job["carrier"],
+    } for job in fresh]) if fresh else {}
+    results = []
+    for job in jobs:
+        registered = job.get("resumed", {}).get("registered")
+        if registered is not None:
+            job["controlno"] = registered["controlno"]
+            results.append(job)
+            continue
+        controlno = controlnos.get((job["clientid"], job["file_name"]))
+        if controlno is None:
+            results.append(RuntimeError(f"control_master returned no ControlNo for {job['file_name']}"))
+            continue
+        job["controlno"] = int(controlno)
+        journal_stage(job, "registered", controlno=job["controlno"])
+        results.append(job)
+    return results
+
+# Stage 4 (CPU): add controlno/clientid/carrier and serialize the transformed CSV
+def transform_file(job):
+    spool = job["file_data"]
+    pool = None if spool.spooled else get_cpu_pool()
+    data = spool.view()   # transform and raw upload both read this one view
+
+    injector = build_injector(job["controlno"], job["clientid"])
+    with span("transform") as s:
+        if pool is not None:
+            # The worker runs its own copy of the injector, so the record count comes back with the output
+            output, records = pool.transform(spool, injector)
+        else:
+            if spool.spooled:
+                # Oversized input: transform window by window into a second spool instead of one big bytes object
+                output = SpooledFile()
+                for window in spool.windows():
+                    output.write(injector.feed(window))
+                output.write(injector.finish())
+            else:
+                output = SpooledFile(injector.feed(data) + injector.finish())
+            records = injector.records
+        s.bytes, s.rows = len(data), records
+    carrier = job["carrier"]
+
+    transformed_file_name = job["file_name"]
+    if TRANSFORMED_FORMAT == "parquet":
+        try:
+            with span("parquet") as s:
+                s.bytes, s.rows = output.nbytes, records
+                parquet = csv_to_parquet(output.view(), carrier)
+            output.close()
+            output = SpooledFile(parquet)
+            transformed_file_name = f"{os.path.splitext(job['file_name'])[0]}.parquet"
+        except Exception as e:
+            print(f"⚠️ Parquet conversion failed for {job['file_name']}, keeping CSV: {str(e).splitlines()[0]}")
+
+    job.update(output_buffer=output, transformed_file_name=transformed_file_name)
+    return job
+
+# Imported on first use, so runs without FUSED_GOLD never set up v7's module state
+def _gold():
+    import v7_bronze_to_gold_insert
+    return v7_bronze_to_gold_insert
+
+_gold_checkpoint = default_checkpoint()
+
+# Stage 4b (SQL, fused mode only): load the in-memory transformed file into the gold tables, as v7 would from the blob.
+# A file whose gold rows committed but whose upload failed comes back with the same ControlNo and a new blob name:
+# the journal recognises it by name; without the journal its ControlNo already having gold rows (a file's load
+# commits all or nothing then) or a duplicate-key error marks it as loaded, as in v7
+def load_gold(job):
+    v7 = _gold()
+    transformed_name, _ = blob_names(job)
+    if _journal is not None and _journal.gold_loaded(transformed_name):
+        print(f"⚡ Skipped gold load of {transformed_name}: already committed before the restart")
+        return job
+    if _journal is None and job["carrier"] in v7.GOLD_TABLES:
+        with get_pool().connection() as conn:
+            loaded = v7.count_gold_rows(conn, v7.GOLD_TABLES[job["carrier"]], job["controlno"], job["clientid"])
+        if loaded:
+            print(f"⚠️ Skipped gold load of {transformed_name}: ControlNo {job['controlno']} already has {loaded} gold rows")
+            return job
+    output = job["output_buffer"]
+    with span("parse", format="parquet" if transformed_name.endswith(".parquet") else "csv", fused=True) as s:
+        if transformed_name.endswith(".parquet"):
+            df = read_gold_frame(output.view())
+        else:
+            df = pd.read_csv(io.BufferedReader(output.reader()), dtype=str)
+        s.bytes, s.rows = output.nbytes, len(df)
+    with get_pool().connection() as conn:
+        try:
+            v7.load_gold_frame(df, transformed_name, BulkLoader(conn, checkpoint=_gold_checkpoint))
+        except pyodbc.IntegrityError as e:
+            if not v7.is_duplicate_error(e):
+                raise
+            print(f"⚠️ Skipped {transformed_name}: Duplicate record.")
+    return job
+
+# Background writer for the silver copies in fused mode: gold no longer waits on them, and a failed write is only
+# a missing lineage copy, so it is reported but does not fail the file
+class SilverWriter:
+    def __init__(self, workers=SILVER_UPLOAD_WORKERS, max_pending=SILVER_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="silver")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = []
+        self._lock = threading.Lock()
+
+    # Takes the transformed buffer off the job, so release_job() on a file that fails later leaves it to the writer
+    def submit(self, job, blob_name):
+        self._slots.acquire()   # backpressure: at most max_pending silver copies held in memory
+        output = job.pop("output_buffer")
+        future = self._executor.submit(_for_client(job["client_name"], self._write), job, output, blob_name)
+        with self._lock:
+            self._futures.append(future)
+
+    def _write(self, job, output, blob_name):
+        try:
+            upload_to_blob(output.reader(), blob_name, is_transformed=True,
+                           metadata={_gold().GOLD_LOADED_METADATA: "true"})
+            journal_stage(job, "silver_uploaded")
+        finally:
+            output.close()
+            self._slots.release()
+
+    # Waits for every queued silver write; returns how many failed
+    def wait(self):
+        with self._lock:
+            futures, self._futures = self._futures, []
+        failed = 0
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"⚠️ Silver (lineage) upload failed: {e}")
+        return failed
+
+silver_writer = SilverWriter()
+
+# Stage 5 (network): upload transformed and raw copies once the file is registered (and, fused, loaded into gold)
+def upload_file(job, inventory=None):
+    transformed_name, raw_name = blob_names(job)
+    if "silver_uploaded" in job.get("resumed", {}):
+        print(f"⚡ Skipped upload of {transformed_name}: already uploaded before the restart")
+        job["output_buffer"].close()
+    elif FUSED_GOLD:
+        silver_writer.submit(job, transformed_name)   # closes the transformed buffer when done
+    else:
+        upload_to_blob(job["output_buffer"].reader(), transformed_name, is_transformed=True)
+        job["output_buffer"].close()
+        journal_stage(job, "silver_uploaded")
+    if "raw_uploaded" in job.get("resumed", {}):
+        print(f"⚡ Skipped upload of {raw_name}: already uploaded before the restart")
+    else:
+        upload_to_blob(job["file_data"].reader(), raw_name, is_transformed=False, inventory=inventory)
+        journal_stage(job, "raw_uploaded")
+    job["file_data"].close()
+    return job
+
+# Frees a job's buffers (and any temp files behind them) once nothing reads them any more
+def release_job(job):
+    for key in ("file_data", "output_buffer"):
+        if job.get(key) is not None:
+            job[key].close()
+
+# (transformed blob name, raw blob name) for a transformed job; fixed on first call so gold and silver agree,
+# and journaled so a resumed file reuses them (the gold checkpoint is keyed by the transformed name)
+def blob_names(job):
+    if "blob_names" not in job:
+        named = job.get("resumed", {}).get("named")
+        if named is not None:
+            job["blob_names"] = (named["transformed"], named["raw"])
+        else:
+            client_name = job["client_name"].lower()
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            job["blob_names"] = (f"{client_name}_transformed_{timestamp}_{job['transformed_file_name']}", f"{client_name}_{job['file_name']}")
+            journal_stage(job, "named", transformed=job["blob_names"][0], raw=job["blob_names"][1])
+    return job["blob_names"]
+
+# Returns the file's ControlNo, or None when it was skipped as a duplicate
+def process_file(sftp, client_name, file_name, inventory=None, hash_index=None):
+    if STREAM_TRANSFER:
+        return process_file_streaming(sftp, client_name, file_name, inventory, hash_index)
+
+    job = download_file(sftp, client_name, file_name)
+    try:
+        if hash_file(job, hash_index) is None:
+            return None
+        registered, = register_jobs([job])
+        if isinstance(registered, Exception):
+            raise registered
+        transform_file(job)
+        if FUSED_GOLD:
+            load_gold(job)
+        upload_file(job, inventory)
+    finally:
+        release_job(job)
+    return job["controlno"]
 
+# Streaming variant of process_file: each chunk read from SFTP is hashed, staged to the raw blob, and run through
+# the column injector into the transformed blob, so no file is ever held in memory whole.
+# The ControlNo goes into every transformed row, so the file is registered before the first chunk is read.
+def process_file_streaming(sftp, client_name, file_name, inventory=None, hash_index=None):
+    remote_path = f"/upload/{file_name}"
+    clientid = CLIENTS[client_name]['id']
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     transformed_name = f"{client_name.lower()}_transformed_{timestamp}_{file_name}"
-    upload_to_blob(output_buffer, transformed_name, is_transformed=True)
-
-    file_data.seek(0)
     raw_name = f"{client_name.lower()}_{file_name}"
-    upload_to_blob(file_data, raw_name, is_transformed=False)
 
-    return controlno + 1
+    controlno = int(register_files([{
+        "clientid": clientid,
+        "filename": file_name,
+        "recordcount": 0,      # filled in by complete_registration once the stream is done
+        "file_hash": None,
+        "carrier": CARRIER_BY_CLIENTID.get(clientid),
+    }])[(clientid, file_name)])
+    hasher = hashlib.sha256()
+    injector = build_injector(controlno, clientid)
+    with BlockUploader(get_raw_container_client().get_blob_client(raw_name), **block_upload_options(raw_name)) as raw_uploader, \
+         BlockUploader(get_transformed_container_client().get_blob_client(transformed_name), **block_upload_options(transformed_name)) as transformed_uploader:
+        # Download, hash, transform and block staging are interleaved per chunk, so they are timed as one span
+        with span("stream") as s, sftp.open(remote_path, "rb") as remote_file:
+            remote_stat = remote_file.stat()
+            for chunk in iter_sftp_chunks(remote_file, remote_stat.st_size):
+                hasher.update(chunk)
+                raw_uploader.write(chunk)
+                transformed_uploader.write(injector.feed(chunk))
+                s.bytes += len(chunk)
+            transformed_uploader.write(injector.finish())
+            s.rows = injector.records
+
+        complete_registration(controlno, injector.records, hasher.hexdigest())
+        if hash_index is not None:
+            hash_index.add(clientid, hasher.hexdigest(), file_name, remote_stat.st_size, remote_stat.st_mtime)
+
+        for uploader, blob_name, kind in ((transformed_uploader, transformed_name, "transformed"), (raw_uploader, raw_name, "raw")):
+            with span("upload", container=kind) as s:
+                try:
+                    uploader.commit()
+                except ResourceExistsError:
+                    print(f"⚠️ Skipped duplicate blob: {blob_name}")
+                    continue
+                s.bytes = uploader.bytes_written
+                if uploader.content_settings is not None:
+                    s.fields["stored_bytes"] = uploader.bytes_staged
+            print(f"✅ Uploaded {kind}: {blob_name} ({uploader.bytes_written} bytes streamed)")
+        if inventory is not None:
+            inventory.add(raw_name)
 
-def handle_client(client_name, controlno):
+    return controlno
+
+# Pipeline workers run on their own threads, so every stage call re-binds the client its metrics belong to
+def _for_client(client_name, fn):
+    def call(*args):
+        with bind_client(client_name):
+            return fn(*args)
+    return call
+
+# Builds the per-client stage pipeline; each download call borrows its own pooled channel from the client's SFTP session
+def build_client_pipeline(session, client_name, inventory, hash_index=None, attrs=None):
+    attrs = attrs or {}
+    if STREAM_TRANSFER:
+        # Streaming already overlaps network reads and writes inside each file, so it runs as one stage
+        return Pipeline([
+            Stage("stream", _for_client(client_name, lambda file_name: process_file_streaming(session, client_name, file_name, inventory, hash_index)),
+                  workers=PER_CLIENT_CONCURRENCY, queue_size=PIPELINE_QUEUE_SIZE),
+        ])
+
+    # In process-pool mode the hash and transform threads only wait on workers, so there is one per process, and files
+    # are passed on in listing order so registration and upload order do not depend on which core won
+    pooled = CPU_POOL_WORKERS > 0
+    cpu_workers = max(TRANSFORM_WORKERS, CPU_POOL_WORKERS)
+    return Pipeline([
+        Stage("download", _for_client(client_name, lambda file_name: download_file(session, client_name, file_name, attrs.get(file_name))),
+              workers=PER_CLIENT_CONCURRENCY, queue_size=PIPELINE_QUEUE_SIZE, ordered=pooled),
+        Stage("hash", _for_client(client_name, lambda job: hash_file(job, hash_index)),
+              workers=cpu_workers, queue_size=PIPELINE_QUEUE_SIZE, ordered=pooled),
+        Stage("register", _for_client(client_name, register_jobs),
+              workers=1, queue_size=PIPELINE_QUEUE_SIZE, batch_size=REGISTER_BATCH_SIZE, linger=REGISTER_BATCH_LINGER_SECONDS),
+        Stage("transform", _for_client(client_name, transform_file),
+              workers=cpu_workers, queue_size=PIPELINE_QUEUE_SIZE, ordered=pooled),
+        *([Stage("gold", _for_client(client_name, load_gold), workers=GOLD_WORKERS, queue_size=PIPELINE_QUEUE_SIZE)] if FUSED_GOLD else []),
+        Stage("upload", _for_client(client_name, lambda job: upload_file(job, inventory)),
+              workers=UPLOAD_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+    ])
+
+# Filters the ready files of a listing down to the ones that need processing; skipped files are marked done
+def select_pending(client_name, ready, inventory, manifest, hash_index=None):
+    pending = []
+    clientid = CLIENTS[client_name]['id']
+    for attr in ready:
+        file_name = attr.filename
+        if file_name.startswith("transformed"):
+            manifest.mark_done(attr)
+            continue
+        blob_name = f"{client_name.lower()}_{file_name}"
+        if blob_name in inventory:
+            print(f"🔁 Already processed: {blob_name}")
+            manifest.mark_done(attr)
+            forget_file(client_name, file_name)
+            continue
+        # The same name with a size + mtime fingerprint we have hashed before is the file we already loaded. Another
+        # name with that fingerprint may still be different content, so it is downloaded and hash_file decides.
+        loaded_as = hash_index.match_fingerprint(clientid, attr.st_size, attr.st_mtime) if hash_index is not None else None
+        if loaded_as == file_name:
+            print(f"🧬 Skipped {file_name}: already loaded with the same size and mtime")
+            manifest.mark_done(attr)
+            forget_file(client_name, file_name)
+            continue
+        if loaded_as is not None:
+            print(f"🧬 {file_name} has the size and mtime of already loaded {loaded_as}; its hash decides if it is a copy")
+        pending.append(attr)
+    return pending
+
+def handle_client(client_name, hash_index=None):
+    with bind_client(client_name):
+        _handle_client(client_name, hash_index)
+
+def _handle_client(client_name, hash_index=None):
     print(f"\n🔄 Connecting to {client_name}...")
-    transport = paramiko.Transport((os.getenv("SFTP_HOST"), int(os.getenv("SFTP_PORT"))))
-    transport.connect(username=CLIENTS[client_name]['user'], password=CLIENTS[client_name]['pass'])
-    sftp = paramiko.SFTPClient.from_transport(transport)
+    # The session (and its authenticated transport) outlives this run, so the next poll skips the SSH handshake
+    session = get_session(os.getenv("SFTP_HOST"), int(os.getenv("SFTP_PORT")), CLIENTS[client_name]['user'], CLIENTS[client_name]['pass'])
+    manifest = get_manifest(client_name)
+
+    # One listdir_attr diffed against the manifest; a run with nothing new stops here
+    with span("list", source="sftp") as s:
+        attrs = {a.filename: a for a in session.listdir_attr("/upload")}
+        s.rows = len(attrs)
+    ready, deferred = manifest.diff(attrs.values())
+    for attr in deferred:
+        print(f"⏳ Deferred {attr.filename}: still being written ({attr.st_size} bytes so far)")
+    if not ready:
+        print(f"💤 No new or modified files for {client_name}")
+        manifest.save()
+        return
+
+    # One prefix-filtered listing replaces a HEAD request per file (none at all while a kept inventory is still fresh)
+    with span("list", source="blob") as s:
+        inventory = get_inventory(client_name).load()
+        s.rows = len(inventory)
 
     try:
-        files = sftp.listdir("/upload")
-        for file_name in files:
-            if file_name.startswith("transformed"):
-                continue
-            blob_name = f"{client_name.lower()}_{file_name}"
-            if not raw_container_client.get_blob_client(blob_name).exists():
-                controlno = process_file(sftp, client_name, file_name, controlno)
-            else:
-                print(f"🔁 Already processed: {blob_name}")
+        pending = [attr.filename for attr in select_pending(client_name, ready, inventory, manifest, hash_index)]
+        _, errors = build_client_pipeline(session, client_name, inventory, hash_index, attrs).run(pending)
+        failed = set()
+        for stage_name, item, e in errors:
+            file_name = item["file_name"] if isinstance(item, dict) else item
+            if isinstance(item, dict):
+                release_job(item)   # a job dropped mid-pipeline still holds its spools and shared-memory blocks
+            failed.add(file_name)
+            print(f"❌ {client_name} {stage_name} failed for {file_name}: {e}")
+        for file_name in pending:
+            if file_name not in failed:
+                manifest.mark_done(attrs[file_name])
+                forget_file(client_name, file_name)
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(pending)} files failed")
     finally:
-        sftp.close()
-        transport.close()
-
-    return controlno
+        inventory.save()
+        manifest.save()
+
+_inventories = {}
+_inventories_lock = threading.Lock()
+
+# One raw-container inventory per client for the life of the process, so a long-running daemon keeps it warm
+# between polls; blobs this process writes are added to it as they are uploaded
+def get_inventory(client_name):
+    with _inventories_lock:
+        if client_name not in _inventories:
+            _inventories[client_name] = BlobInventory(get_raw_container_client(), prefix=f"{client_name.lower()}_")
+        return _inventories[client_name]
+
+# Runs handle_client for every client at once; one slow or failing SFTP account no longer stalls the others
+def run_clients(client_names, hash_index=None):
+    started = time.monotonic()
+    failed = []
+    with ThreadPoolExecutor(max_workers=MAX_CLIENT_WORKERS) as executor:
+        futures = {executor.submit(handle_client, client_name, hash_index): client_name for client_name in client_names}
+        for future in as_completed(futures):
+            client_name = futures[future]
+            try:
+                future.result()
+                print(f"✅ {client_name} finished after {time.monotonic() - started:.1f}s")
+            except Exception as e:
+                failed.append(client_name)
+                print(f"❌ {client_name} failed: {e}")
+    return failed
 
 def wake_up_sql():
-    try:
-        print("🔌 Warming up SQL Server...")
-        conn = pyodbc.connect(
-            f"DRIVER={os.getenv('SQL_DRIVER')};"
-            f"SERVER={os.getenv('SQL_SERVER')};"
-            f"DATABASE={os.getenv('SQL_DATABASE')};"
-            f"UID={os.getenv('SQL_USERNAME')};"
-            f"PWD={os.getenv('SQL_PASSWORD')}"
-        )
-        cursor = conn.cursor()
-        cursor.execute("SELECT GETDATE();")
-        cursor.fetchone()
-        conn.close()
-        print("✅ SQL Server is awake. Proceeding...")
-    except Exception as e:
-        print(f"⚠️ Wake-up query failed: {e}")
-        print("⏳ Waiting 30 seconds before retrying...")
-        time.sleep(30)
-        conn = pyodbc.connect(
-            f"DRIVER={os.getenv('SQL_DRIVER')};"
-            f"SERVER={os.getenv('SQL_SERVER')};"
-            f"DATABASE={os.getenv('SQL_DATABASE')};"
-            f"UID={os.getenv('SQL_USERNAME')};"
-            f"PWD={os.getenv('SQL_PASSWORD')}"
-        )
-        cursor = conn.cursor()
-        cursor.execute("SELECT GETDATE();")
-        cursor.fetchone()
-        conn.close()
-        print("✅ SQL Server is now responsive.")
+    print("🔌 Warming up SQL Server...")
+    with span("sql_connect"):
+        get_pool().warm_up()   # retries with exponential backoff while a paused database resumes
+    print("✅ SQL Server is awake. Proceeding...")
+
+# One ingest pass over the given clients with state set up by the caller (main, or the daemon between polls);
+# returns the names of the clients that failed
+def run_cycle(client_names, hash_index=None):
+    if _journal is not None:
+        unfinished = _journal.unfinished(JOURNAL_KIND)
+        if unfinished:
+            print(f"🩹 Run journal: {len(unfinished)} files left unfinished by an earlier run will be resumed")
+    failed = run_clients(client_names, hash_index)
+    if hash_index is not None:
+        hash_index.save()
+    silver_writer.wait()
+    if failed:
+        print(f"\n⚠️ Finished with failed clients: {', '.join(failed)}")
+    else:
+        print("\n✅ All client files processed.")
+    return failed
 
 def main():
+    start_run("v6")
     wake_up_sql()
-    controlno = get_next_controlno_from_sql()
-    for client_name in CLIENTS:
-        controlno = handle_client(client_name, controlno)  ## This is for all clients and carriers, keep line 203 in for single client testing. 
-        ##controlno = handle_client("clientC", controlno)
-    print("\n✅ All client files processed.")
+    hash_index = HashIndex().load().preload_from_sql(get_pool())
+    run_cycle(list(CLIENTS), hash_index)  ## This is for all clients and carriers, swap in the line below for single client testing.
+    ##run_cycle(["clientC"], hash_index)
+    close_cpu_pool()
+    get_pool().close_all()
+    close_all_sessions()
+    get_metrics().finish()
 
 if __name__ == "__main__":
     main()
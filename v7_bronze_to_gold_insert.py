@@ -1,11 +1,23 @@
 
 
 import os
+import itertools
 import pandas as pd
 import pyodbc
 from dotenv import load_dotenv
 from azure.storage.blob import BlobServiceClient
 from io import BytesIO
+from contextlib import closing
+from sql_pool import get_pool
+from bulk_loader import BulkLoader, default_checkpoint
+from blob_watermark import BlobWatermark
+from carrier_schemas import usps_cols, ups_cols
+from gold_validation import coerce_gold_frame, gold_input_sizes
+from parquet_io import read_gold_frame
+from blob_download import RangedBlobReader, prefetch, LARGE_BLOB_THRESHOLD_BYTES, LARGE_BLOB_WINDOW_BYTES
+from blob_compression import blob_codec, decoding_stream, decoded_bytes
+from pipeline_metrics import span, bind_client, start_run, get_metrics
+from run_journal import get_journal
 
 load_dotenv()
 
@@ -20,17 +32,35 @@ SQL_USERNAME = os.getenv("SQL_USERNAME")
 SQL_PASSWORD = os.getenv("SQL_PASSWORD")
 SQL_DRIVER = os.getenv("SQL_DRIVER", "ODBC Driver 17 for SQL Server")
 
+# Incremental mode: set a watermark path to only load blobs newer than the last successful run
+WATERMARK_PATH = os.getenv("V7_WATERMARK_PATH")
+
+# Large-blob mode: CSV blobs over LARGE_BLOB_THRESHOLD_BYTES, and every gzip/zstd CSV blob, are downloaded, parsed and
+# inserted chunk by chunk.
+# With RUN_JOURNAL_PATH or BULK_CHECKPOINT_PATH set they commit per batch and resume; without, each is one transaction
+LARGE_BLOB_CSV_CHUNK_ROWS = int(os.getenv("LARGE_BLOB_CSV_CHUNK_ROWS", 100000))
+LARGE_BLOB_PARSE_AHEAD = int(os.getenv("LARGE_BLOB_PARSE_AHEAD", 2))   # parsed chunks waiting for the inserter
+
+# Rows failing schema validation are written to <V7_REJECT_PREFIX><blob name>/<part>.csv in the transformed container
+REJECT_PREFIX = os.getenv("V7_REJECT_PREFIX", "rejects/")
+
 # TABLE NAMES
 USPS_TABLE = "TestDB.dbo.usps_ebill_prod"
 UPS_TABLE = "TestDB.dbo.ups_ebill_prod"
 Control_master = "TestDB.dbo.Control_master"
 
-# CONNECT TO BLOB SERVICE
-blob_service_client = BlobServiceClient(
-    account_url=f"https://{ACCOUNT_NAME}.blob.core.windows.net",
-    credential=ACCOUNT_KEY
-)
-container_client = blob_service_client.get_container_client(TRANSFORMED_CONTAINER)
+# BLOB SERVICE: connected on first use, so importing v7 (the daemon, the fused v6 path) builds no clients
+blob_service_client = container_client = None
+
+def get_container_client():
+    global blob_service_client, container_client
+    if container_client is None:
+        blob_service_client = BlobServiceClient(
+            account_url=f"https://{ACCOUNT_NAME}.blob.core.windows.net",
+            credential=ACCOUNT_KEY
+        )
+        container_client = blob_service_client.get_container_client(TRANSFORMED_CONTAINER)
+    return container_client
 
 # SQL CONNECTION SETUP
 conn_str = (
@@ -40,29 +70,34 @@ conn_str = (
     f"UID={SQL_USERNAME};"
     f"PWD={SQL_PASSWORD}"
 )
-conn = pyodbc.connect(conn_str)
-cursor = conn.cursor()
-cursor.fast_executemany = True
-
-# USPS expected columns (lowercase)
-usps_cols = [
-    "controlno", "childid", "trackingnumber", "invoicenumber", "invoicedate", "shipdate",
-    "length", "height", "width", "dimuom", "servicelevel", "shippernumber",
-    "originzip", "destinationzip", "zone", "billedweight_lb", "weightunit",
-    "packagecharge", "fuelsurcharge", "residentialsurcharge", "dascharge", "totalcharge",
-    "accessorialcode", "accessorialdescription", "packagestatus", "receivername",
-    "receivercity", "receiverstate", "receivercountry"
-]
-
-# UPS expected columns (match ups_ebill_prod)
-ups_cols = [
-    "Lead Shipment Number", "ControlNo", "ChildID", "BillToAccountNo", "InvoiceDt", "Bill Option Code",
-    "Container Type", "Transaction Date", "Package Quantity", "Sender Country", "Receiver Country",
-    "Charge Category Code", "Charge Classification Code", "Charge Category Detail Code",
-    "Charge Description", "Zone", "Billed Weight", "Billed Weight Unit of Measure",
-    "Billed Weight Type", "Net Amount", "Incentive Amount", "Tracking Number",
-    "Sender State", "Receiver State", "Invoice Currency Code"
-]
+sql_pool = get_pool(conn_str)
+conn = cursor = bulk_loader = None
+
+# Opens v7's connection on first use, so the fused v6 path can import the gold loaders without touching SQL
+def connect_sql():
+    global conn, cursor, bulk_loader
+    if conn is None:
+        sql_pool.warm_up()
+        conn = sql_pool.acquire()
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        bulk_loader = BulkLoader(conn, checkpoint=default_checkpoint())
+    return bulk_loader
+
+# Hands v7's connection back to the pool (or, broken=True, closes it); the next connect_sql() borrows a
+# health-checked one again
+def release_sql(broken=False):
+    global conn, cursor, bulk_loader
+    if conn is not None:
+        try:
+            cursor.close()
+        except pyodbc.Error:
+            broken = True
+        sql_pool.release(conn, broken=broken)
+        conn = cursor = bulk_loader = None
+
+# Silver blobs the fused v6 path has already loaded into gold carry this metadata key; v7 skips them
+GOLD_LOADED_METADATA = "gold_loaded"
 
 # USPS insert SQL
 insert_usps_sql = f"""
@@ -88,74 +123,246 @@ insert_ups_sql = f"""
     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 """
 
-def process_usps_blob(df, blob_name):
+def usps_frame(df):
     df.columns = df.columns.str.lower()
     df = df.drop(columns=["createddate"], errors="ignore")
 
     if not all(col in df.columns for col in usps_cols):
         missing = [col for col in usps_cols if col not in df.columns]
         raise ValueError(f"Missing USPS columns: {missing}")
+    return df
 
-    df = df[usps_cols]
-    cursor.executemany(insert_usps_sql, df.values.tolist())
-    conn.commit()
-    print(f"✅ Inserted {len(df)} rows into usps_ebill_prod from {blob_name}")
-
-def process_ups_blob(df, blob_name):
+def ups_frame(df):
     if not all(col in df.columns for col in ups_cols):
         missing = [col for col in ups_cols if col not in df.columns]
         raise ValueError(f"Missing UPS columns: {missing}")
+    return df
+
+# Uploads rejected rows (original values + reject_reason) next to the silver data for someone to fix and re-drop
+def quarantine_rows(rejects, blob_name, part=0):
+    reject_name = f"{REJECT_PREFIX}{blob_name}/{part:05d}.csv"
+    with span("quarantine", source=blob_name) as s:
+        data = rejects.to_csv(index=False).encode("utf-8")
+        get_container_client().get_blob_client(reject_name).upload_blob(data, overwrite=True)
+        s.rows, s.bytes = len(rejects), len(data)
+    print(f"🚫 Quarantined {len(rejects)} rows of {blob_name} to {reject_name}")
+
+# Types every gold column per the schema registry; bad rows are quarantined and the rest returned for insert
+def validated(df, carrier, blob_name, part=0):
+    with span("validate", source=blob_name) as s:
+        clean, rejects = coerce_gold_frame(df, carrier)
+        s.rows = len(df)
+    if len(rejects):
+        quarantine_rows(rejects, blob_name, part)
+    return clean
+
+# Declared SQL types per insert parameter, for the typed bulk path
+GOLD_INPUT_SIZES = {carrier: gold_input_sizes(carrier) for carrier in ("USPS", "UPS")}
+
+# Rows of one file already in a gold table (every row of a file shares its ControlNo and ChildID)
+def count_gold_rows(conn, table, controlno, childid):
+    with closing(conn.cursor()) as count_cursor:
+        count_cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE ControlNo = ? AND ChildID = ?", (controlno, childid))
+        return count_cursor.fetchone()[0]
+
+# count_gold_rows for the file a DataFrame came from; the bulk loader uses it to settle a batch a crashed run left in doubt
+def gold_row_counter(table, controlno_col, childid_col):
+    def count_loaded(conn, df):
+        if not len(df):
+            return 0
+        return count_gold_rows(conn, table, df[controlno_col].iloc[:1].tolist()[0], df[childid_col].iloc[:1].tolist()[0])
+    return count_loaded
+
+GOLD_TABLES = {"USPS": USPS_TABLE, "UPS": UPS_TABLE}
+
+GOLD_ROW_COUNTERS = {
+    "USPS": gold_row_counter(USPS_TABLE, "controlno", "childid"),
+    "UPS": gold_row_counter(UPS_TABLE, "ControlNo", "ChildID"),
+}
+
+def process_usps_blob(df, blob_name, loader=None):
+    df = validated(usps_frame(df), "USPS", blob_name)
+    inserted = (loader or connect_sql()).load(df, insert_usps_sql, usps_cols, blob_name, GOLD_INPUT_SIZES["USPS"], GOLD_ROW_COUNTERS["USPS"])
+    print(f"✅ Inserted {inserted} rows into usps_ebill_prod from {blob_name}")
 
-    df = df[ups_cols]
-    cursor.executemany(insert_ups_sql, df.values.tolist())
-    conn.commit()
-    print(f"✅ Inserted {len(df)} rows into ups_ebill_prod from {blob_name}")
+def process_ups_blob(df, blob_name, loader=None):
+    df = validated(ups_frame(df), "UPS", blob_name)
+    inserted = (loader or connect_sql()).load(df, insert_ups_sql, ups_cols, blob_name, GOLD_INPUT_SIZES["UPS"], GOLD_ROW_COUNTERS["UPS"])
+    print(f"✅ Inserted {inserted} rows into ups_ebill_prod from {blob_name}")
 
-def process_transformed_blob(blob):
+# carrier -> (frame check, insert SQL, columns, table) for the chunked path
+GOLD_TARGETS = {
+    "USPS": (usps_frame, insert_usps_sql, usps_cols, "usps_ebill_prod"),
+    "UPS": (ups_frame, insert_ups_sql, ups_cols, "ups_ebill_prod"),
+}
+
+def gold_frame(df):
+    df.columns = df.columns.str.strip()
+    return df.rename(columns={"clientid": "ChildID", "controlno": "ControlNo"})
+
+# Loads one silver DataFrame into its carrier's gold table; shared by the blob loop and the fused v6 path
+def load_gold_frame(df, blob_name, loader=None):
+    df = gold_frame(df)
+    carrier = df.get("carrier", [None])[0]
+
+    if carrier == "USPS":
+        process_usps_blob(df, blob_name, loader)
+    elif carrier == "UPS":
+        process_ups_blob(df, blob_name, loader)
+    else:
+        print(f"⚠️ Skipped {blob_name}: unknown carrier type '{carrier}'")
+
+# read_csv chunks of a large blob, each renamed like a whole-file DataFrame and timed as its own parse span
+def parsed_chunks(stream):
+    reader = pd.read_csv(stream, chunksize=LARGE_BLOB_CSV_CHUNK_ROWS, dtype=str)
+    while True:
+        with span("parse", format="csv", chunked=True) as s:
+            df = next(reader, None)
+            if df is None:
+                return
+            s.rows = len(df)
+        yield gold_frame(df)
+
+# A compressed blob's stored size says nothing about how large it decodes to, so compressed CSVs always take the
+# chunked path; uncompressed ones once they reach the threshold
+def is_large_csv(blob):
     if not blob.name.endswith(".csv"):
-        return
+        return False
+    return blob_codec(blob) is not None or (blob.size or 0) >= LARGE_BLOB_THRESHOLD_BYTES
+
+# Large CSV blobs: ranged downloads feed a chunked parser that runs ahead of the inserts, so memory stays bounded.
+# Compressed blobs are decoded as a stream between the two. A mid-stream failure either resumes from the checkpoint
+# or, with none configured, rolls the whole blob back, so the retry never duplicates rows.
+def load_large_csv_blob(blob_client, blob):
+    codec = blob_codec(blob)
+    print(f"🧩 Chunked load of {blob.name} ({blob.size / (1024 * 1024):.0f} MB{f' {codec}' if codec else ''})")
+    loader = connect_sql()
+    if loader.checkpoint is None:
+        print(f"🔒 No checkpoint configured: {blob.name} is loaded as a single transaction")
+    with RangedBlobReader(blob_client, blob.size) as raw:
+        stream = decoding_stream(raw, codec, LARGE_BLOB_WINDOW_BYTES)
+        with closing(prefetch(parsed_chunks(stream), LARGE_BLOB_PARSE_AHEAD)) as frames:
+            first = next(frames, None)
+            if first is None:
+                return
+            carrier = first.get("carrier", pd.Series([None])).iloc[0] if len(first) else None
+            if carrier not in GOLD_TARGETS:
+                print(f"⚠️ Skipped {blob.name}: unknown carrier type '{carrier}'")
+                return
+            check, insert_sql, columns, table = GOLD_TARGETS[carrier]
+            chunks = (validated(check(df), carrier, blob.name, part) for part, df in enumerate(itertools.chain([first], frames)))
+            inserted = loader.load_chunks(chunks, insert_sql, columns, blob.name, GOLD_INPUT_SIZES[carrier], GOLD_ROW_COUNTERS[carrier])
+    print(f"✅ Inserted {inserted} rows into {table} from {blob.name}")
+
+# Every FileName in Control_master in one query, so the per-blob "already processed" check is a set lookup
+def load_processed_filenames():
+    cursor.execute(f"SELECT FileName FROM {Control_master}")
+    return {row[0] for row in cursor.fetchall()}
+
+# A unique-key violation: the rows are already in gold, so the load counts as done
+def is_duplicate_error(e):
+    error_msg = str(e).lower()
+    return "duplicate" in error_msg or "unique" in error_msg
+
+# Returns False when the blob failed and should be retried on the next run
+def process_transformed_blob(blob, processed_filenames=None):
+    # Transformed blobs are named <client>_transformed_..., so the prefix attributes the metrics to the client
+    with bind_client(blob.name.split("_", 1)[0]):
+        return _process_transformed_blob(blob, processed_filenames)
+
+def _process_transformed_blob(blob, processed_filenames=None):
+    if not blob.name.endswith((".csv", ".parquet")) or blob.name.startswith(REJECT_PREFIX):
+        return True
+    if (getattr(blob, "metadata", None) or {}).get(GOLD_LOADED_METADATA) == "true":
+        print(f"⚡ Skipped {blob.name}: already loaded into gold by the fused v6 path.")
+        return True
+    journal = get_journal()
+    if journal is not None and journal.gold_loaded(blob.name):
+        print(f"⚡ Skipped {blob.name}: run journal records it as loaded into gold.")
+        return True
 
     # Check if already processed
-    cursor.execute(f"SELECT 1 FROM {Control_master} WHERE FileName = ?", (blob.name,))
-    if cursor.fetchone():
+    if processed_filenames is not None:
+        already_processed = blob.name in processed_filenames
+    else:
+        connect_sql()
+        cursor.execute(f"SELECT 1 FROM {Control_master} WHERE FileName = ?", (blob.name,))
+        already_processed = cursor.fetchone() is not None
+    if already_processed:
         print(f"⚠️ Skipped {blob.name}: already processed.")
-        return
+        return True
 
     print(f"\n📥 Processing file: {blob.name}")
-    blob_client = container_client.get_blob_client(blob.name)
+    blob_client = get_container_client().get_blob_client(blob.name)
 
     try:
-        blob_data = blob_client.download_blob().readall()
-        df = pd.read_csv(BytesIO(blob_data))
+        if is_large_csv(blob):
+            load_large_csv_blob(blob_client, blob)
+            return True
 
-        df.columns = df.columns.str.strip()
-        df = df.rename(columns={"clientid": "ChildID", "controlno": "ControlNo"})
-        carrier = df.get("carrier", [None])[0]
-
-        if carrier == "USPS":
-            process_usps_blob(df, blob.name)
-        elif carrier == "UPS":
-            process_ups_blob(df, blob.name)
-        else:
-            print(f"⚠️ Skipped {blob.name}: unknown carrier type '{carrier}'")
-            return
+        # Stored bytes as-is (decompress=False); gzip/zstd blobs are decoded here, as a stream for CSV
+        with span("download") as s:
+            blob_data = blob_client.download_blob(decompress=False).readall()
+            s.bytes = len(blob_data)
+        with span("parse", format="parquet" if blob.name.endswith(".parquet") else "csv") as s:
+            if blob.name.endswith(".parquet"):
+                df = read_gold_frame(decoded_bytes(blob_data, blob_codec(blob)))   # typed columns, only the ones the gold tables need
+            else:
+                df = pd.read_csv(decoding_stream(BytesIO(blob_data), blob_codec(blob)), dtype=str)   # typed by the schema registry, not inferred
+            s.bytes, s.rows = len(blob_data), len(df)
 
+        load_gold_frame(df, blob.name)
 
     except pyodbc.IntegrityError as e:
-        error_msg = str(e)
-        if "duplicate" in error_msg.lower() or "unique" in error_msg.lower():
+        if is_duplicate_error(e):
             print(f"⚠️ Skipped {blob.name}: Duplicate record.")
-        else:
-            print(f"❌ Integrity error in {blob.name}: {error_msg.splitlines()[0]}")
+            return True
+        print(f"❌ Integrity error in {blob.name}: {str(e).splitlines()[0]}")
+        return False
 
     except Exception as e:
         print(f"❌ General error in {blob.name}: {str(e).splitlines()[0]}")
+        return False
+
+    return True
+
+
+# One load pass over the transformed container; the daemon keeps the watermark between passes.
+# The connection always goes back to the pool, and is dropped rather than reused when the pass failed
+def run_cycle(watermark=None):
+    connect_sql()
+    failed = True
+    try:
+        with span("list", source="control_master") as s:
+            processed_filenames = load_processed_filenames()
+            s.rows = len(processed_filenames)
+        with span("list", source="blob") as s:
+            blobs = list(get_container_client().list_blobs(include=["metadata"]))
+            s.rows = len(blobs)
+
+        if watermark:
+            watermark.begin_pass()
+            blobs = watermark.new_blobs(blobs)
+            print(f"🔖 Incremental mode: {len(blobs)} blobs newer than {watermark.last_modified or 'the beginning'}")
 
+        for blob in blobs:
+            ok = process_transformed_blob(blob, processed_filenames)
+            if watermark:
+                if ok:
+                    watermark.mark_done(blob)
+                else:
+                    watermark.mark_failed(blob)
+        failed = False
+    finally:
+        release_sql(broken=failed)
+    print("\n🏁 All files have been processed.")
 
 # MAIN EXECUTION
-for blob in container_client.list_blobs():
-    process_transformed_blob(blob)
+def main():
+    start_run("v7")
+    run_cycle(BlobWatermark(WATERMARK_PATH) if WATERMARK_PATH else None)
+    sql_pool.close_all()
+    get_metrics().finish()
 
-cursor.close()
-conn.close()
-print("\n🏁 All files have been processed.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()